@@ -4,15 +4,67 @@ import numpy as np
 
 
 # ARM PARAMETERS
+ACTION_MAGNITUDES = [1]  # joint steps per action, in multiples of the angular velocity; e.g. [1, 5]: eight actions
 ANGULAR_ARM_VELOCITY = 1.0 / 180.0 * np.pi
 ARM_LENGTH_1 = 2.0
 ARM_LENGTH_2 = 3.0
+COMBINED_ACTIONS = False  # True: both joints -/0/+ per action, i.e. all 3*3=9 combinations per magnitude
 SCENARIOS = [(0, 0), (0, 30), (35, 45), (0, 150)]
-# TODO: extend actions to all combinations, i.e. instead of 4 actions, all 3*3=9 actions (if too much time)
+
+
+def make_actions(magnitudes=ACTION_MAGNITUDES, combined=COMBINED_ACTIONS):
+    # action table: (steps of joint 1, steps of joint 2) per action; [1] gives the original actions 0-3,
+    # which keep their indices when combined actions (diagonals, then one shared no-op) are added
+    actions = []
+    for magnitude in magnitudes:
+        actions.extend([(-magnitude, 0), (magnitude, 0), (0, -magnitude), (0, magnitude)])
+        if combined:
+            actions.extend([(-magnitude, -magnitude), (-magnitude, magnitude), (magnitude, -magnitude), (magnitude, magnitude)])
+    if combined:
+        actions.append((0, 0))
+    return actions
+
+
+def get_states(theta, goal_pos, arm_length_1=ARM_LENGTH_1, arm_length_2=ARM_LENGTH_2):
+    # vectorized Arm.get_state (+ Goal_Arm.get_state) for (N, 2) joint angles and one goal position
+    reach = arm_length_1 + arm_length_2
+    states = np.empty((len(theta), 6), dtype=np.float32)
+    states[:, 0] = (arm_length_1 * np.cos(theta[:, 0]) + arm_length_2 * np.cos(theta[:, 0] + theta[:, 1])) / reach
+    states[:, 1] = (arm_length_1 * np.sin(theta[:, 0]) + arm_length_2 * np.sin(theta[:, 0] + theta[:, 1])) / reach
+    states[:, 2:4] = (theta - np.pi) / np.pi
+    states[:, 4:6] = np.asarray(goal_pos) / reach
+    return states
+
+
+def simulate_actions(states, actions, angular_velocity_1=ANGULAR_ARM_VELOCITY, angular_velocity_2=ANGULAR_ARM_VELOCITY,
+                     arm_length_1=ARM_LENGTH_1, arm_length_2=ARM_LENGTH_2, goal_threshold=0.02, repeat=1):
+    # vectorized Arm.set_action + Arm.update of every action from every (N, 6) state, held for repeat substeps
+    # and stopped at the goal like Actor.take_action; returns summed rewards (N, A), next states (N, A, 6)
+    # and terminals (N, A)
+    reach = arm_length_1 + arm_length_2
+    moves = np.asarray(actions, dtype=np.float64) * np.array([angular_velocity_1, angular_velocity_2])
+    goal = states[:, None, 4:6].astype(np.float64)
+    theta = np.repeat((states[:, None, 2:4].astype(np.float64) + 1.0) * np.pi, len(moves), axis=1)
+    rewards = np.zeros(theta.shape[:2])
+    terminals = np.zeros(theta.shape[:2], dtype=bool)
+    for _ in range(repeat):
+        theta = np.where(terminals[:, :, None], theta, (theta + moves) % (2.0 * np.pi))
+        pos = np.stack((arm_length_1 * np.cos(theta[:, :, 0]) + arm_length_2 * np.cos(theta[:, :, 0] + theta[:, :, 1]),
+                        arm_length_1 * np.sin(theta[:, :, 0]) + arm_length_2 * np.sin(theta[:, :, 0] + theta[:, :, 1])), axis=2) / reach
+        distances = np.sqrt(np.sum((pos - goal)**2, axis=2))
+        rewards -= np.where(terminals, 0.0, distances)
+        terminals |= distances < goal_threshold
+
+    next_states = np.empty(theta.shape[:2] + (6,), dtype=np.float32)
+    next_states[:, :, 0:2] = pos
+    next_states[:, :, 2:4] = (theta - np.pi) / np.pi
+    next_states[:, :, 4:6] = goal
+    return rewards.astype(np.float32), next_states, terminals.astype(np.float32)
 
 
 class Arm:
-    def __init__(self, scene_id, angular_velocity_1=ANGULAR_ARM_VELOCITY, angular_velocity_2=ANGULAR_ARM_VELOCITY, arm_length_1=ARM_LENGTH_1, arm_length_2=ARM_LENGTH_2):
+    def __init__(self, scene_id, angular_velocity_1=ANGULAR_ARM_VELOCITY, angular_velocity_2=ANGULAR_ARM_VELOCITY, arm_length_1=ARM_LENGTH_1, arm_length_2=ARM_LENGTH_2, actions=None):
+        self.ACTIONS = np.array(make_actions() if actions is None else actions, dtype=np.float64)
         self.base_pos = np.array([0.0, 0.0], dtype=np.float32)
         self.ctrl = np.array([0.0, 0.0])
         self.theta = np.pi * np.array([SCENARIOS[scene_id][0], SCENARIOS[scene_id][1]], dtype=np.float32) / 180  # [2.0*np.pi*np.random.randint(0,359)/360.0, 2.0*np.pi*np.random.randint(0,359)/360.0])
@@ -45,6 +97,18 @@ class Arm:
         u = np.dot(np.linalg.inv(J), distance)
         return u
 
+    def get_guided_action(self, distance, repeat=1):
+        # action whose joint motion (held for repeat substeps) is closest to the inverse kinematics control, scaled
+        # down (direction kept) to the largest moves: u is the whole remaining joint error, far larger than one move,
+        # so matching it unscaled prefers the largest moves regardless of direction. Never the no-op (it could stall
+        # short of the goal); raises numpy.linalg.LinAlgError at singularities, like get_control
+        u = self.get_control(distance)
+        moves = repeat * self.ACTIONS * np.array([self.ANGULAR_VELOCITY_1, self.ANGULAR_VELOCITY_2])
+        u = u / max(1.0, np.max(np.abs(u) / np.max(np.abs(moves), axis=0)))
+        errors = np.sum((moves - u) ** 2, axis=1)
+        errors[np.all(self.ACTIONS == 0, axis=1)] = np.inf
+        return int(np.argmin(errors))
+
     def get_position(self):
         normalized_pos = self.pos / (self.ARM_LENGTH_1 + self.ARM_LENGTH_2)
         return np.hstack(normalized_pos)
@@ -90,15 +154,8 @@ class Arm:
                          'b', linewidth=linewidth / 2)
 
     def set_action(self, action):
-        self.ctrl = np.array([0.0, 0.0])  # reset control
-        if action == 0:
-            self.ctrl[0] = -self.ANGULAR_VELOCITY_1
-        elif action == 1:
-            self.ctrl[0] = self.ANGULAR_VELOCITY_1
-        elif action == 2:
-            self.ctrl[1] = -self.ANGULAR_VELOCITY_2
-        elif action == 3:
-            self.ctrl[1] = self.ANGULAR_VELOCITY_2
+        # control from the action table; action 0/1: joint 1 -/+, 2/3: joint 2 -/+ (then combinations, larger magnitudes)
+        self.ctrl = self.ACTIONS[action] * np.array([self.ANGULAR_VELOCITY_1, self.ANGULAR_VELOCITY_2])
 
     def update(self):
         # update (angular) velocities
@@ -0,0 +1,318 @@
+#!/usr/bin/python
+import argparse
+import multiprocessing
+import numpy as np
+import threading
+import time
+
+# import own modules
+import numpy_networks
+import q_networks
+import replay_memory
+import replay_ratio
+
+
+BATCH_SIZE = 64                 # minibatch per worker; effective batch is NUM_OF_WORKERS*BATCH_SIZE
+GAMMA = 0.5
+NUM_OF_ACTIONS = 4
+NUM_OF_STATES = 6
+NUM_OF_WORKERS = 4
+STEPS_TO_SAVE_MODEL = 100
+WORKER_TIMEOUT = 1.0            # seconds between liveness checks of the workers while waiting for them
+
+
+def get_weight_shapes(num_of_states, num_of_actions, num_of_hidden_neurons=q_networks.NUM_OF_HIDDEN_NEURONS, num_of_hidden_layers=q_networks.NUM_OF_HIDDEN_LAYERS):
+    # shapes of QNetworks.get_weights(), without building a Keras model
+    sizes = [num_of_states] + [num_of_hidden_neurons]*num_of_hidden_layers + [num_of_actions]
+    shapes = []
+    for i in range(len(sizes) - 1):
+        shapes.extend([(sizes[i], sizes[i + 1]), (sizes[i + 1],)])
+    return shapes
+
+
+def make_gradient_function(model, num_of_actions):
+    # d MSE(model(states), targets) / d weights, in get_weights() order
+    if isinstance(model, numpy_networks.NumpyMLP):
+        def compute_gradients(states, targets):
+            model.compute_gradients(states, targets)
+            return model.gradients
+        return compute_gradients
+
+    from keras import backend as K
+    targets = K.placeholder(shape=(None, num_of_actions))
+    loss = K.mean(K.square(model.output - targets))
+    gradients = K.gradients(loss, model.trainable_weights)
+    function = K.function([model.input, targets], gradients)
+    return lambda states, targets: function([states, targets])
+
+
+class FlatRMSprop:
+    # numpy_networks' RMSprop on one flat parameter vector, updated in place
+    def __init__(self, num_of_params, lr=numpy_networks.LEARNING_RATE, rho=numpy_networks.RHO, epsilon=numpy_networks.RMS_EPSILON):
+        self.LR = lr
+        self.RHO = rho
+        self.EPSILON = epsilon
+        self.mean_square = np.zeros(num_of_params, dtype=np.float32)
+        self.buffer = np.zeros(num_of_params, dtype=np.float32)
+
+    def get_state(self):
+        return [np.copy(self.mean_square)]
+
+    def set_state(self, state):
+        self.mean_square[:] = state[0]
+
+    def apply(self, weights, gradients):
+        numpy_networks.rmsprop_update([weights], [gradients], [self.mean_square], [self.buffer], self.LR, self.RHO, self.EPSILON)
+
+
+class GradientWorkerPool:
+    # K processes computing gradients on their own minibatch; results are averaged by a shared-memory allreduce.
+    # NOTE: with the Keras backend, create the pool before any model exists in the parent process (workers are forked)
+    def __init__(self, num_of_workers=NUM_OF_WORKERS, batch_size=BATCH_SIZE, num_of_states=NUM_OF_STATES, num_of_actions=NUM_OF_ACTIONS, num_of_hidden_neurons=q_networks.NUM_OF_HIDDEN_NEURONS,
+                 num_of_hidden_layers=q_networks.NUM_OF_HIDDEN_LAYERS, backend=q_networks.BACKEND):
+        self.NUM_OF_WORKERS = num_of_workers
+        self.BATCH_SIZE = batch_size
+        self.NUM_OF_STATES = num_of_states
+        self.NUM_OF_ACTIONS = num_of_actions
+        self.NUM_OF_HIDDEN_NEURONS = num_of_hidden_neurons
+        self.NUM_OF_HIDDEN_LAYERS = num_of_hidden_layers
+        self.BACKEND = backend
+
+        self.shapes = get_weight_shapes(num_of_states, num_of_actions, num_of_hidden_neurons, num_of_hidden_layers)
+        self.sizes = [int(np.prod(shape)) for shape in self.shapes]
+        self.num_of_params = sum(self.sizes)
+
+        # shared memory: weights, one gradient slot per worker, averaged gradients, per-worker minibatches
+        self.weights = self.shared_array((self.num_of_params,))
+        self.gradients = self.shared_array((num_of_workers, self.num_of_params))
+        self.mean_gradients = self.shared_array((self.num_of_params,))
+        self.states = self.shared_array((num_of_workers, batch_size, num_of_states))
+        self.targets = self.shared_array((num_of_workers, batch_size, num_of_actions))
+
+        # two phases per step: compute gradients, then reduce one slice of the parameter vector each
+        self.compute_phase = [multiprocessing.Semaphore(0) for _ in range(num_of_workers)]
+        self.reduce_phase = [multiprocessing.Semaphore(0) for _ in range(num_of_workers)]
+        self.done = multiprocessing.Semaphore(0)
+
+        self.workers = [multiprocessing.Process(target=gradient_worker, args=(i, self)) for i in range(num_of_workers)]
+        for worker in self.workers:
+            worker.daemon = True
+            worker.start()
+
+    @staticmethod
+    def shared_array(shape):
+        raw = multiprocessing.RawArray('f', int(np.prod(shape)))
+        return np.frombuffer(raw, dtype=np.float32).reshape(shape)
+
+    def get_slice(self, worker_id):
+        # part of the parameter vector this worker reduces
+        bounds = np.linspace(0, self.num_of_params, self.NUM_OF_WORKERS + 1).astype(int)
+        return slice(bounds[worker_id], bounds[worker_id + 1])
+
+    def flatten(self, weights):
+        return np.concatenate([np.ravel(w) for w in weights]).astype(np.float32)
+
+    def unflatten(self, flat):
+        weights = []
+        offset = 0
+        for shape, size in zip(self.shapes, self.sizes):
+            weights.append(np.array(flat[offset:offset + size]).reshape(shape))
+            offset += size
+        return weights
+
+    def wait_for_workers(self):
+        # one done per worker and phase; a dead worker would never signal it
+        for _ in range(self.NUM_OF_WORKERS):
+            while not self.done.acquire(True, WORKER_TIMEOUT):
+                dead = [worker.pid for worker in self.workers if not worker.is_alive()]
+                if len(dead) > 0:
+                    raise RuntimeError('gradient worker process(es) %s died' % dead)
+
+    def compute_mean_gradients(self):
+        # expects self.weights, self.states and self.targets to be filled
+        for semaphore in self.compute_phase:
+            semaphore.release()
+        self.wait_for_workers()
+        for semaphore in self.reduce_phase:
+            semaphore.release()
+        self.wait_for_workers()
+        return self.mean_gradients
+
+    def close(self):
+        for worker in self.workers:
+            worker.terminate()
+
+
+def gradient_worker(worker_id, pool):
+    # bare model, nothing loaded from disk: the weights arrive through pool.weights before every step
+    model = q_networks.build_model(pool.NUM_OF_STATES, pool.NUM_OF_ACTIONS, pool.NUM_OF_HIDDEN_NEURONS, pool.NUM_OF_HIDDEN_LAYERS, pool.BACKEND)
+    compute_gradients = make_gradient_function(model, pool.NUM_OF_ACTIONS)
+    share = pool.get_slice(worker_id)
+
+    while True:
+        # phase 1: gradients of the current weights on this worker's minibatch
+        pool.compute_phase[worker_id].acquire()
+        model.set_weights(pool.unflatten(pool.weights))
+        gradients = compute_gradients(pool.states[worker_id], pool.targets[worker_id])
+        pool.gradients[worker_id] = pool.flatten(gradients)
+        pool.done.release()
+
+        # phase 2: reduce-scatter; every worker averages its slice over all workers
+        pool.reduce_phase[worker_id].acquire()
+        np.mean(pool.gradients[:, share], axis=0, out=pool.mean_gradients[share])
+        pool.done.release()
+
+
+class DataParallelLearner(threading.Thread):
+    # replaces the Learner threads: one synchronous update on NUM_OF_WORKERS minibatches at a time
+    def __init__(self, pool, networks, networks_lock, prefetcher, scheduler, console_lock, gamma=GAMMA, target_function=None,
+                 checkpoint_function=None):
+        threading.Thread.__init__(self, name='learner-0')
+        self.pool = pool
+        self.networks = networks
+        self.networks_lock = networks_lock
+        self.prefetcher = prefetcher
+        self.scheduler = scheduler
+        self.console_lock = console_lock
+        self.GAMMA = gamma
+        self.target_function = target_function  # states, gamma -> targets of all outputs (e.g. all-action backups)
+        self.checkpoint_function = checkpoint_function  # optimizer state -> replay report; commits replay memory + training state snapshot
+        self.error = None                               # set if the learner stopped because a worker died
+
+        weights = pool.flatten(networks.online_net.get_weights())
+        if len(weights) != pool.num_of_params:
+            raise ValueError('networks have %d parameters, the gradient workers %d' % (len(weights), pool.num_of_params))
+        self.optimizer = FlatRMSprop(pool.num_of_params)
+        self.pool.weights[:] = weights
+
+    def step(self):
+        batches = [self.prefetcher.get() for _ in range(self.pool.NUM_OF_WORKERS)]
+        states = np.concatenate([batch[0] for batch in batches])
+        actions = np.concatenate([batch[1] for batch in batches])
+        rewards = np.concatenate([batch[2] for batch in batches])
+        next_states = np.concatenate([batch[3] for batch in batches])
+        terminals = np.concatenate([batch[4] for batch in batches])
+        horizons = np.concatenate([batch[5] for batch in batches])
+
+        if self.target_function is not None:
+            targets = self.target_function(states, self.GAMMA)
+        else:
+            # targets of all minibatches in one fused forward pass
+            self.networks_lock.acquire()
+            Q, newQ = self.networks.predict_pair(states, next_states)
+            self.networks_lock.release()
+            targets = np.copy(Q)
+            targets[np.arange(len(actions)), actions] = rewards + (1.0 - terminals) * (self.GAMMA**horizons * np.max(newQ, axis=1))
+
+        self.pool.states[:] = states.reshape(self.pool.states.shape)
+        self.pool.targets[:] = targets.reshape(self.pool.targets.shape)
+        self.optimizer.apply(self.pool.weights, self.pool.compute_mean_gradients())
+
+        self.networks_lock.acquire()
+        self.networks.online_net.set_weights(self.pool.unflatten(self.pool.weights))
+        self.networks.do_soft_update()
+        self.networks_lock.release()
+
+    def run(self):
+        try:
+            self.learn()
+        except RuntimeError as error:
+            # release the actors, so the run ends (with this error) instead of waiting for updates forever
+            self.error = error
+            self.scheduler.stop()
+            raise
+
+    def learn(self):
+        if not self.scheduler.wait_for_samples():
+            return
+
+        while True:
+            for _ in range(STEPS_TO_SAVE_MODEL):
+                # one synchronous update consumes NUM_OF_WORKERS minibatches
+                for _ in range(self.pool.NUM_OF_WORKERS):
+                    if not self.scheduler.wait_for_update():
+                        return
+                self.step()
+
+            self.networks_lock.acquire()
+            self.networks.save_models()
+            self.networks_lock.release()
+
+            if self.checkpoint_function is not None:
+                replay_report = self.checkpoint_function(self.optimizer.get_state())
+            else:
+                self.prefetcher.replay_lock.acquire()
+                self.prefetcher.replay.commit(self.scheduler.num_of_updates)
+                replay_report = self.prefetcher.replay.get_report()
+                self.prefetcher.replay_lock.release()
+
+            self.console_lock.acquire()
+            print(self.scheduler.get_report())
+            print(replay_report)
+            self.console_lock.release()
+
+
+def fill_random_replay(replay, num_of_samples, num_of_states=NUM_OF_STATES, num_of_actions=NUM_OF_ACTIONS):
+    # synthetic transitions for benchmarking only
+    for _ in range(num_of_samples):
+        replay.add_sample([np.random.uniform(-1, 1, num_of_states), np.random.randint(num_of_actions),
+                           -np.random.uniform(), np.random.uniform(-1, 1, num_of_states), 0.0])
+
+
+def benchmark_threaded(networks, networks_lock, prefetcher, num_of_learners, seconds, gamma=GAMMA):
+    # critical path of deep_q_learning.Learner.run, in num_of_learners threads sharing one network
+    counter = [0]
+    stop_time = time.time() + seconds
+
+    def learn():
+        while time.time() < stop_time:
+            states, actions, rewards, next_states, terminals, horizons = prefetcher.get()
+            networks_lock.acquire()
+            Q, newQ = networks.predict_pair(states, next_states)
+            networks_lock.release()
+            targets = np.copy(Q)
+            targets[np.arange(len(actions)), actions] = rewards + (1.0 - terminals) * (gamma**horizons * np.max(newQ, axis=1))
+            networks_lock.acquire()
+            networks.online_net.train_on_batch(states, targets)
+            networks.do_soft_update()
+            counter[0] += 1
+            networks_lock.release()
+
+    threads = [threading.Thread(target=learn) for _ in range(num_of_learners)]
+    [thread.start() for thread in threads]
+    [thread.join() for thread in threads]
+    return counter[0]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark data-parallel learning against the threaded learners.')
+    parser.add_argument('--workers', type=int, default=NUM_OF_WORKERS)
+    parser.add_argument('--learners', type=int, default=4, help='threads of the threaded baseline')
+    parser.add_argument('--seconds', type=float, default=30.0)
+    parser.add_argument('--samples', type=int, default=100000)
+    args = parser.parse_args()
+
+    # fork the workers first, before this process builds any Keras model
+    pool = GradientWorkerPool(args.workers)
+
+    replay = replay_memory.ReplayMemory()
+    fill_random_replay(replay, args.samples)
+    replay_lock = threading.Lock()
+    scheduler = replay_ratio.ReplayRatioScheduler(replay_ratio=None, min_samples=0)
+    prefetcher = replay_memory.MinibatchPrefetcher(replay, replay_lock, scheduler, batch_size=BATCH_SIZE, depth=2 * args.workers)
+    prefetcher.start()
+
+    networks = q_networks.QNetworks(NUM_OF_ACTIONS, NUM_OF_STATES)
+    networks_lock = threading.Lock()
+
+    updates = benchmark_threaded(networks, networks_lock, prefetcher, args.learners, args.seconds)
+    print('threaded (%d learners): %.1f updates/s | %.0f samples/s' % (args.learners, updates / args.seconds, updates * BATCH_SIZE / args.seconds))
+
+    learner = DataParallelLearner(pool, networks, networks_lock, prefetcher, scheduler, threading.Lock())
+    updates = 0
+    stop_time = time.time() + args.seconds
+    while time.time() < stop_time:
+        learner.step()
+        updates += 1
+    print('data-parallel (%d workers): %.1f updates/s | %.0f samples/s' % (args.workers, updates / args.seconds, updates * args.workers * BATCH_SIZE / args.seconds))
+    pool.close()
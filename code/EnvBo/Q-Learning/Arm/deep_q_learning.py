@@ -11,9 +11,15 @@ import time
 
 # import own modules
 import agents
+import data_parallel
 import goals
+import profiler
 import q_networks
 import replay_memory
+import replay_ratio
+import rendering
+import state_coverage
+import training_state
 
 
 # TODO: check if network folders exist; if not, make them
@@ -24,35 +30,62 @@ import replay_memory
 ARM_LENGTH_1 = 12.0
 ARM_LENGTH_2 = 18.0
 ANGULAR_ARM_VELOCITY = 1.0*np.pi/180.0
+ACTION_MAGNITUDES = [1]     # joint steps per action in multiples of ANGULAR_ARM_VELOCITY (see agents.make_actions)
+ACTION_REPEAT = 1           # simulation substeps an action is held for; rewards are summed over them
+ALL_ACTION_BACKUPS = False  # learners simulate every action from each sampled state with the known kinematics (1-step targets for all outputs)
+COMBINED_ACTIONS = False    # move both joints per action: 9 instead of 4 actions per magnitude
+COVERAGE_MONITORING = True  # histograms of visited joint angles / end-effector positions (state_coverage.CoverageIndex)
+COVERAGE_REPORT_PERIOD = 60.0
 
 BATCH_SIZE = 64
+EPISODE_REPLAY = False      # episode-structured replay storing each observation once, within replay_memory.REPLAY_BYTES
 EPSILON = 0.99
 EPSILON_DECAY = 0.0005
 GAMMA = 0.5
 GOAL_THRESHOLD = 0.02
 HEIGHT = 70
+HINDSIGHT_REPLAY = False    # relabel goals at sample time (needs episode replay)
+LEARNER_JOIN_TIMEOUT = 60.0  # seconds to wait for each learner to finish its update once the actors are done
 MAX_EPISODES = 500
 MAX_STEPS = 500
 MIN_SAMPLES = 4000
-NUM_OF_ACTIONS = 4
+N_STEPS = 1                 # n-step returns (> 1 needs episode replay, like HINDSIGHT_REPLAY)
+ACTIONS = agents.make_actions(ACTION_MAGNITUDES, COMBINED_ACTIONS)
+NUM_OF_ACTIONS = len(ACTIONS)
 NUM_OF_ACTORS = 8
+NUM_OF_GRADIENT_WORKERS = 0  # >0: one data-parallel learner with this many worker processes instead of NUM_OF_LEARNERS threads
 NUM_OF_LEARNERS = 4
 NUM_OF_PLOTS_X = 4
 NUM_OF_PLOTS_Y = 2
 NUM_OF_STATES = 6
+PLOTTING = True
+REPLAY_DIR = None       # directory of a memory-mapped, resumable replay memory; None: replay memory in RAM
+REPLAY_RATIO = 0.25     # gradient updates per collected transition
+RESUME = True           # continue from the training state snapshot in SNAPSHOT_DIR, if there is one
+SNAPSHOT_DIR = training_state.SNAPSHOT_DIR  # full training state, saved with the networks; None: networks only
 STEPS_TO_SAVE_MODEL = 100
 WIDTH = 70
 
 
 class Actor(threading.Thread):
     def __init__(self, threadID, epsilon=EPSILON, max_steps=MAX_STEPS):
-        threading.Thread.__init__(self)
+        threading.Thread.__init__(self, name='actor-%d' % threadID)
         self.agent = None                       # place-holder for agent
-        self.epsilon = epsilon 				    # (starting) exploration percentage
+        self.epsilon = epsilon 				    # exploration percentage, annealed per episode
         self.goal = None 					    # placer-holder for goal
         self.MAX_STEPS = max_steps 				# maximal steps per episode
         self.THREAD_ID = threadID 				# thread id (integer)
         self.timestep = 0                       # timestep, used for exploration annealing
+        self.episodes = []                      # (steps, goal reached) of every finished episode
+
+    def get_training_state(self):
+        # exploration schedule for training_state snapshots
+        return {'epsilon': self.epsilon, 'timestep': self.timestep, 'episodes': self.episodes}
+
+    def set_training_state(self, state):
+        self.epsilon = state['epsilon']
+        self.timestep = state['timestep']
+        self.episodes = [tuple(episode) for episode in state['episodes']]
 
     def get_state(self):
     	# state is composed by agent + goal states
@@ -75,28 +108,39 @@ class Actor(threading.Thread):
         else:
             return False
 
+    def take_action(self, action):
+        # hold the action for ACTION_REPEAT substeps; returns summed reward, whether the agent reached the goal
+        # and the positions of the substeps before the last one (NaN after an early stop), for hindsight replay
+        self.agent.set_action(action)
+        reward = 0.0
+        substeps = np.full((ACTION_REPEAT - 1, 2), np.nan, dtype=np.float32)
+        for i in range(ACTION_REPEAT):
+            self.agent.update()
+            reward += self.get_reward()
+            if self.episode_finished():
+                return reward, True, substeps
+            if i < ACTION_REPEAT - 1:
+                substeps[i] = self.agent.get_position()[:2]
+        return reward, False, substeps
+
     def plot(self):
-        # stepwise refreshing of plot
-        ax[0,self.THREAD_ID].clear()
-        
-        # plotting of AGENT, GOAL and set AXIS LIMITS
-        self.goal.plot(ax[0,self.THREAD_ID])
-        self.agent.plot(ax[0,self.THREAD_ID])
-        ax[0,self.THREAD_ID].set_xlim([-WIDTH/2, WIDTH/2])#[0,WIDTH])
-        ax[0,self.THREAD_ID].set_ylim([-HEIGHT/2, HEIGHT/2])#[0,HEIGHT])
+        # stepwise refreshing of plot; artists of AGENT and GOAL are updated in place and blitted
+        renderers[self.THREAD_ID].draw(self.agent, self.goal)
 
     def run(self):
 
-        epsilon = self.epsilon
-        for _ in range(MAX_EPISODES):#while True: 
+        while len(self.episodes) < MAX_EPISODES: # a resumed actor continues its episode count
             # init new episode
             plotting_lock.acquire()
             scene_id = np.random.choice([0,1,2,3])
-            self.agent = agents.Arm(scene_id, angular_velocity_1=ANGULAR_ARM_VELOCITY, angular_velocity_2=ANGULAR_ARM_VELOCITY, arm_length_1=ARM_LENGTH_1, arm_length_2=ARM_LENGTH_2)
+            self.agent = agents.Arm(scene_id, angular_velocity_1=ANGULAR_ARM_VELOCITY, angular_velocity_2=ANGULAR_ARM_VELOCITY, arm_length_1=ARM_LENGTH_1, arm_length_2=ARM_LENGTH_2,
+                                    actions=ACTIONS)
             self.goal = goals.Goal_Arm(scene_id, ARM_LENGTH_1, ARM_LENGTH_2)
             plotting_lock.release()
 
             self.timestep += 1
+            episode = []                # transitions of this episode, for episode replay
+            store_episode = stores_episodes()
             
             for step in range(self.MAX_STEPS):
                 # produce experience
@@ -109,59 +153,61 @@ class Actor(threading.Thread):
 
                 random_number = np.random.uniform()
                 if True: #random_number < epsilon: 
-                    if random_number < epsilon/2:
+                    if random_number < self.epsilon/2:
                         action = np.random.randint(0, NUM_OF_ACTIONS) # choose random action
                     else:
                         # explore with guidance of inverse kinematics
                         try:
-                            u = self.agent.get_control(self.goal.pos - self.agent.pos)
-                            if np.argmax(np.abs(u)) == 0:
-                                if u[0] < 0:
-                                    action = 0
-                                else:
-                                    action = 1   
-                            else:
-                                if u[1] < 0:
-                                    action = 2
-                                else:
-                                    action = 3
+                            action = self.agent.get_guided_action(self.goal.pos - self.agent.pos, ACTION_REPEAT)
                         except:
                             action = np.random.randint(0, NUM_OF_ACTIONS) # choose random action if singularity
                 else: 
                     action = np.argmax(q) # choose best action from Q(s,a)
 
-                # take action, observe next state s'
-                self.agent.set_action(action)
-                self.agent.update()
+                # take action, observe next state s', reward and if agent at goal
+                reward, terminal, substeps = self.take_action(action)
                 next_state = self.get_state()
 
-                # observe reward
-                reward = self.get_reward()
+                # add exp sample to replay buffer (episode replay: whole episode at its end)
+                if store_episode:
+                    episode.append([state, action, reward, next_state, float(terminal), substeps])
+                else:
+                    replay_lock.acquire()
+                    replay.add_sample([state, action, reward, next_state, float(terminal)]) 
+                    replay_lock.release()
 
-                # check if agent at goal
-                terminal = self.episode_finished()
+                    # blocks while actors are too far ahead of the learners
+                    scheduler.add_transitions(1)
 
-                # add exp sample to replay buffer
-                replay_lock.acquire()
-                replay.add_sample([state, action, reward, next_state, float(terminal)]) 
-                replay_lock.release()
+                # state-visitation coverage, binned in batches
+                if COVERAGE_MONITORING:
+                    coverage_index.add(next_state)
 
                 # give console output and update plot
                 console_lock.acquire()
-                print '%3d | eps: %.2f | i: %3d | r: %.2f |' % (self.timestep, epsilon, step, reward), 'Q:', q
+                print '%3d | eps: %.2f | i: %3d | r: %.2f |' % (self.timestep, self.epsilon, step, reward), 'Q:', q
                 console_lock.release()
                     
                 # plot the scene
-                plotting_lock.acquire()
-                self.plot()
-                plotting_lock.release()
+                if PLOTTING:
+                    plotting_lock.acquire()
+                    self.plot()
+                    plotting_lock.release()
 
                 if terminal:
                     break # start new episode
 
+            if store_episode:
+                replay_lock.acquire()
+                replay.add_episode(episode)
+                replay_lock.release()
+                scheduler.add_transitions(len(episode))
+
+            self.episodes.append((step + 1, terminal))
+
             # explore less next time
-            if epsilon > 0.1:
-                epsilon = epsilon * 1.0/(1.0 + EPSILON_DECAY*self.timestep)
+            if self.epsilon > 0.1:
+                self.epsilon = self.epsilon * 1.0/(1.0 + EPSILON_DECAY*self.timestep)
 
             # episodic refreshing of plot
             #plotting_lock.acquire()
@@ -170,18 +216,14 @@ class Actor(threading.Thread):
 
 class Learner(threading.Thread):
     def __init__(self, threadID, gamma=GAMMA, min_samples=MIN_SAMPLES):
-        threading.Thread.__init__(self)
+        threading.Thread.__init__(self, name='learner-%d' % threadID)
         self.GAMMA = gamma
         self.MIN_SAMPLES = min_samples
         self.THREAD_ID = threadID
 
     def wait_for_replay_memory(self):
-        while True:
-            if replay.get_buffer_size() < self.MIN_SAMPLES:
-                # no/too few experience buffered; wait a bit
-                time.sleep(0.1)
-            else:
-                break
+        # sleeps on the scheduler's condition until MIN_SAMPLES transitions were collected
+        return scheduler.wait_for_samples()
                  
     def run(self):
         # wait for enough experience samples
@@ -189,29 +231,30 @@ class Learner(threading.Thread):
 
         while True:
             for _ in range(STEPS_TO_SAVE_MODEL):
-                # get lock to synchronize threads
-                replay_lock.acquire()
-                exp = replay.get_minibatch_samples(number_of_samples=BATCH_SIZE) # get exp samples from replay buffer
-                replay_lock.release()
-
-                # use experience to compute targets
-                # TODO: find better method than np.array(*.tolist())
-                states = np.array(exp[:,0].tolist(), np.float32)
-                actions = np.array(exp[:,1].tolist()) # array+tolist not necessary
-                rewards = np.array(exp[:,2].tolist(), np.float32) # array+tolist not necessary
-                next_states = np.array(exp[:,3].tolist(), np.float32)
-                terminals = np.array(exp[:,4].tolist()) # array+tolist not necessary
-
-                # get lock to synchronize threads
-                networks_lock.acquire()
-                Q = networks.online_net.predict(states, batch_size=BATCH_SIZE) # get Q(s,a,theta) 
-                newQ = networks.target_net.predict(next_states, batch_size=BATCH_SIZE) # get Q(s',a,theta^-) 
-                networks_lock.release() 
-                maxQ = np.max(newQ, axis=1) # get max_a Q(s',a,theta^-)
-                    
-                targets = np.copy(Q)
-                targets[np.arange(BATCH_SIZE), actions[:]] = rewards + (1.0-terminals)*(self.GAMMA*maxQ) # target output
-                # NOTE: (1.0-terminals) because if state is terminal, Q-learning target is defined only as reward without Q(s',a')
+                # wait until the replay ratio allows another update
+                if not scheduler.wait_for_update():
+                    return
+
+                # get a ready minibatch (sampled + converted to float32 arrays by the prefetcher); None: closed stream (offline_training)
+                batch = prefetcher.get()
+                if batch is None:
+                    scheduler.cancel_update()
+                    return
+                states, actions, rewards, next_states, terminals, horizons = batch
+
+                if ALL_ACTION_BACKUPS:
+                    targets = get_all_action_targets(states, self.GAMMA) # stored actions, rewards and s' are not needed
+                else:
+                    # get lock to synchronize threads
+                    networks_lock.acquire()
+                    Q, newQ = networks.predict_pair(states, next_states) # get Q(s,a,theta) and Q(s',a,theta^-)
+                    networks_lock.release() 
+                    maxQ = np.max(newQ, axis=1) # get max_a Q(s',a,theta^-)
+                        
+                    targets = np.copy(Q)
+                    targets[np.arange(BATCH_SIZE), actions[:]] = rewards + (1.0-terminals)*(self.GAMMA**horizons*maxQ) # target output
+                    # NOTE: (1.0-terminals) because if state is terminal, Q-learning target is defined only as reward without Q(s',a')
+                    # NOTE: horizons > 1 for n-step returns; s' is then that many steps ahead
                 
                 # console output
                 console_lock.acquire()
@@ -229,8 +272,66 @@ class Learner(threading.Thread):
             networks.save_models()
             networks_lock.release() 
 
+            # persist the replay memory and the full training state at the same checkpoint step
+            replay_report = commit_checkpoint()
+
+            console_lock.acquire()
+            print scheduler.get_report()
+            print replay_report
+            console_lock.release()
+
+
+def commit_checkpoint(optimizer_state=None, optimizer=None):
+    # replay memory and training state snapshot at one checkpoint step (both locks held), so that a resumed
+    # run can tell whether they belong together; returns the replay report
+    networks_lock.acquire()
+    replay_lock.acquire()
+    checkpoint_step = scheduler.num_of_updates
+    replay.commit(checkpoint_step)
+    replay_report = replay.get_report()
+    if SNAPSHOT_DIR is not None:
+        training_state.save_snapshot(SNAPSHOT_DIR, networks, actors, scheduler, optimizer_state, optimizer, checkpoint_step)
+    replay_lock.release()
+    networks_lock.release()
+    return replay_report
+
+
+def get_all_action_targets(states, gamma=GAMMA):
+    # rewards, terminals and s' of every action from the known kinematics; Q(s',a,theta^-) of all
+    # len(states)*NUM_OF_ACTIONS next states in one forward pass, so every output gets a target
+    rewards, next_states, terminals = agents.simulate_actions(states, ACTIONS, ANGULAR_ARM_VELOCITY, ANGULAR_ARM_VELOCITY,
+                                                              ARM_LENGTH_1, ARM_LENGTH_2, GOAL_THRESHOLD, ACTION_REPEAT)
+    next_states = next_states.reshape(-1, NUM_OF_STATES)
+    networks_lock.acquire()
+    newQ = networks.target_net.predict(next_states, batch_size=len(next_states))
+    networks_lock.release()
+    maxQ = np.max(newQ, axis=1).reshape(terminals.shape) # get max_a' Q(s'_a,a',theta^-) per state and action
+    return rewards + (1.0-terminals)*gamma*maxQ
+
+
+def stores_episodes():
+    # actors hand over whole episodes to replay_memory.EpisodeReplayMemory instead of single transitions
+    return EPISODE_REPLAY or HINDSIGHT_REPLAY or N_STEPS > 1
+
+
+def make_replay_memory():
+    # GLOBAL replay memory as configured by EPISODE_REPLAY, HINDSIGHT_REPLAY, N_STEPS and REPLAY_DIR; sizes read at call time (see sweep.py)
+    if stores_episodes():
+        her_ratio = replay_memory.HER_RATIO if HINDSIGHT_REPLAY else 0.0
+        return replay_memory.EpisodeReplayMemory(max_bytes=replay_memory.REPLAY_BYTES, her_ratio=her_ratio, goal_threshold=GOAL_THRESHOLD,
+                                                 n_steps=N_STEPS, gamma=GAMMA, action_repeat=ACTION_REPEAT)
+    elif REPLAY_DIR is None:
+        return replay_memory.ReplayMemory(max_size=replay_memory.BUFFER_SIZE)
+    else:
+        return replay_memory.MappedReplayMemory(REPLAY_DIR, max_size=replay_memory.BUFFER_SIZE)
+
 
 if __name__ == "__main__":
+    # fork data-parallel gradient workers before any thread or Keras model exists in this process
+    if NUM_OF_GRADIENT_WORKERS > 0:
+        worker_pool = data_parallel.GradientWorkerPool(NUM_OF_GRADIENT_WORKERS, BATCH_SIZE, NUM_OF_STATES, NUM_OF_ACTIONS,
+                                                       q_networks.NUM_OF_HIDDEN_NEURONS, q_networks.NUM_OF_HIDDEN_LAYERS, q_networks.BACKEND)
+
     # create GLOBAL thread-locks
     console_lock = threading.Lock()
     networks_lock = threading.Lock()
@@ -238,20 +339,50 @@ if __name__ == "__main__":
     plotting_lock = threading.Lock()
 
     # create GLOBAL replay memory
-    replay = replay_memory.ReplayMemory()
+    replay = make_replay_memory()
+
+    # create GLOBAL scheduler, coupling actors and learners at a fixed replay ratio
+    scheduler = replay_ratio.ReplayRatioScheduler(REPLAY_RATIO, MIN_SAMPLES, resumed_transitions=replay.get_buffer_size())
+
+    # create GLOBAL minibatch prefetcher, sampling the replay memory in the background
+    prefetcher = replay_memory.MinibatchPrefetcher(replay, replay_lock, scheduler, batch_size=BATCH_SIZE)
+    prefetcher.start()
 
     # create GLOBAL Q-NETWORKS
-    networks = q_networks.QNetworks(NUM_OF_ACTIONS, NUM_OF_STATES)
+    networks = q_networks.QNetworks(NUM_OF_ACTIONS, NUM_OF_STATES, actions=ACTIONS)
+
+    # create GLOBAL coverage index
+    coverage_index = state_coverage.CoverageIndex(ARM_LENGTH_1, ARM_LENGTH_2)
 
     # initialize GLOBAL plotting
     fig, ax = plt.subplots(NUM_OF_PLOTS_Y,NUM_OF_PLOTS_X)
     ax = ax.reshape(1, ax.shape[0]*ax.shape[1])
     plt.ion()
+    renderers = [rendering.ArmRenderer(ax[0,i], WIDTH, HEIGHT) for i in range(NUM_OF_ACTORS)]
 
     # create threads
     threads = []
-    threads.extend([Actor(i) for i in range(NUM_OF_ACTORS)])
-    threads.extend([Learner(i) for i in range(NUM_OF_LEARNERS)])
+    actors = [Actor(i) for i in range(NUM_OF_ACTORS)]
+    threads.extend(actors)
+
+    # resume networks, optimizer state, exploration, counters and RNG streams of the last snapshot (before the
+    # data-parallel learner copies the weights); scheduler counters only together with a replay memory resumed
+    # from REPLAY_DIR, a replay memory in RAM is refilled first
+    snapshot = training_state.load_snapshot(SNAPSHOT_DIR) if RESUME and SNAPSHOT_DIR is not None else None
+    if snapshot is not None:
+        training_state.check_replay(snapshot, replay)
+        training_state.restore_snapshot(snapshot, networks, actors, scheduler if replay.get_buffer_size() > 0 else None)
+        print 'Resumed training state of', time.ctime(snapshot[0]['time']), 'from', SNAPSHOT_DIR
+
+    if NUM_OF_GRADIENT_WORKERS > 0:
+        learner = data_parallel.DataParallelLearner(worker_pool, networks, networks_lock, prefetcher, scheduler, console_lock, gamma=GAMMA,
+                                                    target_function=get_all_action_targets if ALL_ACTION_BACKUPS else None,
+                                                    checkpoint_function=lambda optimizer_state: commit_checkpoint(optimizer_state, 'data_parallel'))
+        if snapshot is not None and snapshot[0]['optimizer'] == 'data_parallel':
+            learner.optimizer.set_state(training_state.get_optimizer_state(snapshot))
+        threads.append(learner)
+    else:
+        threads.extend([Learner(i) for i in range(NUM_OF_LEARNERS)])
 
     # set daemon, allowing Ctrl-C
     for i in range(len(threads)):
@@ -260,10 +391,35 @@ if __name__ == "__main__":
     # start new Threads
     [threads[i].start() for i in range(len(threads))]
 
-    # show plot
+    # sampling profiler, idle until toggled (kill -USR1 <pid> or touch profiler.CONTROL_FILE)
+    profiler.start()
+
+    # show plot; report and save coverage every COVERAGE_REPORT_PERIOD
     plt.show()
-    while True:
+    last_report = time.time()
+    while any(actor.is_alive() for actor in actors):
+        if NUM_OF_GRADIENT_WORKERS > 0 and learner.error is not None:
+            raise RuntimeError('data-parallel learner failed: %s' % learner.error)
         plotting_lock.acquire()
         fig.canvas.flush_events()
         plotting_lock.release()
         time.sleep(0.1)
+
+        if COVERAGE_MONITORING and time.time() - last_report > COVERAGE_REPORT_PERIOD:
+            last_report = time.time()
+            coverage_report = coverage_index.get_report()
+            coverage_index.save()
+            console_lock.acquire()
+            print coverage_report
+            console_lock.release()
+
+    # actors stop after MAX_EPISODES; then release the learners and save the final state
+    scheduler.stop()
+    [thread.join(LEARNER_JOIN_TIMEOUT) for thread in threads if thread not in actors]
+    networks_lock.acquire()
+    networks.save_models()
+    networks_lock.release()
+    if NUM_OF_GRADIENT_WORKERS > 0:
+        commit_checkpoint(learner.optimizer.get_state(), 'data_parallel')
+    else:
+        commit_checkpoint()
@@ -0,0 +1,109 @@
+#!/usr/bin/python
+import argparse
+import numpy as np
+import os
+import time
+
+# import own modules
+import agents
+import evaluation
+import goals
+import q_networks
+import replay_memory
+
+
+ARM_LENGTH_1 = 12.0                 # same arm as deep_q_learning
+ARM_LENGTH_2 = 18.0
+BATCH_SIZE = 256
+MIN_AGREEMENT = 0.98                # greedy action agreement with the teacher required for export
+NUM_OF_EPOCHS = 20
+NUM_OF_STATES = 100000              # distillation states (lattice sampling)
+STUDENT_DIR = 'students'
+STUDENT_SIZES = [64, 32, 16]        # hidden neurons per layer
+VALIDATION_SHARE = 0.1
+
+
+def sample_lattice_states(num_of_states, arm_length_1=ARM_LENGTH_1, arm_length_2=ARM_LENGTH_2):
+    # arm states on the 1 degree lattice, each with the goal of a random scenario
+    theta = np.pi*np.random.randint(0, 360, (num_of_states, 2))/180.0
+    scene_ids = np.random.randint(len(goals.SCENARIOS), size=num_of_states)
+    states = np.empty((num_of_states, 6), dtype=np.float32)
+    for scene_id in range(len(goals.SCENARIOS)):
+        ids = np.flatnonzero(scene_ids == scene_id)
+        states[ids] = agents.get_states(theta[ids], goals.Goal_Arm(scene_id, arm_length_1, arm_length_2).pos, arm_length_1, arm_length_2)
+    return states
+
+
+def load_replay_states(directories, num_of_states):
+    # states of recorded MappedReplayMemory directories
+    memories = [replay_memory.MappedReplayMemory(directory, read_only=True) for directory in directories]
+    states = np.concatenate([memory.states[:memory.size] for memory in memories])
+    return states[np.random.choice(len(states), min(num_of_states, len(states)), replace=False)]
+
+
+def count_multiply_adds(networks):
+    sizes = [networks.NUM_OF_STATES] + [networks.NUM_OF_HIDDEN_NEURONS]*networks.NUM_OF_HIDDEN_LAYERS + [networks.NUM_OF_ACTIONS]
+    return sum(fan_in*fan_out for fan_in, fan_out in zip(sizes[:-1], sizes[1:]))
+
+
+def distill(teacher, states, targets, num_of_hidden_neurons, num_of_hidden_layers, backend, num_of_epochs=NUM_OF_EPOCHS, batch_size=BATCH_SIZE):
+    # freshly initialized student (nothing loaded, nothing saved) regressing the teacher's Q-values (all actions) on the given states
+    student = q_networks.QNetworks(teacher.NUM_OF_ACTIONS, teacher.NUM_OF_STATES, num_of_hidden_neurons=num_of_hidden_neurons, backend=backend,
+                                   actions=teacher.ACTIONS, num_of_hidden_layers=num_of_hidden_layers, model_dir=None)
+    for epoch in range(num_of_epochs):
+        order = np.random.permutation(len(states))
+        for start in range(0, len(states) - batch_size + 1, batch_size):
+            ids = order[start:start + batch_size]
+            student.online_net.train_on_batch(states[ids], targets[ids])
+    student.do_hard_update()
+    return student
+
+
+def report(name, networks, states, targets):
+    # action agreement with the teacher's targets, task success and single-state latency
+    q = networks.online_net.predict(states, batch_size=len(states))
+    agreement = np.mean(np.argmax(q, axis=1) == np.argmax(targets, axis=1))
+    results = evaluation.evaluate_policy(networks, actions=networks.ACTIONS)
+    latency = evaluation.measure_latency(lambda state: networks.online_net.predict(state, batch_size=1), states)
+    print('%-12s %7d MACs | agreement %.3f | mse %.5f | success rate %.2f | optimality gap %.2f | %.3fms per state' % (
+        name, count_multiply_adds(networks), agreement, np.mean((q - targets)**2), results['success_rate'], results['mean_optimality_gap'], 1e3*latency))
+    return agreement, results['success_rate']
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Distill the online network into smaller students and export the smallest good one.')
+    parser.add_argument('--teacher', default='.', help='checkpoint directory of the teacher')
+    parser.add_argument('--replay', nargs='*', help='MappedReplayMemory directories to take states from (default: lattice states)')
+    parser.add_argument('--states', type=int, default=NUM_OF_STATES)
+    parser.add_argument('--sizes', type=int, nargs='+', default=STUDENT_SIZES, help='hidden neurons per layer of the students')
+    parser.add_argument('--layers', type=int, default=2, help='hidden layers of the students')
+    parser.add_argument('--epochs', type=int, default=NUM_OF_EPOCHS)
+    parser.add_argument('--backend', default=q_networks.BACKEND)
+    parser.add_argument('--output', default=STUDENT_DIR)
+    args = parser.parse_args()
+
+    teacher = q_networks.load_networks(args.teacher, backend=args.backend)
+    if args.replay:
+        states = load_replay_states(args.replay, args.states)
+    else:
+        states = sample_lattice_states(args.states)
+    targets = teacher.online_net.predict(states, batch_size=len(states)).astype(np.float32)
+    num_of_validation = int(len(states)*VALIDATION_SHARE)
+    train, validation = slice(num_of_validation, None), slice(0, num_of_validation)
+
+    teacher_agreement, teacher_success = report('teacher', teacher, states[validation], targets[validation])
+    chosen = None
+    for size in sorted(args.sizes, reverse=True):
+        start = time.time()
+        student = distill(teacher, states[train], targets[train], size, args.layers, args.backend, num_of_epochs=args.epochs)
+        agreement, success = report('%dx%d' % (args.layers, size), student, states[validation], targets[validation])
+        print('%-12s trained in %.1fs' % ('', time.time() - start))
+        if agreement >= MIN_AGREEMENT and success >= teacher_success:
+            chosen = (size, student)
+
+    if chosen is None:
+        print('No student reaches %.2f agreement and the teacher\'s success rate; nothing exported.' % MIN_AGREEMENT)
+    else:
+        model_dir = os.path.join(args.output, '%dx%d' % (args.layers, chosen[0]))
+        chosen[1].save_models(model_dir)
+        print('Exported the %dx%d student to %s.' % (args.layers, chosen[0], model_dir))
@@ -0,0 +1,455 @@
+#!/usr/bin/python
+import argparse
+import io
+import multiprocessing
+import numpy as np
+import socket
+import struct
+import threading
+import time
+import zlib
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+# import own modules
+import deep_q_learning
+import profiler
+import q_networks
+import replay_memory
+import replay_ratio
+import state_coverage
+import training_state
+
+
+COMPRESSION_LEVEL = 1               # zlib level; transitions are small floats, fast beats tight
+DEFAULT_HOST = 'localhost'
+DEFAULT_PORT = 5555
+ARRAY_HEADER = struct.Struct('!Q')  # length of one .npy payload
+HEADER = struct.Struct('!I')        # length prefix of every message on the wire
+MAX_MESSAGE_SIZE = 1 << 28          # bytes; larger messages (compressed or not) are rejected as malformed
+MESSAGE_HEADER = struct.Struct('!16sqI')  # kind, number (e.g. weights version), number of arrays
+QUEUE_SIZE = 16                     # messages in flight per direction of a queue transport; a full queue blocks the sender
+RECEIVE_TIMEOUT = 1.0
+TRANSITIONS_PER_MESSAGE = 64        # actor-side batching before a message is sent
+WEIGHTS_BROADCAST_PERIOD = 5.0      # seconds between two weight broadcasts of the learner node
+
+
+def encode_message(kind, arrays, number=0):
+    # data only: fixed header + .npy payloads, so decoding input from the network never runs code
+    chunks = [MESSAGE_HEADER.pack(kind.encode('ascii'), number, len(arrays))]
+    for array in arrays:
+        payload = io.BytesIO()
+        np.save(payload, np.asarray(array), allow_pickle=False)
+        chunks.append(ARRAY_HEADER.pack(len(payload.getvalue())))
+        chunks.append(payload.getvalue())
+    return zlib.compress(b''.join(chunks), COMPRESSION_LEVEL)
+
+
+def decode_message(data):
+    # (kind, number, arrays); raises ValueError on malformed input
+    try:
+        decompressor = zlib.decompressobj()
+        data = decompressor.decompress(data, MAX_MESSAGE_SIZE)
+        if decompressor.unconsumed_tail:
+            raise ValueError('message exceeds %d bytes' % MAX_MESSAGE_SIZE)
+        kind, number, num_of_arrays = MESSAGE_HEADER.unpack_from(data, 0)
+        offset = MESSAGE_HEADER.size
+        arrays = []
+        for _ in range(num_of_arrays):
+            size = ARRAY_HEADER.unpack_from(data, offset)[0]
+            offset += ARRAY_HEADER.size
+            if offset + size > len(data):
+                raise ValueError('truncated array payload')
+            arrays.append(np.load(io.BytesIO(data[offset:offset + size]), allow_pickle=False))
+            offset += size
+    except (struct.error, zlib.error) as error:
+        raise ValueError('malformed message: %s' % error)
+    return kind.rstrip(b'\0').decode('ascii'), number, arrays
+
+
+def pack_transitions(samples):
+    # [state, action, reward, next_state, terminal(, substep positions)] rows -> column arrays (compact on the wire)
+    columns = [np.array([s[0] for s in samples], np.float32),
+               np.array([s[1] for s in samples], np.int32),
+               np.array([s[2] for s in samples], np.float32),
+               np.array([s[3] for s in samples], np.float32),
+               np.array([s[4] for s in samples], np.float32)]
+    if len(samples[0]) > 5:
+        columns.append(np.array([s[5] for s in samples], np.float32))
+    return columns
+
+
+def unpack_transitions(columns):
+    rows = [[columns[0][i], int(columns[1][i]), float(columns[2][i]), columns[3][i], float(columns[4][i])] for i in range(len(columns[1]))]
+    if len(columns) > 5:
+        for row, substeps in zip(rows, columns[5]):
+            row.append(substeps)
+    return rows
+
+
+class QueueTransport:
+    # in-process stand-in for a socket; messages are encoded anyway, so the wire format is exercised
+    def __init__(self, inbox, outbox):
+        self.inbox = inbox
+        self.outbox = outbox
+        self.closed = False
+
+    def send(self, kind, arrays, number=0):
+        data = encode_message(kind, arrays, number)
+        if kind != 'weights':
+            self.outbox.put(data)
+            return
+        # never block on weights (the receiving node may have exited): a full queue holds stale ones, drop the oldest
+        try:
+            self.outbox.put_nowait(data)
+        except queue.Full:
+            try:
+                self.outbox.get_nowait()
+                self.outbox.put_nowait(data)
+            except (queue.Empty, queue.Full):
+                pass # the next broadcast supersedes these weights anyway
+
+    def receive(self, timeout=RECEIVE_TIMEOUT):
+        # (kind, number, arrays); returns None on timeout
+        try:
+            return decode_message(self.inbox.get(timeout=timeout))
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.closed = True
+
+
+def make_queue_transport_pair(queue_factory=queue.Queue, maxsize=QUEUE_SIZE):
+    # queue.Queue for threads of one process, multiprocessing.Queue across processes; bounded, so a
+    # learner node blocked in the scheduler backs up the queue and in turn blocks the actors' sends
+    a_to_b = queue_factory(maxsize)
+    b_to_a = queue_factory(maxsize)
+    return QueueTransport(b_to_a, a_to_b), QueueTransport(a_to_b, b_to_a)
+
+
+class SocketTransport:
+    def __init__(self, sock):
+        self.sock = sock
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.send_lock = threading.Lock()
+        self.buffer = bytearray()   # received bytes of incomplete messages, kept across timeouts
+        self.closed = False
+
+    @staticmethod
+    def connect(host=DEFAULT_HOST, port=DEFAULT_PORT):
+        return SocketTransport(socket.create_connection((host, port)))
+
+    def send(self, kind, arrays, number=0):
+        data = encode_message(kind, arrays, number)
+        self.send_lock.acquire()
+        try:
+            self.sock.sendall(HEADER.pack(len(data)) + data)
+        finally:
+            self.send_lock.release()
+
+    def receive(self, timeout=RECEIVE_TIMEOUT):
+        # (kind, number, arrays); returns None on timeout, a partly received message stays buffered for
+        # the next call; raises EOFError if the peer went away, ValueError on malformed input
+        self.sock.settimeout(timeout)
+        while True:
+            if len(self.buffer) >= HEADER.size:
+                size = HEADER.unpack_from(self.buffer)[0]
+                if size > MAX_MESSAGE_SIZE:
+                    raise ValueError('message of %d bytes exceeds %d' % (size, MAX_MESSAGE_SIZE))
+                if len(self.buffer) >= HEADER.size + size:
+                    data = bytes(self.buffer[HEADER.size:HEADER.size + size])
+                    del self.buffer[:HEADER.size + size]
+                    return decode_message(data)
+            try:
+                chunk = self.sock.recv(1 << 16)
+            except socket.timeout:
+                return None
+            if not chunk:
+                raise EOFError('connection closed by peer')
+            self.buffer += chunk
+
+    def close(self):
+        self.closed = True
+        self.sock.close()
+
+
+class RemoteReplay:
+    # actor-side replacement of the GLOBAL replay memory; batches samples and streams them to the learner node
+    def __init__(self, transport, batch_size=TRANSITIONS_PER_MESSAGE):
+        self.transport = transport
+        self.BATCH_SIZE = batch_size
+        self.lock = threading.Lock()
+        self.pending = []
+        self.size = 0
+
+    def get_buffer_size(self):
+        # number of samples sent so far
+        return self.size
+
+    def add_sample(self, sample):
+        self.lock.acquire()
+        self.pending.append(sample)
+        self.size += 1
+        if len(self.pending) >= self.BATCH_SIZE:
+            batch, self.pending = self.pending, []
+        else:
+            batch = None
+        self.lock.release()
+
+        if batch is not None:
+            self.transport.send('transitions', pack_transitions(batch))
+
+    def add_episode(self, samples):
+        # hindsight replay: episodes travel whole, the learner node relabels them
+        self.lock.acquire()
+        self.size += len(samples)
+        self.lock.release()
+        self.transport.send('episode', pack_transitions(samples))
+
+    def flush(self):
+        # sends a partial batch; call when the actors are done
+        self.lock.acquire()
+        batch, self.pending = self.pending, []
+        self.lock.release()
+        if len(batch) > 0:
+            self.transport.send('transitions', pack_transitions(batch))
+
+
+class WeightSubscriber(threading.Thread):
+    # actor-side; applies versioned weights broadcast by the learner node to the local online network
+    def __init__(self, transport, networks, networks_lock):
+        threading.Thread.__init__(self, name='weight-subscriber')
+        self.daemon = True
+        self.transport = transport
+        self.networks = networks
+        self.networks_lock = networks_lock
+        self.version = -1
+
+    def run(self):
+        while not self.transport.closed:
+            try:
+                message = self.transport.receive()
+            except (EOFError, ValueError):
+                break
+            if message is None or message[0] != 'weights':
+                continue
+
+            version, weights = message[1], message[2]
+            if version <= self.version:
+                continue  # stale broadcast
+            self.networks_lock.acquire()
+            self.networks.online_net.set_weights(weights)
+            self.networks_lock.release()
+            self.version = version
+
+
+class ReplayServer(threading.Thread):
+    # learner-side; receives transitions from any number of actor transports and broadcasts weights back
+    def __init__(self, replay, replay_lock, scheduler, host=DEFAULT_HOST, port=None, coverage_index=None):
+        threading.Thread.__init__(self, name='replay-server')
+        self.daemon = True
+        self.replay = replay
+        self.replay_lock = replay_lock
+        self.scheduler = scheduler
+        self.coverage_index = coverage_index  # state_coverage.CoverageIndex of the received next states; None: off
+        self.HOST = host
+        self.PORT = port                   # None: no TCP listener, only attached (in-process) transports
+        self.transports = []
+        self.transports_lock = threading.Lock()
+        self.version = 0
+        self.num_of_received = 0
+
+    def attach(self, transport):
+        self.transports_lock.acquire()
+        self.transports.append(transport)
+        self.transports_lock.release()
+
+        receiver = threading.Thread(target=self.receive_from, args=(transport,))
+        receiver.daemon = True
+        receiver.start()
+
+    def receive_from(self, transport):
+        while not transport.closed:
+            try:
+                message = transport.receive()
+            except (EOFError, ValueError):
+                transport.close()  # peer went away or does not speak the protocol
+                break
+            if message is None or message[0] not in ('transitions', 'episode'):
+                continue
+
+            # a message the replay memory rejects (e.g. an episode without substeps) is dropped, the stream goes on
+            samples = unpack_transitions(message[2])
+            self.replay_lock.acquire()
+            try:
+                if message[0] == 'episode':
+                    self.replay.add_episode(samples)
+                else:
+                    for sample in samples:
+                        self.replay.add_sample(sample)
+                self.num_of_received += len(samples)
+            except Exception as error:
+                print 'Dropped', message[0], 'of', len(samples), 'transitions:', error
+                continue
+            finally:
+                self.replay_lock.release()
+
+            # the actors' coverage, from the next_states column as it came off the wire
+            if self.coverage_index is not None:
+                self.coverage_index.add(message[2][3])
+
+            # blocking here backs up the stream, which in turn throttles the remote actors
+            self.scheduler.add_transitions(len(samples))
+
+        self.transports_lock.acquire()
+        self.transports.remove(transport)
+        self.transports_lock.release()
+
+    def broadcast_weights(self, weights):
+        self.version += 1
+        self.transports_lock.acquire()
+        transports = list(self.transports)
+        self.transports_lock.release()
+        for transport in transports:
+            try:
+                transport.send('weights', weights, self.version)
+            except (socket.error, EOFError):
+                transport.close()
+        return self.version
+
+    def run(self):
+        if self.PORT is None:
+            return
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind((self.HOST, self.PORT))
+        server.listen(5)
+        while True:
+            conn, address = server.accept()
+            print 'Actor node connected from %s:%d.' % address
+            self.attach(SocketTransport(conn))
+
+
+def start_actor_node(transport, num_of_actors=deep_q_learning.NUM_OF_ACTORS):
+    # runs the unchanged deep_q_learning.Actor threads against a remote replay + broadcast weights
+    deep_q_learning.PLOTTING = False
+    deep_q_learning.COVERAGE_MONITORING = False  # collected by the learner node's ReplayServer
+    deep_q_learning.console_lock = threading.Lock()
+    deep_q_learning.networks_lock = threading.Lock()
+    deep_q_learning.replay_lock = threading.Lock()
+    deep_q_learning.plotting_lock = threading.Lock()
+    deep_q_learning.replay = RemoteReplay(transport)
+    deep_q_learning.scheduler = replay_ratio.ReplayRatioScheduler(replay_ratio=None)  # throttled by the learner node
+    deep_q_learning.networks = q_networks.QNetworks(deep_q_learning.NUM_OF_ACTIONS, deep_q_learning.NUM_OF_STATES, actions=deep_q_learning.ACTIONS)
+
+    WeightSubscriber(transport, deep_q_learning.networks, deep_q_learning.networks_lock).start()
+
+    threads = [deep_q_learning.Actor(i) for i in range(num_of_actors)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    profiler.start()  # per process; output files are named by pid
+    return threads
+
+
+def run_actor_node(transport, num_of_actors=deep_q_learning.NUM_OF_ACTORS):
+    threads = start_actor_node(transport, num_of_actors)
+    # poll instead of join(): on Python 2 a join without timeout defers signals, e.g. the profiler's SIGUSR1
+    while any(thread.is_alive() for thread in threads):
+        time.sleep(0.1)
+    deep_q_learning.replay.flush()  # last partial batch
+
+
+def start_learner_node(transports=(), num_of_learners=deep_q_learning.NUM_OF_LEARNERS, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    # replay memory + unchanged deep_q_learning.Learner threads, fed by a ReplayServer
+    deep_q_learning.console_lock = threading.Lock()
+    deep_q_learning.networks_lock = threading.Lock()
+    deep_q_learning.replay_lock = threading.Lock()
+    deep_q_learning.replay = deep_q_learning.make_replay_memory()
+    deep_q_learning.scheduler = replay_ratio.ReplayRatioScheduler(deep_q_learning.REPLAY_RATIO, deep_q_learning.MIN_SAMPLES,
+                                                                  resumed_transitions=deep_q_learning.replay.get_buffer_size())
+    deep_q_learning.networks = q_networks.QNetworks(deep_q_learning.NUM_OF_ACTIONS, deep_q_learning.NUM_OF_STATES, actions=deep_q_learning.ACTIONS)
+    deep_q_learning.actors = []  # remote; snapshots hold networks, optimizer, counters and RNG state of this node
+
+    # resume like the main loop of deep_q_learning (actor nodes start their exploration schedules afresh)
+    if deep_q_learning.RESUME and deep_q_learning.SNAPSHOT_DIR is not None:
+        snapshot = training_state.load_snapshot(deep_q_learning.SNAPSHOT_DIR)
+        if snapshot is not None:
+            training_state.check_replay(snapshot, deep_q_learning.replay)
+            training_state.restore_snapshot(snapshot, deep_q_learning.networks, [],
+                                            deep_q_learning.scheduler if deep_q_learning.replay.get_buffer_size() > 0 else None)
+            print 'Resumed training state of', time.ctime(snapshot[0]['time']), 'from', deep_q_learning.SNAPSHOT_DIR
+    deep_q_learning.coverage_index = None
+    if deep_q_learning.COVERAGE_MONITORING:
+        deep_q_learning.coverage_index = state_coverage.CoverageIndex(deep_q_learning.ARM_LENGTH_1, deep_q_learning.ARM_LENGTH_2)
+
+    server = ReplayServer(deep_q_learning.replay, deep_q_learning.replay_lock, deep_q_learning.scheduler, host=host, port=port,
+                          coverage_index=deep_q_learning.coverage_index)
+    for transport in transports:
+        server.attach(transport)
+    server.start()
+
+    deep_q_learning.prefetcher = replay_memory.MinibatchPrefetcher(deep_q_learning.replay, deep_q_learning.replay_lock, deep_q_learning.scheduler, batch_size=deep_q_learning.BATCH_SIZE)
+    deep_q_learning.prefetcher.start()
+
+    threads = [deep_q_learning.Learner(i) for i in range(num_of_learners)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    profiler.start()
+    return server, threads
+
+
+def broadcast_forever(server, period=WEIGHTS_BROADCAST_PERIOD):
+    # also reports and saves the coverage of the received states every deep_q_learning.COVERAGE_REPORT_PERIOD
+    last_report = time.time()
+    while True:
+        deep_q_learning.networks_lock.acquire()
+        weights = deep_q_learning.networks.online_net.get_weights()
+        deep_q_learning.networks_lock.release()
+        version = server.broadcast_weights(weights)
+
+        coverage_report = None
+        if server.coverage_index is not None and time.time() - last_report > deep_q_learning.COVERAGE_REPORT_PERIOD:
+            last_report = time.time()
+            coverage_report = server.coverage_index.get_report()
+            server.coverage_index.save()
+
+        deep_q_learning.console_lock.acquire()
+        print 'Broadcast weights v%d | %s' % (version, deep_q_learning.scheduler.get_report())
+        if coverage_report is not None:
+            print coverage_report
+        deep_q_learning.console_lock.release()
+        time.sleep(period)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Ape-X style distributed actors and learners.')
+    parser.add_argument('mode', choices=['learner', 'actor', 'local'])
+    parser.add_argument('--host', default=DEFAULT_HOST, help='learner: address to listen on (0.0.0.0 for all interfaces); actor: learner node to connect to')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--actors', type=int, default=deep_q_learning.NUM_OF_ACTORS)
+    parser.add_argument('--learners', type=int, default=deep_q_learning.NUM_OF_LEARNERS)
+    args = parser.parse_args()
+
+    if args.mode == 'learner':
+        # replay + learners; actor nodes on any machine connect via TCP
+        server, _ = start_learner_node(num_of_learners=args.learners, host=args.host, port=args.port)
+        broadcast_forever(server)
+
+    elif args.mode == 'actor':
+        run_actor_node(SocketTransport.connect(args.host, args.port), num_of_actors=args.actors)
+
+    else:
+        # single machine stand-in: actor node in a child process, connected by queues instead of TCP
+        # NOTE: fork before the learner node builds its networks
+        actor_end, learner_end = make_queue_transport_pair(multiprocessing.Queue)
+        actor_node = multiprocessing.Process(target=run_actor_node, args=(actor_end, args.actors))
+        actor_node.daemon = True
+        actor_node.start()
+
+        server, _ = start_learner_node(transports=[learner_end], num_of_learners=args.learners, port=None)
+        broadcast_forever(server)
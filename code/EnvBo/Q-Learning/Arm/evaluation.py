@@ -0,0 +1,120 @@
+#!/usr/bin/python
+import argparse
+import numpy as np
+import time
+
+# import own modules
+import agents
+import goals
+import q_networks
+import shortest_paths
+
+
+ARM_LENGTH_1 = 12.0                 # same arm as deep_q_learning
+ARM_LENGTH_2 = 18.0
+ACTION_REPEAT = 1
+ANGULAR_ARM_VELOCITY = 1.0*np.pi/180.0
+BENCHMARK_ACTION_SETS = [([1], 1, False), ([1], 4, False), ([1, 5], 1, False), ([1, 5], 4, False),
+                         ([1], 1, True), ([1, 5], 4, True)]  # (agents.ACTION_MAGNITUDES, ACTION_REPEAT, agents.COMBINED_ACTIONS)
+GOAL_THRESHOLD = 0.02
+MAX_STEPS = 500                     # simulation steps
+NUM_OF_STATES = 6
+
+
+def run_episode(networks, scene_id, arm_length_1=ARM_LENGTH_1, arm_length_2=ARM_LENGTH_2, angular_velocity=ANGULAR_ARM_VELOCITY, goal_threshold=GOAL_THRESHOLD, max_steps=MAX_STEPS,
+                actions=None, action_repeat=ACTION_REPEAT):
+    # greedy policy from SCENARIOS[scene_id] (networks None: inverse kinematics guidance instead);
+    # returns (simulation steps, success, decisions)
+    agent = agents.Arm(scene_id, angular_velocity_1=angular_velocity, angular_velocity_2=angular_velocity, arm_length_1=arm_length_1, arm_length_2=arm_length_2,
+                       actions=actions)
+    goal = goals.Goal_Arm(scene_id, arm_length_1, arm_length_2)
+    step = 0
+    decisions = 0
+    while step < max_steps:
+        if networks is None:
+            try:
+                action = agent.get_guided_action(goal.pos - agent.pos, action_repeat)
+            except np.linalg.LinAlgError:
+                action = np.random.randint(len(agent.ACTIONS))  # singularity, e.g. stretched arm
+        else:
+            state = np.hstack((agent.get_state(), goal.get_state()))
+            q = networks.online_net.predict(state.reshape(1, len(state)), batch_size=1)
+            action = np.argmax(q)
+        agent.set_action(action)
+        decisions += 1
+        for _ in range(min(action_repeat, max_steps - step)):
+            agent.update()
+            step += 1
+            if np.linalg.norm(agent.get_position() - goal.get_position()) < goal_threshold:
+                return step, True, decisions
+    return max_steps, False, decisions
+
+
+def evaluate_policy(networks, scene_ids=None, **kwargs):
+    # one greedy episode per scenario (the arm is deterministic); optimality gap: decisions / fewest possible
+    # decisions (shortest_paths), for successful episodes only
+    if scene_ids is None:
+        scene_ids = range(len(goals.SCENARIOS))
+    results = {'steps': [], 'success': [], 'decisions': [], 'optimal_decisions': [], 'optimality_gap': [], 'wall_time': []}
+    for scene_id in scene_ids:
+        start = time.time()
+        steps, success, decisions = run_episode(networks, scene_id, **kwargs)
+        results['wall_time'].append(time.time() - start)
+        results['steps'].append(steps)
+        results['success'].append(success)
+        results['decisions'].append(decisions)
+
+        # UNREACHABLE: no lattice path to the goal, so there is no optimum to compare with (not a gap of -1/decisions)
+        optimal = shortest_paths.get_optimal_decisions(scene_id, **kwargs)
+        results['optimal_decisions'].append(optimal)
+        if optimal == shortest_paths.UNREACHABLE or optimal == 0 or not success:
+            results['optimality_gap'].append(np.nan)
+        else:
+            results['optimality_gap'].append(decisions / float(optimal))
+    results['unreachable'] = sum(optimal == shortest_paths.UNREACHABLE for optimal in results['optimal_decisions'])
+    results['success_rate'] = float(np.mean(results['success']))
+    results['mean_steps'] = float(np.mean(results['steps']))
+    results['mean_decisions'] = float(np.mean(results['decisions']))
+    gaps = [gap for gap in results['optimality_gap'] if not np.isnan(gap)]
+    results['mean_optimality_gap'] = float(np.mean(gaps)) if gaps else np.nan
+    return results
+
+
+def measure_latency(function, states, repetitions=1000):
+    # mean seconds per single-state call
+    start = time.time()
+    for i in range(repetitions):
+        function(states[i % len(states)].reshape(1, -1))
+    return (time.time() - start) / repetitions
+
+
+def benchmark_action_sets(action_sets=BENCHMARK_ACTION_SETS, networks=None):
+    # decisions, simulation steps and wall time per episode for (magnitudes, repeat, combined) action sets;
+    # without networks the inverse kinematics guidance stands in for a trained policy of each action set
+    for magnitudes, repeat, combined in action_sets:
+        actions = agents.make_actions(magnitudes, combined)
+        results = evaluate_policy(networks, actions=actions, action_repeat=repeat)
+        print('magnitudes %-8s repeat %d combined %-5s: %2d actions | success rate %.2f | %6.1f decisions (gap %.2f) | %6.1f steps | %.2fms per episode' % (
+            magnitudes, repeat, combined, len(actions), results['success_rate'], results['mean_decisions'], results['mean_optimality_gap'],
+            results['mean_steps'], 1e3*np.mean(results['wall_time'])))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Evaluate the saved online network on all scenarios.')
+    parser.add_argument('--backend', default=q_networks.BACKEND)
+    parser.add_argument('--benchmark-actions', action='store_true', help='compare action sets and repeats with inverse kinematics guidance')
+    args = parser.parse_args()
+
+    if args.benchmark_actions:
+        benchmark_action_sets()
+    else:
+        # shaped like the checkpoint (layer sizes and action table from its model.json)
+        networks = q_networks.load_networks(backend=args.backend, num_of_states=NUM_OF_STATES)
+        results = evaluate_policy(networks, actions=networks.ACTIONS)
+        for scene_id in range(len(results['steps'])):
+            optimal = results['optimal_decisions'][scene_id]
+            print('scenario %d: %3d steps | %3d decisions (optimal %s, gap %.2f) | success: %s | %.2fs' % (
+                scene_id, results['steps'][scene_id], results['decisions'][scene_id], 'unreachable' if optimal == shortest_paths.UNREACHABLE else '%3d' % optimal,
+                results['optimality_gap'][scene_id], results['success'][scene_id], results['wall_time'][scene_id]))
+        print('success rate: %.2f | mean steps: %.1f | mean decisions: %.1f | mean optimality gap: %.2f (%d scenarios unreachable on the lattice)' % (
+            results['success_rate'], results['mean_steps'], results['mean_decisions'], results['mean_optimality_gap'], results['unreachable']))
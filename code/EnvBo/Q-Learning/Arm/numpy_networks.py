@@ -0,0 +1,126 @@
+#!/usr/bin/python
+import numpy as np
+import time
+
+
+LEARNING_RATE = 0.001           # RMSprop defaults of Keras
+MAX_CACHED_BATCH_SIZE = 4096    # larger batches (e.g. offline analysis) get temporary buffers
+RHO = 0.9
+RMS_EPSILON = 1e-8
+
+
+def rmsprop_update(weights, gradients, mean_squares, updates, lr=LEARNING_RATE, rho=RHO, epsilon=RMS_EPSILON):
+    # RMSprop on lists of arrays, in place; updates are preallocated buffers shaped like the weights
+    for w, g, ms, update in zip(weights, gradients, mean_squares, updates):
+        ms *= rho
+        np.square(g, out=update)
+        update *= 1.0 - rho
+        ms += update
+        np.sqrt(ms, out=update)
+        update += epsilon
+        np.divide(g, update, out=update)
+        update *= lr
+        w -= update
+
+
+class NumpyMLP:
+    # dense + ReLU network with a linear output layer, MSE loss and RMSprop;
+    # same surface as the Keras model used in QNetworks (predict, train_on_batch, get_weights, set_weights)
+    def __init__(self, layer_sizes, lr=LEARNING_RATE, rho=RHO, epsilon=RMS_EPSILON):
+        self.LAYER_SIZES = list(layer_sizes)
+        self.NUM_OF_LAYERS = len(self.LAYER_SIZES) - 1
+        self.LR = lr
+        self.RHO = rho
+        self.EPSILON = epsilon
+
+        # glorot uniform kernels + zero biases, like keras.layers.Dense; same order as Keras get_weights()
+        self.weights = []
+        for fan_in, fan_out in zip(self.LAYER_SIZES[:-1], self.LAYER_SIZES[1:]):
+            limit = np.sqrt(6.0 / (fan_in + fan_out))
+            self.weights.append(np.random.uniform(-limit, limit, (fan_in, fan_out)).astype(np.float32))
+            self.weights.append(np.zeros(fan_out, dtype=np.float32))
+
+        # preallocated gradients, RMSprop accumulators and update buffers
+        self.gradients = [np.zeros_like(w) for w in self.weights]
+        self.mean_squares = [np.zeros_like(w) for w in self.weights]
+        self.updates = [np.zeros_like(w) for w in self.weights]
+        self.buffers = {}               # batch size -> (activations, deltas)
+
+    def get_buffers(self, batch_size):
+        buffers = self.buffers.get(batch_size)
+        if buffers is None:
+            activations = [np.empty((batch_size, n), dtype=np.float32) for n in self.LAYER_SIZES[1:]]
+            deltas = [np.empty((batch_size, n), dtype=np.float32) for n in self.LAYER_SIZES[1:]]
+            buffers = (activations, deltas)
+            if batch_size <= MAX_CACHED_BATCH_SIZE:
+                self.buffers[batch_size] = buffers
+        return buffers
+
+    def forward(self, x):
+        activations, deltas = self.get_buffers(len(x))
+        a = x
+        for l in range(self.NUM_OF_LAYERS):
+            np.dot(a, self.weights[2 * l], out=activations[l])
+            activations[l] += self.weights[2 * l + 1]
+            if l < self.NUM_OF_LAYERS - 1:
+                np.maximum(activations[l], 0.0, out=activations[l])
+            a = activations[l]
+        return activations, deltas
+
+    def predict(self, x, batch_size=None):
+        # batch_size is accepted for Keras compatibility; the whole input is one batch
+        activations, _ = self.forward(np.ascontiguousarray(x, dtype=np.float32))
+        return activations[-1].copy()
+
+    def compute_gradients(self, x, y):
+        # fills self.gradients with d MSE / d weights, returns the loss
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        activations, deltas = self.forward(x)
+
+        delta = deltas[-1]
+        np.subtract(activations[-1], y, out=delta)
+        loss = float(np.vdot(delta, delta)) / delta.size
+        delta *= 2.0 / delta.size
+
+        for l in reversed(range(self.NUM_OF_LAYERS)):
+            layer_input = x if l == 0 else activations[l - 1]
+            np.dot(layer_input.T, delta, out=self.gradients[2 * l])
+            np.sum(delta, axis=0, out=self.gradients[2 * l + 1])
+            if l > 0:
+                # back through the ReLU of the previous layer
+                np.dot(delta, self.weights[2 * l].T, out=deltas[l - 1])
+                np.multiply(deltas[l - 1], activations[l - 1] > 0.0, out=deltas[l - 1])
+                delta = deltas[l - 1]
+        return loss
+
+    def apply_gradients(self, gradients):
+        rmsprop_update(self.weights, gradients, self.mean_squares, self.updates, self.LR, self.RHO, self.EPSILON)
+
+    def train_on_batch(self, x, y):
+        loss = self.compute_gradients(x, y)
+        self.apply_gradients(self.gradients)
+        return loss
+
+    def get_weights(self):
+        return [np.copy(w) for w in self.weights]
+
+    def set_weights(self, weights):
+        # copied into the existing arrays, so references to self.weights stay valid
+        for w, new_w in zip(self.weights, weights):
+            w[...] = np.reshape(new_w, w.shape)
+
+
+if __name__ == "__main__":
+    # train_on_batch throughput of both backends on the QNetworks architecture
+    import q_networks
+    num_of_updates = 2000
+    states = np.random.uniform(-1, 1, (64, 6)).astype(np.float32)
+    targets = np.random.uniform(-1, 1, (64, 4)).astype(np.float32)
+    for backend in ['numpy', 'keras']:
+        start = time.time()
+        networks = q_networks.QNetworks(4, 6, backend=backend)
+        setup = time.time() - start
+        start = time.time()
+        for _ in range(num_of_updates):
+            networks.online_net.train_on_batch(states, targets)
+        print('%s: setup %.2fs | %.0f updates/s' % (backend, setup, num_of_updates / (time.time() - start)))
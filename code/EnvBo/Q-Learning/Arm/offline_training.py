@@ -0,0 +1,162 @@
+#!/usr/bin/python
+import argparse
+import numpy as np
+import threading
+import time
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+# import own modules
+import deep_q_learning
+import q_networks
+import replay_memory
+import replay_ratio
+import training_state
+
+
+CHUNK_SIZE = 65536              # transitions read from disk at once
+NUM_OF_EPOCHS = 1
+OFFLINE_SNAPSHOT_DIR = 'offline_training_state'  # not training_state.SNAPSHOT_DIR: keeps the online run's exploration state intact
+REPORT_PERIOD = 10.0            # seconds between two console reports
+SAMPLE_REUSE = 1.0              # minibatch samples drawn per streamed transition
+SHUFFLE_WINDOW = 1000000        # transitions kept in RAM to shuffle within
+
+
+class OfflineReplayStream(threading.Thread):
+    # streams recorded MappedReplayMemory directories chunk by chunk (chunks in random order) into a
+    # shuffle window in RAM and serves minibatches drawn from the window; stands in for the GLOBAL
+    # prefetcher and replay memory of deep_q_learning, so the Learner threads run unchanged
+    def __init__(self, directories, scheduler, batch_size=deep_q_learning.BATCH_SIZE, chunk_size=CHUNK_SIZE, window_size=SHUFFLE_WINDOW,
+                 num_of_epochs=NUM_OF_EPOCHS, sample_reuse=SAMPLE_REUSE, depth=replay_memory.PREFETCH_DEPTH):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.scheduler = scheduler
+        self.BATCH_SIZE = batch_size
+        self.NUM_OF_EPOCHS = num_of_epochs
+        self.SAMPLE_REUSE = sample_reuse
+
+        self.memories = [replay_memory.MappedReplayMemory(directory, read_only=True) for directory in directories]
+        self.chunks = [(memory, start, min(start + chunk_size, memory.size))
+                       for memory in self.memories for start in range(0, memory.size, chunk_size)]
+        self.num_of_recorded = sum(memory.size for memory in self.memories)
+        num_of_states = self.memories[0].states.shape[1]
+
+        # shuffle window, a ring over transitions
+        self.WINDOW_SIZE = min(window_size, self.num_of_recorded)
+        self.states = np.zeros((self.WINDOW_SIZE, num_of_states), dtype=np.float32)
+        self.actions = np.zeros(self.WINDOW_SIZE, dtype=np.int32)
+        self.rewards = np.zeros(self.WINDOW_SIZE, dtype=np.float32)
+        self.next_states = np.zeros((self.WINDOW_SIZE, num_of_states), dtype=np.float32)
+        self.terminals = np.zeros(self.WINDOW_SIZE, dtype=np.float32)
+        self.position = 0
+        self.filled = 0
+
+        self.batches = queue.Queue(maxsize=depth)
+        self.finished = threading.Event()
+
+    def get_buffer_size(self):
+        return self.filled
+
+    def get_report(self):
+        return 'replay: %d of %d recorded transitions in the shuffle window' % (self.filled, self.num_of_recorded)
+
+    def commit(self, checkpoint_step):
+        # recorded data is read only
+        pass
+
+    def get(self):
+        # minibatch, or None once the stream is closed
+        return self.batches.get()
+
+    def close(self, num_of_learners):
+        # one None per learner behind the remaining minibatches, so every learner drains them and then returns
+        for _ in range(num_of_learners):
+            self.batches.put(None)
+
+    def load(self, memory, start, stop):
+        # copy one chunk from disk into the window, wrapping around
+        done = 0
+        while done < stop - start:
+            n = min(stop - start - done, self.WINDOW_SIZE - self.position)
+            source = slice(start + done, start + done + n)
+            target = slice(self.position, self.position + n)
+            self.states[target] = memory.states[source]
+            self.actions[target] = memory.actions[source]
+            self.rewards[target] = memory.rewards[source]
+            self.next_states[target] = memory.next_states[source]
+            self.terminals[target] = memory.terminals[source]
+            self.position = (self.position + n) % self.WINDOW_SIZE
+            done += n
+        self.filled = min(self.filled + done, self.WINDOW_SIZE)
+
+    def run(self):
+        debt = 0.0
+        for epoch in range(self.NUM_OF_EPOCHS):
+            for i in np.random.permutation(len(self.chunks)):
+                memory, start, stop = self.chunks[i]
+                self.load(memory, start, stop)
+                self.scheduler.add_transitions(stop - start)
+
+                debt += (stop - start)*self.SAMPLE_REUSE/self.BATCH_SIZE
+                while debt >= 1.0:
+                    ids = np.random.randint(0, self.filled, self.BATCH_SIZE)
+                    self.batches.put((self.states[ids], self.actions[ids], self.rewards[ids], self.next_states[ids], self.terminals[ids],
+                                      np.ones(self.BATCH_SIZE, dtype=np.int32)))
+                    debt -= 1.0
+        self.finished.set()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Train the Q-networks on recorded replay memories, without actors.')
+    parser.add_argument('directories', nargs='+', help='MappedReplayMemory directories (see REPLAY_DIR)')
+    parser.add_argument('--epochs', type=int, default=NUM_OF_EPOCHS)
+    parser.add_argument('--window', type=int, default=SHUFFLE_WINDOW)
+    parser.add_argument('--chunk', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--reuse', type=float, default=SAMPLE_REUSE)
+    parser.add_argument('--learners', type=int, default=1)
+    parser.add_argument('--backend', default=q_networks.BACKEND)
+    args = parser.parse_args()
+
+    dql = deep_q_learning
+    dql.console_lock = threading.Lock()
+    dql.networks_lock = threading.Lock()
+    dql.replay_lock = threading.Lock()
+    dql.scheduler = replay_ratio.ReplayRatioScheduler(replay_ratio=None, min_samples=0)
+    dql.prefetcher = dql.replay = OfflineReplayStream(args.directories, dql.scheduler, chunk_size=args.chunk, window_size=args.window,
+                                                      num_of_epochs=args.epochs, sample_reuse=args.reuse)
+    dql.networks = q_networks.QNetworks(dql.NUM_OF_ACTIONS, dql.NUM_OF_STATES, backend=args.backend, actions=dql.ACTIONS)
+    dql.actors = []  # snapshots without exploration state; an online run resumes from the pretrained networks
+    dql.SNAPSHOT_DIR = OFFLINE_SNAPSHOT_DIR
+
+    # resume networks, optimizer state and RNG streams; the scheduler counts the streamed data afresh
+    if dql.RESUME and dql.SNAPSHOT_DIR is not None:
+        snapshot = training_state.load_snapshot(dql.SNAPSHOT_DIR)
+        if snapshot is not None:
+            training_state.check_replay(snapshot, dql.replay)
+            training_state.restore_snapshot(snapshot, dql.networks)
+            print('Resumed training state of %s from %s.' % (time.ctime(snapshot[0]['time']), dql.SNAPSHOT_DIR))
+    print('Streaming %d recorded transitions in %d chunks, shuffle window %d.' % (dql.replay.num_of_recorded, len(dql.replay.chunks), dql.replay.WINDOW_SIZE))
+
+    # unchanged learners: target updates and periodic checkpoints included
+    dql.replay.start()
+    learners = [dql.Learner(i) for i in range(args.learners)]
+    for learner in learners:
+        learner.daemon = True
+        learner.start()
+
+    while not dql.replay.finished.wait(REPORT_PERIOD):
+        dql.console_lock.acquire()
+        print(dql.scheduler.get_report())
+        dql.console_lock.release()
+
+    # let the learners drain the last minibatches, then stop and checkpoint
+    dql.replay.close(len(learners))
+    [learner.join(dql.LEARNER_JOIN_TIMEOUT) for learner in learners]
+    dql.scheduler.stop()
+    dql.networks_lock.acquire()
+    dql.networks.save_models()
+    dql.networks_lock.release()
+    dql.commit_checkpoint()
+    print('Finished. ' + dql.scheduler.get_report())
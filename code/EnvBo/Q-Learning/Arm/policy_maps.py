@@ -0,0 +1,92 @@
+#!/usr/bin/python
+import matplotlib
+matplotlib.use('Agg')  # headless: maps are written to files
+import matplotlib.pyplot as plt
+import argparse
+import numpy as np
+import os
+import time
+
+# import own modules
+import agents
+import goals
+import q_networks
+
+
+ARM_LENGTH_1 = 12.0                 # same arm as deep_q_learning
+ARM_LENGTH_2 = 18.0
+GRID_SIZE = 360                     # lattice points per joint (1 degree)
+MAX_BATCH_BYTES = 64*1024**2        # memory cap of one batched forward pass
+OUTPUT_DIR = 'policy_maps'
+
+
+def get_chunk_size(networks, max_bytes=MAX_BATCH_BYTES):
+    # states per forward pass such that inputs and all float32 activations stay below max_bytes
+    bytes_per_state = 4*(networks.NUM_OF_STATES + networks.NUM_OF_HIDDEN_LAYERS*networks.NUM_OF_HIDDEN_NEURONS + networks.NUM_OF_ACTIONS)
+    return max(1, int(max_bytes // bytes_per_state))
+
+
+def compute_q_maps(networks, goal_pos, arm_length_1=ARM_LENGTH_1, arm_length_2=ARM_LENGTH_2, grid_size=GRID_SIZE, max_bytes=MAX_BATCH_BYTES):
+    # Q(s,a) over the joint-angle lattice: (grid_size, grid_size, NUM_OF_ACTIONS), indexed [theta1, theta2]
+    angles = 2.0*np.pi*np.arange(grid_size)/grid_size
+    q_maps = np.empty((grid_size*grid_size, networks.NUM_OF_ACTIONS), dtype=np.float32)
+    chunk_size = get_chunk_size(networks, max_bytes)
+    for start in range(0, grid_size*grid_size, chunk_size):
+        ids = np.arange(start, min(start + chunk_size, grid_size*grid_size))
+        theta = np.column_stack((angles[ids // grid_size], angles[ids % grid_size]))
+        states = agents.get_states(theta, goal_pos, arm_length_1, arm_length_2)
+        q_maps[ids] = networks.online_net.predict(states, batch_size=len(states))
+    return q_maps.reshape(grid_size, grid_size, networks.NUM_OF_ACTIONS)
+
+
+def save_maps(q_maps, output_dir, goal_theta=None, actions=None):
+    # q_maps.npy, value.npy (max_a Q), policy.npy (argmax_a Q) and heatmaps of value and policy
+    value = np.max(q_maps, axis=2)
+    policy = np.argmax(q_maps, axis=2).astype(np.uint8)
+    np.save(os.path.join(output_dir, 'q_maps.npy'), q_maps)
+    np.save(os.path.join(output_dir, 'value.npy'), value)
+    np.save(os.path.join(output_dir, 'policy.npy'), policy)
+
+    extent = [0, 360, 360, 0]
+    fig, ax = plt.subplots(1, 2, figsize=(14, 6))
+    image = ax[0].imshow(value, extent=extent, cmap='viridis')
+    fig.colorbar(image, ax=ax[0])
+    ax[0].set_title('max_a Q(s,a)')
+    num_of_actions = q_maps.shape[2]
+    image = ax[1].imshow(policy, extent=extent, cmap=plt.get_cmap('tab10' if num_of_actions <= 10 else 'tab20', num_of_actions),
+                         vmin=-0.5, vmax=num_of_actions - 0.5, interpolation='nearest')
+    colorbar = fig.colorbar(image, ax=ax[1], ticks=range(num_of_actions))
+    if actions is not None:
+        colorbar.ax.set_yticklabels(['%d %s' % (a, tuple(actions[a])) for a in range(num_of_actions)])
+    ax[1].set_title('argmax_a Q(s,a)')
+    for axis in ax:
+        axis.set_xlabel('theta 2 [deg]')
+        axis.set_ylabel('theta 1 [deg]')
+        if goal_theta is not None:
+            axis.plot(goal_theta[1], goal_theta[0], 'r+', markersize=15, markeredgewidth=2)
+    fig.savefig(os.path.join(output_dir, 'maps.png'), dpi=100)
+    plt.close(fig)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Q-value and greedy-policy maps over all arm configurations for one goal.')
+    parser.add_argument('--scene', type=int, default=0, help='goal of goals.SCENARIOS[scene]')
+    parser.add_argument('--checkpoint', default='.', help='directory containing the %s folder' % q_networks.QNETWORK_NAME)
+    parser.add_argument('--backend', default=q_networks.BACKEND)
+    parser.add_argument('--output', default=OUTPUT_DIR)
+    parser.add_argument('--max-batch-mb', type=float, default=MAX_BATCH_BYTES / 1024.0**2)
+    args = parser.parse_args()
+
+    output_dir = os.path.join(args.output, 'scene%d' % args.scene)
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    networks = q_networks.load_networks(args.checkpoint, backend=args.backend)
+
+    goal = goals.Goal_Arm(args.scene, ARM_LENGTH_1, ARM_LENGTH_2)
+    start = time.time()
+    q_maps = compute_q_maps(networks, goal.pos, max_bytes=args.max_batch_mb*1024**2)
+    elapsed = time.time() - start
+    save_maps(q_maps, output_dir, goal_theta=goals.SCENARIOS[args.scene], actions=networks.ACTIONS)
+    print('%d states x %d actions in %.2fs (%d states per batch), maps in %s' % (
+        q_maps.shape[0]*q_maps.shape[1], q_maps.shape[2], elapsed, get_chunk_size(networks, args.max_batch_mb*1024**2), output_dir))
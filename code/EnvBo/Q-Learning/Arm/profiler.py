@@ -0,0 +1,151 @@
+#!/usr/bin/python
+import argparse
+import collections
+import os
+import re
+import signal
+import sys
+import threading
+import time
+
+
+CONTROL_FILE = 'profiling.on'   # profiling runs while this file exists (touch / rm it next to a running process); None: signal only
+CONTROL_PERIOD = 0.5            # seconds between checks of the control file while not profiling
+DUMP_PERIOD = 60.0              # rewrite the output of a running profile every DUMP_PERIOD, so a killed run keeps its samples
+MAX_DEPTH = 128                 # innermost frames kept per stack
+OUTPUT_DIR = 'profiles'
+SAMPLING_RATE = 100.0           # stack samples per second (all threads at once)
+SIGNAL = getattr(signal, 'SIGUSR1', None)  # toggles profiling; not available on Windows
+
+
+def get_role(thread_name):
+    # 'actor-3' -> 'actor', 'learner-0' -> 'learner'; other names are kept
+    return re.sub(r'-\d+$', '', thread_name)
+
+
+def get_frame_label(frame):
+    code = frame.f_code
+    return '%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+
+
+class SamplingProfiler(threading.Thread):
+    # samples the stacks of all other threads of the process via sys._current_frames and counts them as collapsed
+    # stacks ('role;outer;...;inner count' per line, the input of flamegraph.pl / speedscope), rooted at the thread role;
+    # toggled at runtime by SIGNAL or by creating / removing CONTROL_FILE
+    def __init__(self, sampling_rate=SAMPLING_RATE, output_dir=OUTPUT_DIR, control_file=CONTROL_FILE, max_depth=MAX_DEPTH):
+        threading.Thread.__init__(self, name='profiler')
+        self.daemon = True
+        self.SAMPLING_RATE = sampling_rate
+        self.OUTPUT_DIR = output_dir
+        self.CONTROL_FILE = control_file
+        self.MAX_DEPTH = max_depth
+
+        self.requested = False          # toggled by the signal handler
+        self.counts = collections.Counter()
+        self.num_of_samples = 0
+        self.started = None             # start time of the running profile; None: not profiling
+        self.last_dump = 0.0
+        self.filename = None
+
+    def install_signal_handler(self, signum=SIGNAL):
+        # only possible from the main thread
+        if signum is not None and threading.current_thread().name == 'MainThread':
+            signal.signal(signum, lambda signum, frame: self.toggle())
+
+    def toggle(self):
+        self.requested = not self.requested
+
+    def is_requested(self):
+        return self.requested or (self.CONTROL_FILE is not None and os.path.exists(self.CONTROL_FILE))
+
+    def sample(self):
+        names = dict((thread.ident, thread.name) for thread in threading.enumerate())
+        for ident, frame in sys._current_frames().items():
+            if ident == self.ident:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.MAX_DEPTH:
+                stack.append(get_frame_label(frame))
+                frame = frame.f_back
+            stack.append(get_role(names.get(ident, 'unknown')))
+            self.counts[';'.join(reversed(stack))] += 1
+        self.num_of_samples += 1
+
+    def begin(self):
+        self.counts.clear()
+        self.num_of_samples = 0
+        self.started = time.time()
+        self.last_dump = self.started
+        self.filename = os.path.join(self.OUTPUT_DIR, 'profile-%d-%s.folded' % (os.getpid(), time.strftime('%Y%m%d-%H%M%S')))
+        print('Profiling started (%s).' % self.filename)
+
+    def dump(self):
+        if not os.path.isdir(self.OUTPUT_DIR):
+            os.makedirs(self.OUTPUT_DIR)
+        with open(self.filename + '.tmp', 'w') as output_file:
+            for stack, count in sorted(self.counts.items()):
+                output_file.write('%s %d\n' % (stack, count))
+        os.rename(self.filename + '.tmp', self.filename)  # atomic, readable while profiling continues
+        self.last_dump = time.time()
+
+    def end(self):
+        self.dump()
+        print('Profiling stopped: %d samples in %.1fs (%s).' % (self.num_of_samples, time.time() - self.started, self.filename))
+        self.started = None
+
+    def run(self):
+        while True:
+            requested = self.is_requested()
+            if requested and self.started is None:
+                self.begin()
+            elif not requested and self.started is not None:
+                self.end()
+
+            if self.started is None:
+                time.sleep(CONTROL_PERIOD)
+                continue
+
+            self.sample()
+            if time.time() - self.last_dump > DUMP_PERIOD:
+                self.dump()
+            time.sleep(1.0 / self.SAMPLING_RATE)
+
+
+def start(**kwargs):
+    # profiler thread of this process, idle until toggled
+    profiler = SamplingProfiler(**kwargs)
+    profiler.install_signal_handler()
+    profiler.start()
+    return profiler
+
+
+def summarize(filename, num_of_frames=20):
+    # samples per role and the frames with the most samples on top of the stack (self time)
+    roles = collections.Counter()
+    frames = collections.Counter()
+    with open(filename) as input_file:
+        for line in input_file:
+            stack, count = line.rstrip('\n').rsplit(' ', 1)
+            stack = stack.split(';')
+            roles[stack[0]] += int(count)
+            frames[(stack[0], stack[-1])] += int(count)
+    total = float(sum(roles.values()))
+    for role, count in roles.most_common():
+        print('%-20s %6.1f%%' % (role, 100.0*count / total))
+    print('')
+    for (role, frame), count in frames.most_common(num_of_frames):
+        print('%6.1f%%  %-12s %s' % (100.0*count / total, role, frame))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Toggle the sampling profiler of a running process or summarize a profile.')
+    parser.add_argument('--pid', type=int, help='send SIGUSR1 to this process (starts / stops profiling); '
+                        'only for processes that called profiler.start(), SIGUSR1 kills a process without the handler')
+    parser.add_argument('--summary', help='collapsed-stack profile to summarize')
+    parser.add_argument('--top', type=int, default=20)
+    args = parser.parse_args()
+
+    if args.pid is not None:
+        os.kill(args.pid, SIGNAL)
+    if args.summary:
+        summarize(args.summary, args.top)
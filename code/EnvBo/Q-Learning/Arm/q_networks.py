@@ -1,32 +1,90 @@
 #!/usr/bin/python
+import json
 import numpy as np
 import os
 import sys
 
-from keras.layers import Activation, Dense, Input 
-from keras.layers.normalization import BatchNormalization
-from keras.models import Model, Sequential
-from keras.optimizers import RMSprop
+# import own modules
+import numpy_networks
 
+# NOTE: keras is imported lazily, only the 'keras' backend pays for it
 
 
+BACKEND = 'keras'                    # 'keras' or 'numpy' (numpy_networks.NumpyMLP)
+LEGACY_ACTIONS = [(-1, 0), (1, 0), (0, -1), (0, 1)]  # action table of checkpoints saved without model info
+MODEL_INFO_NAME = 'model.json'       # saved next to the weights: action table and layer sizes
+NUM_OF_HIDDEN_LAYERS = 3
 NUM_OF_HIDDEN_NEURONS = 100
 QNETWORK_NAME = 'online_network'
 TARGETNET_NAME = 'target_network'
 TAU = 0.0001                         # soft update / low pass filter
 
 
+def load_model_info(net_name=QNETWORK_NAME):
+    # action table and layer sizes of a saved network; {} for checkpoints saved before model info existed
+    filename = os.path.join(net_name, MODEL_INFO_NAME)
+    if not os.path.isfile(filename):
+        return {}
+    with open(filename) as info_file:
+        return json.load(info_file)
+
+
+def load_networks(model_dir='.', backend=BACKEND, num_of_states=6, tau=TAU):
+    # QNetworks shaped like the checkpoint in model_dir (old checkpoints: the original 4-action layout)
+    info = load_model_info(os.path.join(model_dir, QNETWORK_NAME))
+    actions = info.get('actions', LEGACY_ACTIONS)
+    return QNetworks(len(actions), info.get('num_of_states', num_of_states), num_of_hidden_neurons=info.get('num_of_hidden_neurons', NUM_OF_HIDDEN_NEURONS),
+                     tau=tau, backend=backend, actions=actions, num_of_hidden_layers=info.get('num_of_hidden_layers', NUM_OF_HIDDEN_LAYERS), model_dir=model_dir)
+
+
+def build_model(num_of_states, num_of_actions, num_of_hidden_neurons=NUM_OF_HIDDEN_NEURONS, num_of_hidden_layers=NUM_OF_HIDDEN_LAYERS, backend=BACKEND):
+    # freshly initialized network, nothing loaded from disk
+    if backend == 'numpy':
+        return numpy_networks.NumpyMLP([num_of_states] + [num_of_hidden_neurons]*num_of_hidden_layers + [num_of_actions])
+
+    from keras.layers import Activation, Dense
+    from keras.models import Sequential
+
+    model = Sequential()
+
+    model.add(Dense(num_of_hidden_neurons, input_shape=(num_of_states,)))
+    model.add(Activation('relu'))
+
+    for _ in range(num_of_hidden_layers - 1):
+        model.add(Dense(num_of_hidden_neurons))
+        model.add(Activation('relu'))
+
+    model.add(Dense(num_of_actions))
+    model.add(Activation('linear'))
+
+    model.compile(loss='mse', optimizer='rmsprop')
+    return model
+
+
 class QNetworks:
-    def __init__(self, num_of_actions, num_of_states, num_of_hidden_neurons=NUM_OF_HIDDEN_NEURONS, tau=TAU): 
+    def __init__(self, num_of_actions, num_of_states, num_of_hidden_neurons=NUM_OF_HIDDEN_NEURONS, tau=TAU, backend=BACKEND, actions=None,
+                 num_of_hidden_layers=NUM_OF_HIDDEN_LAYERS, model_dir='.'): 
+        self.ACTIONS = None if actions is None else [tuple(action) for action in actions]  # agents.make_actions table of the outputs
+        self.BACKEND = backend
+        self.MODEL_DIR = model_dir                  # contains the QNETWORK_NAME and TARGETNET_NAME folders (None: fresh networks, nothing loaded)
         self.NUM_OF_ACTIONS = num_of_actions
+        self.NUM_OF_HIDDEN_LAYERS = num_of_hidden_layers
         self.NUM_OF_HIDDEN_NEURONS = num_of_hidden_neurons
         self.NUM_OF_STATES = num_of_states
         self.TAU = tau
 
         self.online_net = self.init_model(QNETWORK_NAME)
-        self.target_net = self.init_model(QNETWORK_NAME)
+        self.target_net = self.init_model(TARGETNET_NAME, fallback_name=QNETWORK_NAME)
+        self.pair_net = self.init_pair_model()
 
     def do_soft_update(self):
+        if self.BACKEND == 'numpy':
+            # in place, without copying the weights
+            for weights, target_weights in zip(self.online_net.weights, self.target_net.weights):
+                target_weights *= 1.0-self.TAU
+                target_weights += self.TAU*weights
+            return
+
         weights = self.online_net.get_weights()
         target_weights = self.target_net.get_weights()
         for i in xrange(len(weights)):
@@ -42,46 +100,119 @@ class QNetworks:
         self.target_net.set_weights(target_weights)
         return
 
+    def predict_pair(self, states, next_states):
+        # fused forward pass: Q(s,a,theta) and Q(s',a,theta^-) in one call
+        if self.pair_net is None:
+            return self.online_net.predict(states), self.target_net.predict(next_states)
+        return self.pair_net.predict([states, next_states], batch_size=len(states))
+
     def get_weights(self):
         # get weights of the online Q network
         return self.online_net.get_weights()
 
-    def init_model(self, net_name):
-        model = Sequential()
-
-        model.add(Dense(self.NUM_OF_HIDDEN_NEURONS, input_shape=(self.NUM_OF_STATES,)))
-        model.add(Activation('relu'))
-
-        model.add(Dense(self.NUM_OF_HIDDEN_NEURONS))
-        model.add(Activation('relu'))
-
-        model.add(Dense(self.NUM_OF_HIDDEN_NEURONS))
-        model.add(Activation('relu'))
-
-        model.add(Dense(self.NUM_OF_ACTIONS))
-        model.add(Activation('linear'))
-
-        model.compile(loss='mse', optimizer='rmsprop')
-
-        filename = net_name+'/'+net_name
+    def get_optimizer_state(self):
+        # RMSprop accumulators of the online network (the target network is not trained)
+        if self.BACKEND == 'numpy':
+            return [np.copy(mean_squares) for mean_squares in self.online_net.mean_squares]
+        return self.online_net.optimizer.get_weights()
+
+    def set_optimizer_state(self, optimizer_state):
+        if self.BACKEND == 'numpy':
+            for mean_squares, saved_mean_squares in zip(self.online_net.mean_squares, optimizer_state):
+                mean_squares[...] = np.reshape(saved_mean_squares, mean_squares.shape)
+            return
+        if len(optimizer_state) == 0:
+            return # saved before the first update
+        if len(self.online_net.optimizer.weights) == 0:
+            self.online_net._make_train_function() # Keras creates the optimizer weights with the training function
+        self.online_net.optimizer.set_weights(optimizer_state)
+
+    def init_model(self, net_name, fallback_name=None):
+        # fallback_name: checkpoint to load if net_name was not saved (old checkpoints: target from online network)
+        model = build_model(self.NUM_OF_STATES, self.NUM_OF_ACTIONS, self.NUM_OF_HIDDEN_NEURONS, self.NUM_OF_HIDDEN_LAYERS, self.BACKEND)
+        if self.MODEL_DIR is None:
+            return model
+
+        if fallback_name is not None and not os.path.isfile(os.path.join(self.MODEL_DIR, net_name, net_name)+str(0)+'.txt'):
+            net_name = fallback_name
+        filename = os.path.join(self.MODEL_DIR, net_name, net_name)
         if os.path.isfile(filename+str(0)+'.txt'):
+            # checkpoint of another architecture: refuse it instead of loading mismatched weights
+            info = load_model_info(os.path.join(self.MODEL_DIR, net_name))
+            mismatches = ['%s %s (expected %s)' % (key, info[key], getattr(self, key.upper())) for key in ['num_of_states', 'num_of_hidden_layers', 'num_of_hidden_neurons']
+                          if key in info and info[key] != getattr(self, key.upper())]
+            if len(mismatches) > 0:
+                raise ValueError('%s was saved with %s; build the networks with q_networks.load_networks' % (filename, ', '.join(mismatches)))
+
             weights = model.get_weights()
+            shapes = [np.shape(w) for w in weights]
             for i in xrange(len(weights)):
                 loaded_weights = np.loadtxt(filename+str(i)+'.txt')
                 weights[i] = loaded_weights
+
+            # checkpoint of another action table (e.g. an old 4-action one): map its outputs onto ours
+            saved_actions = info.get('actions', LEGACY_ACTIONS)
+            saved_actions = [tuple(action) for action in saved_actions]
+            if np.size(weights[-1]) != len(saved_actions):
+                raise ValueError('%s has %d outputs, but its action table has %d actions (no %s?)' % (filename, np.size(weights[-1]), len(saved_actions), MODEL_INFO_NAME))
+            if self.ACTIONS is not None and saved_actions != self.ACTIONS:
+                weights[-2], weights[-1] = self.map_output_layer(weights[-2], weights[-1], saved_actions)
+                print 'Mapped', filename, 'from', len(saved_actions), 'to', len(self.ACTIONS), 'actions.'
+            for i, shape in enumerate(shapes):
+                if np.size(weights[i]) != np.prod(shape):
+                    raise ValueError('%s%d.txt has %d weights, expected shape %s' % (filename, i, np.size(weights[i]), shape))
+                weights[i] = np.reshape(weights[i], shape)
             model.set_weights(weights)
         else:
             print 'No model', filename, 'found. Creating a new model.'
 
         return model
 
-    def save_models(self):
-        weights = self.online_net.get_weights()
-        for i in xrange(len(weights)):
-            np.savetxt(QNETWORK_NAME+'/'+QNETWORK_NAME+str(i)+'.txt', weights[i])
-
-        weights = self.target_net.get_weights()
-        for i in xrange(len(weights)):
-            np.savetxt(TARGETNET_NAME+'/'+TARGETNET_NAME+str(i)+'.txt', weights[i])
+    def map_output_layer(self, W, b, saved_actions):
+        # output units of actions in both tables are copied; a new combined action (a, b) starts from the mean
+        # of its single-joint parts (a, 0) and (0, b), anything else (e.g. the no-op) from the mean of all outputs
+        W = np.reshape(W, (-1, len(saved_actions)))
+        columns = []
+        for action in self.ACTIONS:
+            if action in saved_actions:
+                parts = [saved_actions.index(action)]
+            else:
+                parts = [saved_actions.index(part) for part in [(action[0], 0), (0, action[1])] if part != (0, 0) and part in saved_actions]
+                if len(parts) == 0:
+                    parts = list(range(len(saved_actions)))
+            columns.append(parts)
+        return (np.stack([np.mean(W[:, parts], axis=1) for parts in columns], axis=1),
+                np.array([np.mean(b[parts]) for parts in columns]))
+
+    def init_pair_model(self):
+        # shares the layers (and thus the weights) of the online and the target network
+        if self.BACKEND == 'numpy':
+            return None # no graph dispatch to save; predict_pair calls both networks
+        from keras.layers import Input
+        from keras.models import Model
+
+        states = Input(shape=(self.NUM_OF_STATES,))
+        next_states = Input(shape=(self.NUM_OF_STATES,))
+        return Model([states, next_states], [self.online_net(states), self.target_net(next_states)])
+
+    def save_models(self, model_dir=None):
+        # to MODEL_DIR, or to another checkpoint directory (e.g. an exported copy)
+        model_dir = self.MODEL_DIR if model_dir is None else model_dir
+        if model_dir is None:
+            raise ValueError('networks built without a model_dir need one to save to')
+        info = {'num_of_states': self.NUM_OF_STATES, 'num_of_hidden_layers': self.NUM_OF_HIDDEN_LAYERS,
+                'num_of_hidden_neurons': self.NUM_OF_HIDDEN_NEURONS, 'num_of_actions': self.NUM_OF_ACTIONS}
+        if self.ACTIONS is not None:
+            info['actions'] = self.ACTIONS
+        for net_name, net in [(QNETWORK_NAME, self.online_net), (TARGETNET_NAME, self.target_net)]:
+            directory = os.path.join(model_dir, net_name)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            with open(os.path.join(directory, MODEL_INFO_NAME), 'w') as info_file:
+                json.dump(info, info_file)
+
+            weights = net.get_weights()
+            for i in xrange(len(weights)):
+                np.savetxt(os.path.join(directory, net_name+str(i)+'.txt'), weights[i])
 
         print("Saved models to disk.")
\ No newline at end of file
@@ -0,0 +1,150 @@
+#!/usr/bin/python
+import argparse
+import numpy as np
+import os
+
+# import own modules
+import agents
+import evaluation
+import goals
+import q_networks
+
+
+ACTIVATION_PERCENTILE = 99.99       # of |activation| per channel on the calibration states, mapped to 127
+ARM_LENGTH_1 = 12.0                 # same arm as deep_q_learning
+ARM_LENGTH_2 = 18.0
+NUM_OF_CALIBRATION_STATES = 10000
+NUM_OF_STATES = 6
+QUANTIZED_NAME = 'policy_int8.npz'
+
+
+def sample_states(num_of_states, arm_length_1=ARM_LENGTH_1, arm_length_2=ARM_LENGTH_2):
+    # arm states on the 1 degree lattice combined with the goals of all SCENARIOS
+    states = np.zeros((num_of_states, NUM_OF_STATES), dtype=np.float32)
+    for i in range(num_of_states):
+        scene_id = np.random.randint(len(goals.SCENARIOS))
+        arm = agents.Arm(scene_id, arm_length_1=arm_length_1, arm_length_2=arm_length_2)
+        arm.theta = np.pi * np.random.randint(0, 360, 2) / 180.0
+        arm.pos = arm.get_end_effector_position()
+        goal = goals.Goal_Arm(scene_id, arm_length_1, arm_length_2)
+        states[i] = np.hstack((arm.get_state(), goal.get_state()))
+    return states
+
+
+def float_forward(weights, states):
+    # reference forward pass of the QNetworks architecture (dense + ReLU, linear output)
+    x = states
+    for l in range(0, len(weights), 2):
+        x = np.dot(x, weights[l]) + weights[l + 1]
+        if l < len(weights) - 2:
+            x = np.maximum(x, 0.0)
+    return x
+
+
+def get_activation_scales(x, percentile=ACTIVATION_PERCENTILE):
+    # int8 step per channel (column) of an activation tensor; a high percentile of |x| instead of the max,
+    # so rare outliers do not coarsen the step of all other values
+    return np.maximum(np.percentile(np.abs(x), percentile, axis=0), 1e-8) / 127.0
+
+
+def split_output_layer(W, b):
+    # Q_a = h.w_mean + h.(w_a - w_mean): the Q-values of all actions share a large common part and differ by
+    # little, so the shared column and the small differences get their own int8 scales (see QuantizedPolicy.predict)
+    w_mean = np.mean(W, axis=1, keepdims=True)
+    return np.hstack((w_mean, W - w_mean)), np.hstack(([0.0], b)).astype(np.float32)
+
+
+def quantize(weights, calibration_states, percentile=ACTIVATION_PERCENTILE):
+    # symmetric int8 with one scale per input channel of every layer (from the calibration states, folded into the
+    # weight rows) and one scale per output channel (column) of every weight matrix
+    weights = list(weights[:-2]) + list(split_output_layer(weights[-2], weights[-1]))
+    input_scales = []
+    x = calibration_states
+    for l in range(0, len(weights), 2):
+        input_scales.append(get_activation_scales(x, percentile))
+        x = np.dot(x, weights[l]) + weights[l + 1]
+        if l < len(weights) - 2:
+            x = np.maximum(x, 0.0)
+
+    model = {'input_scales': input_scales[0].astype(np.float32), 'num_of_layers': np.int32(len(weights) // 2)}
+    for i, l in enumerate(range(0, len(weights), 2)):
+        scaled_weights = input_scales[i][:, None] * weights[l]  # acts on the int8 inputs
+        accumulator_scales = np.maximum(np.max(np.abs(scaled_weights), axis=0), 1e-8) / 127.0
+        model['weights_%d' % i] = np.clip(np.round(scaled_weights / accumulator_scales), -127, 127).astype(np.int8)
+        model['biases_%d' % i] = np.round(weights[l + 1] / accumulator_scales).astype(np.int32)
+        if i + 1 < len(input_scales):
+            # int32 accumulator -> int8 input of the next layer
+            model['multipliers_%d' % i] = (accumulator_scales / input_scales[i + 1]).astype(np.float32)
+        else:
+            model['output_scales'] = accumulator_scales.astype(np.float32)
+    return model
+
+
+class QuantizedPolicy:
+    # int8 weights and activations, accumulated in float32 so that np.dot runs on BLAS (numpy has no fast
+    # integer matrix product); the int8 values and their sums (< 2**24 for these layer sizes) are exact in float32.
+    # Only needs numpy, e.g. next to the robot arm
+    def __init__(self, model):
+        if isinstance(model, str):
+            model = dict(np.load(model))
+        self.NUM_OF_LAYERS = int(model['num_of_layers'])
+        self.input_scales = model['input_scales']
+        self.weights = [model['weights_%d' % i].astype(np.float32) for i in range(self.NUM_OF_LAYERS)]
+        self.biases = [model['biases_%d' % i].astype(np.float32) for i in range(self.NUM_OF_LAYERS)]
+        self.multipliers = [model['multipliers_%d' % i] for i in range(self.NUM_OF_LAYERS - 1)]
+        self.output_scales = model['output_scales']
+
+    def predict(self, states):
+        # dequantized Q-values: shared column + per-action differences (split_output_layer)
+        x = np.clip(np.round(np.asarray(states, dtype=np.float32) / self.input_scales), -127, 127)
+        for i in range(self.NUM_OF_LAYERS):
+            acc = np.dot(x, self.weights[i])
+            acc += self.biases[i]
+            if i == self.NUM_OF_LAYERS - 1:
+                acc *= self.output_scales
+                return acc[:, :1] + acc[:, 1:]
+            # ReLU + requantization; ReLU outputs are non-negative, so they fit [0, 127]
+            acc *= self.multipliers[i]
+            x = np.clip(np.round(acc, out=acc), 0, 127, out=acc)
+
+    def get_action(self, state):
+        return int(np.argmax(self.predict(np.reshape(state, (1, -1)))))
+
+
+def get_size(path_or_dir):
+    if os.path.isdir(path_or_dir):
+        return sum(os.path.getsize(os.path.join(path_or_dir, name)) for name in os.listdir(path_or_dir))
+    return os.path.getsize(path_or_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Export the online network as an int8 quantized policy.')
+    parser.add_argument('--states', help='.npy file of recorded states used for calibration (default: sampled lattice states)')
+    parser.add_argument('--output', default=QUANTIZED_NAME)
+    args = parser.parse_args()
+
+    networks = q_networks.load_networks(backend='numpy', num_of_states=NUM_OF_STATES)
+    weights = [w.astype(np.float32) for w in networks.online_net.get_weights()]
+
+    if args.states:
+        states = np.load(args.states).astype(np.float32)
+    else:
+        states = sample_states(NUM_OF_CALIBRATION_STATES)
+    calibration_states, evaluation_states = states[:len(states) // 2], states[len(states) // 2:]
+
+    np.savez(args.output, **quantize(weights, calibration_states))
+    policy = QuantizedPolicy(args.output)
+
+    float_q = float_forward(weights, evaluation_states)
+    quantized_q = policy.predict(evaluation_states)
+    agreement = np.mean(np.argmax(quantized_q, axis=1) == np.argmax(float_q, axis=1))
+    print('argmax agreement with the float model: %.2f%% (%d held-out states)' % (100.0 * agreement, len(evaluation_states)))
+    print('median |Q error|: %.4f | median Q gap between the two best actions: %.4f' % (
+        np.median(np.abs(quantized_q - float_q)), np.median(np.diff(np.sort(float_q, axis=1)[:, -2:], axis=1))))
+    print('model size: %d bytes (float text files: %d bytes)' % (get_size(args.output), get_size(q_networks.QNETWORK_NAME)))
+    int8_latency = evaluation.measure_latency(policy.predict, evaluation_states)
+    float_latency = evaluation.measure_latency(lambda x: float_forward(weights, x), evaluation_states)
+    print('latency per step: int8 %.1fus | float %.1fus (%.2fx)' % (1e6 * int8_latency, 1e6 * float_latency, float_latency / int8_latency))
+    if int8_latency >= float_latency:
+        print('NOTE: the int8 export only shrinks the model (%.0fx); with numpy it is not faster than the float path, '
+              'single-state calls are dominated by per-call overhead and requantization adds calls' % (get_size(q_networks.QNETWORK_NAME) / float(get_size(args.output))))
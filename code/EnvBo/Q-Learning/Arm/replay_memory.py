@@ -1,11 +1,27 @@
 #!/usr/bin/python
 import collections
 import numpy as np
+import os
 import sys
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
 
+ACTION_REPEAT = 1               # simulation substeps per action; > 1 with HER stores the intermediate positions
 BATCH_SIZE = 64
 BUFFER_SIZE = 1000000
+GAMMA = 0.5                     # discount of n-step returns; same as the learners'
+GOAL_COLUMNS = slice(4, 6)      # normalized goal position in the state (Goal_Arm.get_state)
+GOAL_THRESHOLD = 0.02
+HER_RATIO = 0.8                 # share of sampled transitions relabeled with an achieved goal
+N_STEPS = 1                     # rewards summed per sampled transition (EpisodeReplayMemory)
+NUM_OF_STATES = 6
+POSITION_COLUMNS = slice(0, 2)  # normalized end-effector position in the state (Arm.get_state)
+PREFETCH_DEPTH = 4      # ready minibatches kept by the prefetcher; small, so batches do not go stale
+REPLAY_BYTES = 256*1024**2      # memory budget of EpisodeReplayMemory
 
 
 class ReplayMemory:
@@ -24,6 +40,266 @@ class ReplayMemory:
             ids = np.random.choice(np.arange(self.size), number_of_samples)
             return np.array([self.buffer[i] for i in ids])
 
+    def get_minibatch(self, number_of_samples=BATCH_SIZE):
+        # like get_minibatch_samples, but as contiguous (states, actions, rewards, next_states, terminals, horizons) arrays;
+        # horizons: steps between state and next_state, always 1 here
+        ids = np.random.randint(0, self.size, number_of_samples)
+        samples = [self.buffer[i] for i in ids]
+        states = np.array([sample[0] for sample in samples], dtype=np.float32)
+        actions = np.array([sample[1] for sample in samples], dtype=np.int32)
+        rewards = np.array([sample[2] for sample in samples], dtype=np.float32)
+        next_states = np.array([sample[3] for sample in samples], dtype=np.float32)
+        terminals = np.array([sample[4] for sample in samples], dtype=np.float32)
+        return states, actions, rewards, next_states, terminals, np.ones(number_of_samples, dtype=np.int32)
+
     def add_sample(self, sample):
         self.buffer.append(sample)
-        self.size = len(self.buffer)
\ No newline at end of file
+        self.size = len(self.buffer)
+
+    def get_report(self):
+        return 'replay: %d transitions' % self.size
+
+    def commit(self, checkpoint_step):
+        # nothing is persisted
+        pass
+
+
+class MappedReplayMemory:
+    # ring buffer in memory-mapped files (one per column) plus a small header; a restarted run reattaches
+    # without loading the data. commit() flushes the data and records the fill level together with the
+    # checkpoint step, a reattached buffer continues from the last commit.
+    HEADER_FIELDS = ['magic', 'capacity', 'num_of_states', 'position', 'size', 'checkpoint_step']
+    MAGIC = 0x52504c59  # 'RPLY'
+
+    def __init__(self, directory, max_size=BUFFER_SIZE, num_of_states=NUM_OF_STATES, read_only=False):
+        header_file = os.path.join(directory, 'header.i64')
+        reattach = os.path.isfile(header_file)
+        if read_only and not reattach:
+            raise IOError('No replay memory in %s' % directory)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        if read_only:
+            mode = 'r'
+        else:
+            mode = 'r+' if reattach else 'w+'
+        self.header = np.memmap(header_file, dtype=np.int64, mode=mode, shape=(len(self.HEADER_FIELDS),))
+        if reattach:
+            if self.header[0] != self.MAGIC:
+                raise ValueError('%s is not a replay memory header' % header_file)
+            max_size, num_of_states = int(self.header[1]), int(self.header[2])
+        else:
+            self.header[:3] = [self.MAGIC, max_size, num_of_states]
+
+        column = lambda name, dtype, shape: np.memmap(os.path.join(directory, name), dtype=dtype, mode=mode, shape=shape)
+        self.states = column('states.f32', np.float32, (max_size, num_of_states))
+        self.actions = column('actions.i32', np.int32, (max_size,))
+        self.rewards = column('rewards.f32', np.float32, (max_size,))
+        self.next_states = column('next_states.f32', np.float32, (max_size, num_of_states))
+        self.terminals = column('terminals.f32', np.float32, (max_size,))
+
+        self.MAX_SIZE = max_size
+        self.position = int(self.header[3])    # next slot to write
+        self.size = int(self.header[4])
+        self.checkpoint_step = int(self.header[5])
+        if reattach:
+            print('Reattached replay memory %s: %d samples, checkpoint step %d.' % (directory, self.size, self.checkpoint_step))
+
+    def get_buffer_size(self):
+        return self.size
+
+    def get_minibatch_samples(self, number_of_samples=BATCH_SIZE):
+        # rows of [state, action, reward, next_state, terminal], like ReplayMemory
+        if self.size<BATCH_SIZE:
+            return None
+        states, actions, rewards, next_states, terminals = self.get_minibatch(number_of_samples)[:5]
+        return np.array([[states[i], actions[i], rewards[i], next_states[i], terminals[i]] for i in range(number_of_samples)])
+
+    def get_minibatch(self, number_of_samples=BATCH_SIZE):
+        ids = np.sort(np.random.randint(0, self.size, number_of_samples))  # sorted: friendlier page access
+        return (np.ascontiguousarray(self.states[ids]), self.actions[ids], self.rewards[ids],
+                np.ascontiguousarray(self.next_states[ids]), self.terminals[ids], np.ones(number_of_samples, dtype=np.int32))
+
+    def add_sample(self, sample):
+        i = self.position
+        self.states[i] = sample[0]
+        self.actions[i] = sample[1]
+        self.rewards[i] = sample[2]
+        self.next_states[i] = sample[3]
+        self.terminals[i] = sample[4]
+        self.position = (i + 1) % self.MAX_SIZE
+        self.size = min(self.size + 1, self.MAX_SIZE)
+
+    def get_report(self):
+        num_of_bytes = sum(column.nbytes for column in [self.states, self.actions, self.rewards, self.next_states, self.terminals])
+        return 'replay: %d transitions | %.1f MB mapped' % (self.size, num_of_bytes / 1024.0**2)
+
+    def commit(self, checkpoint_step):
+        # data first, then the header, so the header never points at unwritten samples
+        for column in [self.states, self.actions, self.rewards, self.next_states, self.terminals]:
+            column.flush()
+        self.checkpoint_step = checkpoint_step
+        self.header[3:] = [self.position, self.size, checkpoint_step]
+        self.header.flush()
+
+
+class EpisodeReplayMemory:
+    # ring of slots, filled episode by episode: a slot holds one observation and, unless it is the last one of
+    # its episode, the transition to the observation in the next slot. Every observation is stored once, in
+    # float32, and the capacity follows from a byte budget. get_minibatch relabels a share (her_ratio) of
+    # the sampled transitions with a goal the arm achieved at the same or a later step of its episode
+    # (hindsight experience replay, 'future' strategy) and recomputes reward and terminal like
+    # Actor.get_reward and Actor.episode_finished, so missed goals still teach how to reach some goal.
+    # With n_steps > 1, rewards are discounted n-step returns computed from the contiguous episodes.
+    # With action_repeat > 1, samples carry the positions of the substeps before next_state (NaN after
+    # the goal ended the action early), so relabeled rewards are summed over substeps like Actor.take_action.
+    def __init__(self, max_bytes=REPLAY_BYTES, num_of_states=NUM_OF_STATES, her_ratio=HER_RATIO, goal_threshold=GOAL_THRESHOLD,
+                 n_steps=N_STEPS, gamma=GAMMA, action_repeat=ACTION_REPEAT):
+        self.NUM_OF_SUBSTEPS = action_repeat - 1 if her_ratio > 0 else 0   # stored intermediate positions per transition
+        self.BYTES_PER_SLOT = 4*num_of_states + 1 + 4 + 1 + 4 + 4*2*self.NUM_OF_SUBSTEPS
+        self.MAX_SIZE = int(max_bytes // self.BYTES_PER_SLOT)
+        self.observations = np.zeros((self.MAX_SIZE, num_of_states), dtype=np.float32)
+        self.actions = np.zeros(self.MAX_SIZE, dtype=np.uint8)
+        self.rewards = np.zeros(self.MAX_SIZE, dtype=np.float32)
+        self.terminals = np.zeros(self.MAX_SIZE, dtype=np.uint8)
+        self.remaining = np.full(self.MAX_SIZE, -1, dtype=np.int32)   # transitions after this one in its episode; -1: no transition
+        self.substeps = np.zeros((self.MAX_SIZE, self.NUM_OF_SUBSTEPS, 2), dtype=np.float32)
+
+        self.HER_RATIO = her_ratio
+        self.GOAL_THRESHOLD = goal_threshold
+        self.N_STEPS = n_steps
+        self.discounts = gamma**np.arange(n_steps, dtype=np.float32)
+        self.num_of_slots = 0   # slot number of the next observation; index = slot number % MAX_SIZE
+        self.num_of_transitions = 0
+        self.size = 0           # filled slots
+
+    def get_buffer_size(self):
+        return self.num_of_transitions
+
+    def get_memory_usage(self):
+        # (bytes in use, bytes budgeted)
+        return self.size*self.BYTES_PER_SLOT, self.MAX_SIZE*self.BYTES_PER_SLOT
+
+    def get_report(self):
+        used, budget = self.get_memory_usage()
+        return 'replay: %d transitions in %d observations | %.1f of %.1f MB (%d bytes per transition)' % (
+            self.num_of_transitions, self.size, used / 1024.0**2, budget / 1024.0**2, used // max(self.num_of_transitions, 1))
+
+    def add_episode(self, samples):
+        # [state, action, reward, next_state, terminal(, substep positions)] rows of one episode, in order;
+        # n transitions, n + 1 observations
+        samples = samples[-(self.MAX_SIZE - 1):]
+        n = len(samples)
+        ids = (self.num_of_slots + np.arange(n + 1)) % self.MAX_SIZE
+        self.num_of_transitions -= np.count_nonzero(self.remaining[ids] >= 0)
+
+        self.observations[ids[:n]] = [sample[0] for sample in samples]
+        self.observations[ids[n]] = samples[-1][3]
+        self.actions[ids[:n]] = [sample[1] for sample in samples]
+        self.rewards[ids[:n]] = [sample[2] for sample in samples]
+        self.terminals[ids[:n]] = [sample[4] for sample in samples]
+        self.remaining[ids[:n]] = np.arange(n - 1, -1, -1)
+        self.remaining[ids[n]] = -1
+        if self.NUM_OF_SUBSTEPS > 0:
+            if any(len(sample) < 6 for sample in samples):
+                raise ValueError('hindsight replay with action repeat needs the substep positions of every sample')
+            self.substeps[ids[:n]] = [np.reshape(sample[5], (self.NUM_OF_SUBSTEPS, 2)) for sample in samples]
+
+        self.num_of_slots += n + 1
+        self.num_of_transitions += n
+        self.size = min(self.size + n + 1, self.MAX_SIZE)
+
+    def add_sample(self, sample):
+        # a transition without its episode, relabeled with its own achieved goal only
+        self.add_episode([sample])
+
+    def get_minibatch_samples(self, number_of_samples=BATCH_SIZE):
+        # rows of [state, action, reward, next_state, terminal], like ReplayMemory
+        if self.num_of_transitions<BATCH_SIZE:
+            return None
+        states, actions, rewards, next_states, terminals = self.get_minibatch(number_of_samples)[:5]
+        return np.array([[states[i], actions[i], rewards[i], next_states[i], terminals[i]] for i in range(number_of_samples)])
+
+    def get_minibatch(self, number_of_samples=BATCH_SIZE):
+        # rewards are returns over the next horizons (<= N_STEPS) steps and next_states lie horizons steps
+        # ahead; a window ends early at a terminal or at the end of its episode (then bootstrapped from there)
+        first = self.num_of_slots - self.size
+        steps = np.random.randint(first, self.num_of_slots, number_of_samples)
+        remaining = self.remaining[steps % self.MAX_SIZE]
+        missed = np.flatnonzero(remaining < 0)
+        while len(missed) > 0:
+            # drew the last observation of an episode; draw again
+            steps[missed] = np.random.randint(first, self.num_of_slots, len(missed))
+            remaining[missed] = self.remaining[steps[missed] % self.MAX_SIZE]
+            missed = missed[remaining[missed] < 0]
+        ids = steps % self.MAX_SIZE
+        ends = steps + remaining
+        states, actions = self.observations[ids], self.actions[ids].astype(np.int32)
+
+        # steps of the windows, (number_of_samples, N_STEPS); slots of overwritten episode starts are gone,
+        # but all later slots of a sampled step's episode are still valid
+        window = steps[:, None] + np.arange(self.N_STEPS)
+        inside = window <= ends[:, None]
+        window_ids = np.minimum(window, ends[:, None]) % self.MAX_SIZE
+        rewards = self.rewards[window_ids]
+        terminals = self.terminals[window_ids].astype(np.float32)
+
+        relabel = np.flatnonzero(np.random.uniform(size=number_of_samples) < self.HER_RATIO)
+        if len(relabel) > 0:
+            # uniform future step in [step, episode end]; the position it achieved is the new goal
+            futures = steps[relabel] + (np.random.uniform(size=len(relabel))*(remaining[relabel] + 1)).astype(np.int64)
+            goals = self.observations[(futures + 1) % self.MAX_SIZE, POSITION_COLUMNS]
+            states[relabel, GOAL_COLUMNS] = goals
+
+            # positions of the substeps of every window step, the last one is that of the next observation;
+            # the reward sums the distances up to the first substep at the goal, where the action ended
+            positions = self.observations[(window_ids[relabel] + 1) % self.MAX_SIZE][:, :, None, POSITION_COLUMNS]
+            if self.NUM_OF_SUBSTEPS > 0:
+                positions = np.concatenate((self.substeps[window_ids[relabel]], positions), axis=2)
+            distances = np.sqrt(np.sum((positions - goals[:, None, None, :])**2, axis=3))
+            with np.errstate(invalid='ignore'):
+                hits = distances < self.GOAL_THRESHOLD  # NaN (not executed): False
+            executed = ~np.isnan(distances) & (np.cumsum(hits, axis=2) - hits == 0)
+            rewards[relabel] = -np.sum(np.where(executed, distances, 0.0), axis=2)
+            terminals[relabel] = np.any(hits, axis=2)
+
+        # steps up to and including the first terminal count
+        counted = inside & (np.cumsum(terminals, axis=1) - terminals == 0)
+        horizons = np.sum(counted, axis=1).astype(np.int32)
+        returns = np.sum(counted*self.discounts*rewards, axis=1).astype(np.float32)
+
+        rows = np.arange(number_of_samples)
+        next_states = self.observations[(window_ids[rows, horizons - 1] + 1) % self.MAX_SIZE]
+        if len(relabel) > 0:
+            next_states[relabel, GOAL_COLUMNS] = goals
+        return states, actions, returns, next_states, terminals[rows, horizons - 1], horizons
+
+    def commit(self, checkpoint_step):
+        # nothing is persisted
+        pass
+
+
+class MinibatchPrefetcher(threading.Thread):
+    # background worker keeping a bounded queue of ready minibatches for the learners
+    def __init__(self, replay, replay_lock, scheduler, batch_size=BATCH_SIZE, depth=PREFETCH_DEPTH):
+        threading.Thread.__init__(self, name='prefetcher')
+        self.daemon = True
+        self.replay = replay
+        self.replay_lock = replay_lock
+        self.scheduler = scheduler
+        self.BATCH_SIZE = batch_size
+        self.batches = queue.Queue(maxsize=depth)
+
+    def get(self):
+        # (states, actions, rewards, next_states, terminals, horizons), blocks if none is ready
+        return self.batches.get()
+
+    def run(self):
+        # nothing to sample before the scheduler lets the learners start
+        if not self.scheduler.wait_for_samples():
+            return
+        while True:
+            self.replay_lock.acquire()
+            batch = self.replay.get_minibatch(number_of_samples=self.BATCH_SIZE)
+            self.replay_lock.release()
+            self.batches.put(batch)
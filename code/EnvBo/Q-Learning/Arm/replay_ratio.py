@@ -0,0 +1,111 @@
+#!/usr/bin/python
+import threading
+import time
+
+
+MAX_LAG = 2000          # transitions actors may run ahead of (or behind) the target ratio
+MIN_SAMPLES = 4000      # transitions collected before the first update is allowed
+REPLAY_RATIO = 0.25     # gradient updates (minibatches) per collected transition
+
+
+class ReplayRatioScheduler:
+    # couples actors and learners through one condition variable:
+    # learners may do an update only while updates < REPLAY_RATIO * (transitions - MIN_SAMPLES),
+    # actors may add a transition only while they are at most MAX_LAG transitions ahead of the learners
+    def __init__(self, replay_ratio=REPLAY_RATIO, min_samples=MIN_SAMPLES, max_lag=MAX_LAG, resumed_transitions=0):
+        self.REPLAY_RATIO = replay_ratio        # None: never throttle, only count
+        self.MIN_SAMPLES = min_samples
+        self.MAX_LAG = max_lag
+
+        # transitions restored from disk: learning starts at once if enough, the ratio applies to new ones only
+        if resumed_transitions >= min_samples:
+            self.MIN_SAMPLES = resumed_transitions
+
+        self.condition = threading.Condition()
+        self.num_of_transitions = resumed_transitions
+        self.num_of_updates = 0
+        self.stopped = False
+        self.start_time = None                  # set when learning starts
+
+    def actors_ahead(self):
+        # transitions collected beyond what the current number of updates asks for
+        if self.REPLAY_RATIO is None:
+            return 0
+        return (self.num_of_transitions - self.MIN_SAMPLES) - self.num_of_updates / self.REPLAY_RATIO
+
+    def update_allowed(self):
+        if self.num_of_transitions < self.MIN_SAMPLES:
+            return False
+        if self.REPLAY_RATIO is None:
+            return True
+        return self.num_of_updates < self.REPLAY_RATIO * (self.num_of_transitions - self.MIN_SAMPLES)
+
+    def add_transitions(self, number_of_transitions=1):
+        # called by actors (or the replay server) for every new experience; blocks while too far ahead
+        self.condition.acquire()
+        while not self.stopped and self.actors_ahead() > self.MAX_LAG:
+            self.condition.wait()
+        self.num_of_transitions += number_of_transitions
+        self.condition.notify_all()
+        self.condition.release()
+
+    def wait_for_samples(self):
+        # called once by learners instead of polling the replay size
+        self.condition.acquire()
+        while not self.stopped and self.num_of_transitions < self.MIN_SAMPLES:
+            self.condition.wait()
+        if self.start_time is None:
+            self.start_time = time.time()
+        self.condition.release()
+        return not self.stopped
+
+    def wait_for_update(self):
+        # called by learners before every gradient update; returns False once stopped
+        self.condition.acquire()
+        while not self.stopped and not self.update_allowed():
+            self.condition.wait()
+        if not self.stopped:
+            self.num_of_updates += 1    # no phantom update when released by stop()
+        self.condition.notify_all()
+        self.condition.release()
+        return not self.stopped
+
+    def cancel_update(self):
+        # an update granted by wait_for_update that was not done (e.g. no minibatch left)
+        self.condition.acquire()
+        self.num_of_updates -= 1
+        self.condition.notify_all()
+        self.condition.release()
+
+    def stop(self):
+        # releases all waiting actors and learners
+        self.condition.acquire()
+        self.stopped = True
+        self.condition.notify_all()
+        self.condition.release()
+
+    def get_training_state(self):
+        # counters for training_state snapshots
+        return {'num_of_transitions': self.num_of_transitions, 'num_of_updates': self.num_of_updates, 'min_samples': self.MIN_SAMPLES}
+
+    def set_training_state(self, state):
+        self.condition.acquire()
+        self.num_of_transitions = state['num_of_transitions']
+        self.num_of_updates = state['num_of_updates']
+        self.MIN_SAMPLES = state['min_samples']
+        self.condition.notify_all()
+        self.condition.release()
+
+    def get_replay_ratio(self):
+        # achieved updates per transition collected since learning started
+        collected = self.num_of_transitions - self.MIN_SAMPLES
+        if collected <= 0:
+            return 0.0
+        return float(self.num_of_updates) / collected
+
+    def get_report(self):
+        elapsed = 0.0 if self.start_time is None else time.time() - self.start_time
+        return 'transitions: %d | updates: %d | replay ratio: %.3f (target %s) | updates/s: %.1f' % (
+            self.num_of_transitions, self.num_of_updates, self.get_replay_ratio(),
+            'none' if self.REPLAY_RATIO is None else '%.3f' % self.REPLAY_RATIO,
+            self.num_of_updates / elapsed if elapsed > 0 else 0.0)
@@ -0,0 +1,125 @@
+#!/usr/bin/python
+import argparse
+import hashlib
+import numpy as np
+import os
+import threading
+import time
+
+# import own modules
+import agents
+import goals
+
+
+ARM_LENGTH_1 = 12.0                 # same arm as deep_q_learning
+ARM_LENGTH_2 = 18.0
+ANGULAR_ARM_VELOCITY = 1.0*np.pi/180.0
+CACHE_DIR = None                    # directory for distance maps on disk; None: cache in memory only
+GOAL_THRESHOLD = 0.02
+UNREACHABLE = -1
+
+cache = {}
+cache_lock = threading.Lock()
+
+
+def get_grid_size(angular_velocity=ANGULAR_ARM_VELOCITY):
+    # lattice points per joint; 360 for 1 degree steps
+    return int(round(2.0*np.pi/angular_velocity))
+
+
+def get_goal_cells(goal_pos, arm_length_1=ARM_LENGTH_1, arm_length_2=ARM_LENGTH_2, goal_threshold=GOAL_THRESHOLD, grid_size=360):
+    # lattice configurations within goal_threshold of the goal, in the normalized units of Actor.episode_finished
+    angles = 2.0*np.pi*np.arange(grid_size)/grid_size
+    theta = np.column_stack((np.repeat(angles, grid_size), np.tile(angles, grid_size)))
+    states = agents.get_states(theta, goal_pos, arm_length_1, arm_length_2)
+    distances = np.sqrt(np.sum((states[:, 0:2] - states[:, 4:6])**2, axis=1))
+    return (distances < goal_threshold).reshape(grid_size, grid_size)
+
+
+def compute_distance_map(goal_cells, moves, action_repeat=1):
+    # multi-source breadth-first search backwards from all goal cells on the toroidal lattice:
+    # decisions to reach a goal cell from every cell, UNREACHABLE if none is reachable. A move (d1, d2)
+    # held for action_repeat substeps takes cell (i, j) through (i + k*d1, j + k*d2), k = 1..action_repeat,
+    # and the episode stops at the first goal cell on the way. So a cell is one decision from the goal if any
+    # substep of a move lands in a goal cell, and the cells one decision before a later frontier are the
+    # frontier shifted by (-action_repeat*d1, -action_repeat*d2)
+    distances = np.full(goal_cells.shape, UNREACHABLE, dtype=np.int32)
+    distances[goal_cells] = 0
+    visited = goal_cells.copy()
+    frontier = np.zeros_like(goal_cells)
+    for d1, d2 in moves:
+        for k in range(1, action_repeat + 1):
+            frontier |= np.roll(np.roll(goal_cells, -k*d1, axis=0), -k*d2, axis=1)
+    depth = 1
+    while True:
+        frontier &= ~visited
+        if not frontier.any():
+            return distances
+        visited |= frontier
+        distances[frontier] = depth
+        depth += 1
+        reached = np.zeros_like(frontier)
+        for d1, d2 in moves:
+            reached |= np.roll(np.roll(frontier, -action_repeat*d1, axis=0), -action_repeat*d2, axis=1)
+        frontier = reached
+
+
+def get_distance_map(goal_pos, arm_length_1=ARM_LENGTH_1, arm_length_2=ARM_LENGTH_2, goal_threshold=GOAL_THRESHOLD,
+                     angular_velocity=ANGULAR_ARM_VELOCITY, actions=None, action_repeat=1, cache_dir=CACHE_DIR):
+    # cached distance-to-go map for an arm geometry, goal and action table (moves held for action_repeat substeps)
+    moves = tuple((int(d1), int(d2)) for d1, d2 in (agents.make_actions() if actions is None else actions) if (d1, d2) != (0, 0))
+    key = (float(arm_length_1), float(arm_length_2), tuple(float(x) for x in np.round(goal_pos, 6)), float(goal_threshold), get_grid_size(angular_velocity), moves,
+           int(action_repeat))
+    cache_lock.acquire()
+    distances = cache.get(key)
+    cache_lock.release()
+    if distances is not None:
+        return distances
+
+    filename = None
+    if cache_dir is not None:
+        filename = os.path.join(cache_dir, hashlib.sha1(repr(key).encode('utf-8')).hexdigest() + '.npy')
+    if filename is not None and os.path.isfile(filename):
+        distances = np.load(filename)
+    else:
+        goal_cells = get_goal_cells(goal_pos, arm_length_1, arm_length_2, goal_threshold, key[4])
+        distances = compute_distance_map(goal_cells, moves, int(action_repeat))
+        if filename is not None:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            np.save(filename, distances)
+
+    cache_lock.acquire()
+    cache[key] = distances
+    cache_lock.release()
+    return distances
+
+
+def get_optimal_decisions(scene_id, arm_length_1=ARM_LENGTH_1, arm_length_2=ARM_LENGTH_2, angular_velocity=ANGULAR_ARM_VELOCITY,
+                          goal_threshold=GOAL_THRESHOLD, actions=None, action_repeat=1, **kwargs):
+    # fewest decisions from the start of SCENARIOS[scene_id] to its goal, UNREACHABLE if there is no path
+    # (takes run_episode's keyword arguments)
+    goal = goals.Goal_Arm(scene_id, arm_length_1, arm_length_2)
+    distances = get_distance_map(goal.pos, arm_length_1, arm_length_2, goal_threshold, angular_velocity, actions, action_repeat)
+    start = np.round(np.array(agents.SCENARIOS[scene_id])*np.pi/180.0 / angular_velocity).astype(int) % distances.shape[0]
+    return int(distances[start[0], start[1]])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Exact distance-to-go maps over the joint lattice.')
+    parser.add_argument('--output', help='directory to save the maps of all scenarios as .npy')
+    args = parser.parse_args()
+
+    for scene_id in range(len(goals.SCENARIOS)):
+        goal = goals.Goal_Arm(scene_id, ARM_LENGTH_1, ARM_LENGTH_2)
+        start_time = time.time()
+        distances = get_distance_map(goal.pos)
+        elapsed = time.time() - start_time
+        reachable = distances[distances != UNREACHABLE]
+        print('scenario %d: %d goal cells | max distance %d | %.1f%% reachable | optimal from start %d | %.3fs' % (
+            scene_id, np.count_nonzero(distances == 0), reachable.max(), 100.0*reachable.size / distances.size,
+            get_optimal_decisions(scene_id), elapsed))
+        if args.output:
+            if not os.path.isdir(args.output):
+                os.makedirs(args.output)
+            np.save(os.path.join(args.output, 'distances%d.npy' % scene_id), distances)
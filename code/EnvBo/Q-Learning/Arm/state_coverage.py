@@ -0,0 +1,124 @@
+#!/usr/bin/python
+import argparse
+import numpy as np
+import threading
+import time
+
+
+ARM_LENGTH_1 = 12.0                 # same arm as deep_q_learning
+ARM_LENGTH_2 = 18.0
+COVERAGE_NAME = 'coverage.npz'
+FLUSH_SIZE = 1024                   # states buffered before they are binned in one batch
+JOINT_BINS = 72                     # per joint, i.e. 5 degrees
+WORKSPACE_BINS = 64                 # per axis of the normalized end-effector position
+
+
+def get_fraction_and_entropy(counts, mask=None):
+    # share of (reachable) cells visited, and visitation entropy normalized to [0, 1] (1: uniform)
+    if mask is not None:
+        counts = counts[mask]
+    total = np.sum(counts)
+    if total == 0:
+        return 0.0, 0.0
+    p = counts[counts > 0] / float(total)
+    return np.count_nonzero(counts) / float(counts.size), float(-np.sum(p*np.log(p)) / np.log(counts.size))
+
+
+class CoverageIndex:
+    # incrementally updated 2D histograms of visited joint angles and end-effector positions; states are
+    # buffered and binned with one bincount per FLUSH_SIZE states, so it can stay on during training
+    def __init__(self, arm_length_1=ARM_LENGTH_1, arm_length_2=ARM_LENGTH_2, joint_bins=JOINT_BINS, workspace_bins=WORKSPACE_BINS, flush_size=FLUSH_SIZE):
+        self.JOINT_BINS = joint_bins
+        self.WORKSPACE_BINS = workspace_bins
+        self.FLUSH_SIZE = flush_size
+        self.joint_counts = np.zeros(joint_bins*joint_bins, dtype=np.int64)
+        self.workspace_counts = np.zeros(workspace_bins*workspace_bins, dtype=np.int64)
+
+        # only the annulus the end-effector can reach counts for workspace coverage
+        centers = (np.arange(workspace_bins) + 0.5) / workspace_bins*2.0 - 1.0
+        radius = np.sqrt(centers[:, None]**2 + centers[None, :]**2).ravel()
+        self.reachable = (radius >= abs(arm_length_1 - arm_length_2) / (arm_length_1 + arm_length_2)) & (radius <= 1.0)
+
+        self.lock = threading.Lock()
+        self.pending = []
+        self.num_of_pending = 0         # states in pending
+        self.num_of_states = 0
+        self.start_time = time.time()
+        self.history = []               # (seconds, states, joint fraction, joint entropy, workspace fraction, workspace entropy)
+
+    def add(self, states):
+        # one state (Actor.get_state layout) or an (N, NUM_OF_STATES) array
+        self.lock.acquire()
+        states = np.atleast_2d(states)
+        self.pending.append(states)
+        self.num_of_pending += len(states)
+        if self.num_of_pending >= self.FLUSH_SIZE:
+            self.flush()
+        self.lock.release()
+
+    def flush(self):
+        # with lock held
+        if len(self.pending) == 0:
+            return
+        states = np.concatenate(self.pending)
+        self.pending = []
+        self.num_of_pending = 0
+
+        # normalized theta in [-1, 1) and positions in [-1, 1] -> bin ids
+        joints = np.clip(((states[:, 2:4] + 1.0) / 2.0*self.JOINT_BINS).astype(np.int64), 0, self.JOINT_BINS - 1)
+        positions = np.clip(((states[:, 0:2] + 1.0) / 2.0*self.WORKSPACE_BINS).astype(np.int64), 0, self.WORKSPACE_BINS - 1)
+        self.joint_counts += np.bincount(joints[:, 0]*self.JOINT_BINS + joints[:, 1], minlength=self.joint_counts.size)
+        self.workspace_counts += np.bincount(positions[:, 0]*self.WORKSPACE_BINS + positions[:, 1], minlength=self.workspace_counts.size)
+        self.num_of_states += len(states)
+
+    def snapshot(self):
+        # appends the current coverage to the history and returns it
+        self.lock.acquire()
+        self.flush()
+        joint_fraction, joint_entropy = get_fraction_and_entropy(self.joint_counts)
+        workspace_fraction, workspace_entropy = get_fraction_and_entropy(self.workspace_counts, self.reachable)
+        entry = (time.time() - self.start_time, self.num_of_states, joint_fraction, joint_entropy, workspace_fraction, workspace_entropy)
+        self.history.append(entry)
+        self.lock.release()
+        return entry
+
+    def get_report(self):
+        _, num_of_states, joint_fraction, joint_entropy, workspace_fraction, workspace_entropy = self.snapshot()
+        return 'coverage: %d states | joints %.1f%% (entropy %.2f) | workspace %.1f%% (entropy %.2f)' % (
+            num_of_states, 100*joint_fraction, joint_entropy, 100*workspace_fraction, workspace_entropy)
+
+    def save(self, path=COVERAGE_NAME):
+        self.lock.acquire()
+        np.savez(path, joint_counts=self.joint_counts.reshape(self.JOINT_BINS, self.JOINT_BINS),
+                 workspace_counts=self.workspace_counts.reshape(self.WORKSPACE_BINS, self.WORKSPACE_BINS),
+                 history=np.array(self.history, dtype=np.float64).reshape(-1, 6))
+        self.lock.release()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Plot the coverage histograms and their history saved by a training run.')
+    parser.add_argument('path', nargs='?', default=COVERAGE_NAME)
+    parser.add_argument('--output', default='coverage.png')
+    args = parser.parse_args()
+
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    data = np.load(args.path)
+    fig, ax = plt.subplots(1, 3, figsize=(18, 5))
+    ax[0].imshow(np.log1p(data['joint_counts']), extent=[0, 360, 360, 0], cmap='viridis')
+    ax[0].set_xlabel('theta 2 [deg]')
+    ax[0].set_ylabel('theta 1 [deg]')
+    ax[0].set_title('log visits, joint angles')
+    ax[1].imshow(np.log1p(data['workspace_counts']), extent=[-1, 1, 1, -1], cmap='viridis')
+    ax[1].set_xlabel('y')
+    ax[1].set_ylabel('x')
+    ax[1].set_title('log visits, end-effector position')
+    history = data['history']
+    for column, label in [(2, 'joint coverage'), (3, 'joint entropy'), (4, 'workspace coverage'), (5, 'workspace entropy')]:
+        ax[2].plot(history[:, 1], history[:, column], label=label)
+    ax[2].set_xlabel('states')
+    ax[2].legend(loc='lower right')
+    fig.savefig(args.output, dpi=100)
+    print('Saved %s.' % args.output)
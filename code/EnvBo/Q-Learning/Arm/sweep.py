@@ -0,0 +1,271 @@
+#!/usr/bin/python
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing
+import numpy as np
+import os
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from distutils.spawn import find_executable
+from multiprocessing.pool import ThreadPool
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+# import own modules
+import agents
+import data_parallel
+import deep_q_learning
+import evaluation
+import q_networks
+import replay_memory
+import replay_ratio
+import state_coverage
+
+
+CORES_PER_RUN = 2
+METRICS_NAME = 'metrics.json'   # written by a run into its directory
+RESULTS_NAME = 'sweep_results.csv'
+SWEEP_DIR = 'sweeps'
+THREAD_VARIABLES = ['OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS']
+TUNABLE_MODULES = [deep_q_learning, data_parallel, q_networks, replay_memory]  # module constants a search space may override
+UNUSED_CONSTANTS = ['ACTIONS', 'COVERAGE_REPORT_PERIOD', 'GOAL_COLUMNS', 'HEIGHT', 'LEGACY_ACTIONS', 'MODEL_INFO_NAME', 'NUM_OF_ACTIONS',
+                    'NUM_OF_PLOTS_X', 'NUM_OF_PLOTS_Y', 'NUM_OF_STATES', 'NUM_OF_WORKERS', 'PLOTTING', 'POSITION_COLUMNS', 'QNETWORK_NAME', 'RESUME',
+                    'SNAPSHOT_DIR', 'TARGETNET_NAME', 'WIDTH']  # fixed or derived by train_headless; a sweep over them would be mislabeled
+
+
+def make_grid(space):
+    # {'GAMMA': [0.5, 0.9], 'TAU': [0.001, 0.0001]} -> all combinations
+    names = sorted(space.keys())
+    return [dict(zip(names, values)) for values in itertools.product(*[space[name] for name in names])]
+
+
+def sample_config(space, random_state):
+    # [low, high] ranges (log-uniform if they span two decades, ints stay ints) or {'choices': [...]}
+    config = {}
+    for name in sorted(space.keys()):
+        values = space[name]
+        if isinstance(values, dict):
+            config[name] = values['choices'][random_state.randint(len(values['choices']))]
+        elif all(isinstance(v, int) for v in values):
+            config[name] = int(random_state.randint(values[0], values[1] + 1))
+        elif values[0] > 0 and values[1] / float(values[0]) >= 100.0:
+            config[name] = float(np.exp(random_state.uniform(np.log(values[0]), np.log(values[1]))))
+        else:
+            config[name] = float(random_state.uniform(values[0], values[1]))
+    return config
+
+
+def find_modules(name):
+    # all modules defining the constant; e.g. BATCH_SIZE lives in deep_q_learning and replay_memory
+    modules = [module for module in TUNABLE_MODULES if hasattr(module, name)]
+    if len(modules) == 0 or not name.isupper():
+        raise ValueError('Unknown hyperparameter %s' % name)
+    if name in UNUSED_CONSTANTS:
+        raise ValueError('%s is not used by the headless training runs' % name)
+    return modules
+
+
+def apply_config(config):
+    for name, value in config.items():
+        for module in find_modules(name):
+            setattr(module, str(name), value)
+
+
+def get_run_command(cores, run_dir):
+    # a fresh interpreter per run: the math libraries size their thread pools from THREAD_VARIABLES when they
+    # are imported, and taskset (if available) confines the interpreter and all its threads to the core set
+    command = [sys.executable, os.path.abspath(__file__), '--run-dir', run_dir]
+    if find_executable('taskset') is not None:
+        command = ['taskset', '-c', ','.join(str(core) for core in cores)] + command
+    return command
+
+
+def train_headless(config):
+    # one isolated training run in the current directory; same threads as deep_q_learning, without plotting
+    apply_config(config)
+    for net_name in [q_networks.QNETWORK_NAME, q_networks.TARGETNET_NAME]:
+        if not os.path.isdir(net_name):
+            os.makedirs(net_name)
+
+    dql = deep_q_learning
+    dql.PLOTTING = False
+    dql.SNAPSHOT_DIR = None  # every trial starts fresh
+    dql.ACTIONS = agents.make_actions(dql.ACTION_MAGNITUDES, dql.COMBINED_ACTIONS)  # follows tuned ACTION_MAGNITUDES, COMBINED_ACTIONS
+    dql.NUM_OF_ACTIONS = len(dql.ACTIONS)
+
+    # fork data-parallel gradient workers before any thread or Keras model exists in this process
+    worker_pool = None
+    if dql.NUM_OF_GRADIENT_WORKERS > 0:
+        worker_pool = data_parallel.GradientWorkerPool(dql.NUM_OF_GRADIENT_WORKERS, dql.BATCH_SIZE, dql.NUM_OF_STATES, dql.NUM_OF_ACTIONS,
+                                                       q_networks.NUM_OF_HIDDEN_NEURONS, q_networks.NUM_OF_HIDDEN_LAYERS, q_networks.BACKEND)
+
+    dql.console_lock = threading.Lock()
+    dql.networks_lock = threading.Lock()
+    dql.replay_lock = threading.Lock()
+    dql.plotting_lock = threading.Lock()
+    dql.replay = dql.make_replay_memory()
+    dql.scheduler = replay_ratio.ReplayRatioScheduler(dql.REPLAY_RATIO, dql.MIN_SAMPLES)
+    dql.prefetcher = replay_memory.MinibatchPrefetcher(dql.replay, dql.replay_lock, dql.scheduler, batch_size=dql.BATCH_SIZE, depth=replay_memory.PREFETCH_DEPTH)
+    dql.prefetcher.start()
+    dql.coverage_index = state_coverage.CoverageIndex(dql.ARM_LENGTH_1, dql.ARM_LENGTH_2)
+    dql.networks = q_networks.QNetworks(dql.NUM_OF_ACTIONS, dql.NUM_OF_STATES, num_of_hidden_neurons=q_networks.NUM_OF_HIDDEN_NEURONS, tau=q_networks.TAU,
+                                        backend=q_networks.BACKEND, actions=dql.ACTIONS, num_of_hidden_layers=q_networks.NUM_OF_HIDDEN_LAYERS)
+
+    actors = [dql.Actor(i, epsilon=dql.EPSILON, max_steps=dql.MAX_STEPS) for i in range(dql.NUM_OF_ACTORS)]
+    dql.actors = actors
+    if worker_pool is not None:
+        learners = [data_parallel.DataParallelLearner(worker_pool, dql.networks, dql.networks_lock, dql.prefetcher, dql.scheduler, dql.console_lock, gamma=dql.GAMMA,
+                                                      target_function=dql.get_all_action_targets if dql.ALL_ACTION_BACKUPS else None)]
+    else:
+        learners = [dql.Learner(i, gamma=dql.GAMMA, min_samples=dql.MIN_SAMPLES) for i in range(dql.NUM_OF_LEARNERS)]
+    for thread in actors + learners:
+        thread.daemon = True
+        thread.start()
+
+    # actors stop after MAX_EPISODES; then release the learners
+    [actor.join() for actor in actors]
+    dql.scheduler.stop()
+    [learner.join(dql.LEARNER_JOIN_TIMEOUT) for learner in learners]
+    if worker_pool is not None:
+        worker_pool.close()
+        if learners[0].error is not None:
+            raise RuntimeError('data-parallel learner failed: %s' % learners[0].error)
+
+    dql.networks_lock.acquire()
+    dql.networks.save_models()
+    results = evaluation.evaluate_policy(dql.networks, arm_length_1=dql.ARM_LENGTH_1, arm_length_2=dql.ARM_LENGTH_2,
+                                         angular_velocity=dql.ANGULAR_ARM_VELOCITY, goal_threshold=dql.GOAL_THRESHOLD, max_steps=dql.MAX_STEPS,
+                                         actions=dql.ACTIONS, action_repeat=dql.ACTION_REPEAT)
+    dql.networks_lock.release()
+
+    _, _, joint_coverage, joint_entropy, workspace_coverage, workspace_entropy = dql.coverage_index.snapshot()
+    dql.coverage_index.save()
+
+    episodes = [episode for actor in actors for episode in actor.episodes]
+    last = episodes[-len(actors)*10:]
+    return {'episodes': len(episodes),
+            'transitions': dql.scheduler.num_of_transitions,
+            'updates': dql.scheduler.num_of_updates,
+            'replay_ratio': dql.scheduler.get_replay_ratio(),
+            'train_success_rate': float(np.mean([success for _, success in last])) if last else 0.0,
+            'train_mean_steps': float(np.mean([steps for steps, _ in last])) if last else 0.0,
+            'eval_success_rate': results['success_rate'],
+            'eval_mean_steps': results['mean_steps'],
+            'eval_mean_decisions': results['mean_decisions'],
+            'eval_optimality_gap': results['mean_optimality_gap'],
+            'eval_steps': ' '.join(str(steps) for steps in results['steps']),
+            'joint_coverage': joint_coverage,
+            'joint_entropy': joint_entropy,
+            'workspace_coverage': workspace_coverage,
+            'workspace_entropy': workspace_entropy}
+
+
+def run(task):
+    # pool thread: one run in a pinned child process, own directory, own log
+    run_id, config, sweep_dir, free_cores = task
+    cores = free_cores.get()
+    start = time.time()
+    try:
+        run_dir = os.path.join(sweep_dir, 'run%03d' % run_id)
+        os.makedirs(run_dir)
+        with open(os.path.join(run_dir, 'config.json'), 'w') as config_file:
+            json.dump(config, config_file, indent=2, sort_keys=True)
+
+        environment = dict(os.environ)
+        for variable in THREAD_VARIABLES:
+            environment[variable] = str(len(cores))
+        with open(os.path.join(run_dir, 'train.log'), 'w') as log_file:
+            returncode = subprocess.call(get_run_command(cores, run_dir), env=environment, stdout=log_file, stderr=subprocess.STDOUT)
+
+        if os.path.isfile(os.path.join(run_dir, METRICS_NAME)):
+            with open(os.path.join(run_dir, METRICS_NAME)) as metrics_file:
+                metrics = json.load(metrics_file)
+        else:
+            metrics = {'status': 'failed: exit code %d' % returncode}
+    finally:
+        free_cores.put(cores)
+    metrics['run'] = run_id
+    metrics['wall_time'] = time.time() - start
+    metrics.update(config)
+    return metrics
+
+
+def run_in_directory(run_dir):
+    # child process of run(): trains with run_dir/config.json and writes run_dir/METRICS_NAME
+    os.chdir(run_dir)
+    with open('config.json') as config_file:
+        config = json.load(config_file)
+    try:
+        metrics = train_headless(config)
+        metrics['status'] = 'ok'
+    except Exception as error:
+        traceback.print_exc()
+        metrics = {'status': 'failed: %s' % error}
+    with open(METRICS_NAME, 'w') as metrics_file:
+        json.dump(metrics, metrics_file, default=float)  # numpy scalars
+
+
+def write_results(results, path):
+    columns = ['run', 'status', 'wall_time']
+    for result in results:
+        columns.extend(sorted(name for name in result if name not in columns))
+    with open(path, 'w') as results_file:
+        writer = csv.DictWriter(results_file, columns)
+        writer.writeheader()
+        for result in sorted(results, key=lambda r: r['run']):
+            writer.writerow(result)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run isolated headless training runs over a hyperparameter space.')
+    parser.add_argument('space', nargs='?', help='JSON search space, e.g. \'{"GAMMA": [0.5, 0.9], "TAU": [0.001, 0.0001]}\'')
+    parser.add_argument('--random', type=int, default=0, help='number of random samples (ranges); 0: full grid (lists)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--cores-per-run', type=int, default=CORES_PER_RUN)
+    parser.add_argument('--output', default=os.path.join(SWEEP_DIR, time.strftime('%Y%m%d-%H%M%S')))
+    parser.add_argument('--run-dir', help=argparse.SUPPRESS)  # internal: one run, started by run()
+    args = parser.parse_args()
+
+    if args.run_dir is not None:
+        run_in_directory(args.run_dir)
+        sys.exit(0)
+    if args.space is None:
+        parser.error('the search space is required')
+
+    space = json.loads(args.space)
+    if args.random > 0:
+        random_state = np.random.RandomState(args.seed)
+        configs = [sample_config(space, random_state) for _ in range(args.random)]
+    else:
+        configs = make_grid(space)
+    for name in space:
+        find_modules(name)  # fail early on unknown names
+
+    # one core set per concurrent run
+    num_of_cores = multiprocessing.cpu_count()
+    num_of_slots = max(1, num_of_cores // args.cores_per_run)
+    free_cores = queue.Queue()
+    for slot in range(num_of_slots):
+        free_cores.put(tuple(range(slot*args.cores_per_run, min((slot + 1)*args.cores_per_run, num_of_cores))))
+
+    sweep_dir = os.path.abspath(args.output)
+    os.makedirs(sweep_dir)
+    print('%d runs, %d at a time, results in %s' % (len(configs), num_of_slots, sweep_dir))
+
+    # every run is a fresh interpreter, so it starts from the unmodified module constants
+    pool = ThreadPool(num_of_slots)
+    results = []
+    for result in pool.imap_unordered(run, [(i, config, sweep_dir, free_cores) for i, config in enumerate(configs)]):
+        results.append(result)
+        write_results(results, os.path.join(sweep_dir, RESULTS_NAME))
+        print('run %03d %s after %.0fs: %s' % (result['run'], result['status'], result['wall_time'],
+                                              ', '.join('%s=%s' % (name, result.get(name)) for name in ['eval_success_rate', 'eval_mean_steps', 'replay_ratio'])))
+    pool.close()
+    pool.join()
@@ -0,0 +1,61 @@
+#!/usr/bin/python
+import numpy as np
+import unittest
+
+# import own modules
+import agents
+import goals
+
+
+GOAL_THRESHOLD = 0.02  # evaluation.GOAL_THRESHOLD
+MAX_STEPS = 500
+
+
+def run_guided_episode(scene_id, actions, action_repeat):
+    # evaluation.run_episode without networks: simulation steps until the goal is reached, or None
+    agent = agents.Arm(scene_id, actions=actions)
+    goal = goals.Goal_Arm(scene_id, agents.ARM_LENGTH_1, agents.ARM_LENGTH_2)
+    step = 0
+    while step < MAX_STEPS:
+        try:
+            action = agent.get_guided_action(goal.pos - agent.pos, action_repeat)
+        except np.linalg.LinAlgError:
+            action = np.random.randint(len(agent.ACTIONS))
+        agent.set_action(action)
+        for _ in range(action_repeat):
+            agent.update()
+            step += 1
+            if np.linalg.norm(agent.get_position() - goal.get_position()) < GOAL_THRESHOLD:
+                return step
+    return None
+
+
+class GuidedActionTest(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+
+    def check_all_scenarios(self, magnitudes, combined):
+        for action_repeat in [1, 4]:
+            for scene_id in range(len(goals.SCENARIOS)):
+                steps = run_guided_episode(scene_id, agents.make_actions(magnitudes, combined), action_repeat)
+                self.assertIsNotNone(steps, 'scenario %d, magnitudes %s, action repeat %d' % (scene_id, magnitudes, action_repeat))
+
+    def test_single_joint_actions(self):
+        self.check_all_scenarios([1], False)
+        self.check_all_scenarios([1, 5], False)
+
+    def test_combined_actions(self):
+        self.check_all_scenarios([1], True)
+        self.check_all_scenarios([1, 5], True)
+
+    def test_direction_not_magnitude(self):
+        # a far goal straight along joint 1 moves joint 1 only, at the largest magnitude
+        agent = agents.Arm(1, actions=agents.make_actions([1, 5], True))
+        u = np.array([1.0, 0.0])
+        distance = np.dot(agent.get_Jacobian(), u)
+        action = agent.get_guided_action(distance)
+        np.testing.assert_allclose(agent.ACTIONS[action], [5.0, 0.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
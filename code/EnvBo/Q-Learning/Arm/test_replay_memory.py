@@ -0,0 +1,167 @@
+#!/usr/bin/python
+import numpy as np
+import shutil
+import tempfile
+import unittest
+
+# import own modules
+import replay_memory
+
+
+BYTES_PER_SLOT = 4*6 + 1 + 4 + 1 + 4  # EpisodeReplayMemory without substeps
+FAR_GOAL = (0.9, 0.9)
+NUM_OF_SAMPLES = 200                   # enough to draw every transition of the small memories below
+
+
+def make_state(step, x, goal=FAR_GOAL):
+    # end-effector at (x, 0); the step number goes into the first theta column, so sampled rows can be identified
+    return np.array([x, 0.0, step, 0.5, goal[0], goal[1]], dtype=np.float32)
+
+
+def make_episode(rewards, terminals=None, first=0):
+    # [state, action, reward, next_state, terminal] rows of steps first, first + 1, ...; positions 0.1 apart
+    if terminals is None:
+        terminals = [0.0]*len(rewards)
+    steps = range(first, first + len(rewards) + 1)
+    states = [make_state(step, 0.1*step) for step in steps]
+    return [[states[i], (first + i) % 4, rewards[i], states[i + 1], terminals[i]] for i in range(len(rewards))]
+
+
+def make_memory(max_size, **kwargs):
+    memory = replay_memory.EpisodeReplayMemory(max_bytes=max_size*BYTES_PER_SLOT, **kwargs)
+    assert memory.MAX_SIZE == max_size
+    return memory
+
+
+class EpisodeReplayMemoryTest(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+
+    def get_rows(self, memory):
+        # {step: (reward, next step, terminal, horizon)} of all sampled rows, checking that equal steps give equal rows
+        states, actions, rewards, next_states, terminals, horizons = memory.get_minibatch(NUM_OF_SAMPLES)
+        rows = {}
+        for i in range(NUM_OF_SAMPLES):
+            row = (round(float(rewards[i]), 5), int(next_states[i, 2]), float(terminals[i]), int(horizons[i]))
+            self.assertEqual(rows.setdefault(int(states[i, 2]), row), row)
+            self.assertEqual(actions[i], int(states[i, 2]) % 4)
+        return rows
+
+    def test_n_step_windows(self):
+        # returns with gamma 0.5 over up to 3 steps, cut at the end of the episode
+        memory = make_memory(10, her_ratio=0.0, n_steps=3, gamma=0.5)
+        memory.add_episode(make_episode([-1.0, -2.0, -3.0, -4.0]))
+        self.assertEqual(self.get_rows(memory), {0: (-2.75, 3, 0.0, 3),
+                                                 1: (-4.5, 4, 0.0, 3),
+                                                 2: (-5.0, 4, 0.0, 2),
+                                                 3: (-4.0, 4, 0.0, 1)})
+
+    def test_terminal_ends_window(self):
+        # the terminal step still counts, the steps after it do not
+        memory = make_memory(10, her_ratio=0.0, n_steps=3, gamma=0.5)
+        memory.add_episode(make_episode([-1.0, -2.0, -3.0], terminals=[0.0, 1.0, 0.0]))
+        self.assertEqual(self.get_rows(memory), {0: (-2.0, 2, 1.0, 2),
+                                                 1: (-2.0, 2, 1.0, 1),
+                                                 2: (-3.0, 3, 0.0, 1)})
+
+    def test_wrapped_ring(self):
+        # episode 0-4 (slots 0-4), then episode 10-11 (slots 5, 0): overwrites the first observation of the
+        # older episode, whose later transitions are still sampled with their full windows
+        memory = make_memory(6, her_ratio=0.0, n_steps=2, gamma=0.5)
+        memory.add_episode(make_episode([-1.0, -2.0, -3.0, -4.0]))
+        memory.add_episode(make_episode([-5.0], first=10))
+        self.assertEqual(list(memory.remaining), [-1, 2, 1, 0, -1, 0])
+        self.assertEqual(memory.get_buffer_size(), 4)
+        self.assertEqual(memory.size, 6)
+        self.assertEqual(self.get_rows(memory), {1: (-3.5, 3, 0.0, 2),
+                                                 2: (-5.0, 4, 0.0, 2),
+                                                 3: (-4.0, 4, 0.0, 1),
+                                                 10: (-5.0, 11, 0.0, 1)})
+
+        # episode 20-21 (slots 1, 2): the transitions starting there are gone, 3 -> 4 is left
+        memory.add_episode(make_episode([-6.0], first=20))
+        self.assertEqual(list(memory.remaining), [-1, 0, -1, 0, -1, 0])
+        self.assertEqual(memory.get_buffer_size(), 3)
+        self.assertEqual(self.get_rows(memory), {3: (-4.0, 4, 0.0, 1),
+                                                 10: (-5.0, 11, 0.0, 1),
+                                                 20: (-6.0, 21, 0.0, 1)})
+
+    def test_hindsight_columns(self):
+        # relabeled goals are positions achieved at the same or a later step and replace the goal columns of
+        # states and next states only; rewards and terminals follow the new goal
+        memory = make_memory(10, her_ratio=1.0, n_steps=1, goal_threshold=0.02)
+        memory.add_episode(make_episode([-1.0, -1.0, -1.0]))
+        states, actions, rewards, next_states, terminals, horizons = memory.get_minibatch(NUM_OF_SAMPLES)
+        relabeled = set()
+        for i in range(NUM_OF_SAMPLES):
+            step, goal = int(states[i, 2]), (round(float(states[i, 4]), 5), round(float(states[i, 5]), 5))
+            relabeled.add((step, goal))
+            self.assertIn(goal, [(round(0.1*future, 5), 0.0) for future in range(step + 1, 4)])
+            np.testing.assert_allclose(states[i, 0:4], make_state(step, 0.1*step)[0:4])
+            np.testing.assert_allclose(next_states[i, 0:4], make_state(step + 1, 0.1*(step + 1))[0:4])
+            np.testing.assert_allclose(next_states[i, 4:6], states[i, 4:6])
+            np.testing.assert_allclose(rewards[i], -(goal[0] - 0.1*(step + 1)), atol=1e-6)
+            self.assertEqual(terminals[i], float(goal[0] == round(0.1*(step + 1), 5)))
+        self.assertEqual(len(relabeled), 6)
+
+    def test_hindsight_substeps(self):
+        # action repeat 3: rewards sum the distances of all substeps up to the first one at the new goal;
+        # NaN substeps were not executed (the original goal ended the action early)
+        memory = replay_memory.EpisodeReplayMemory(max_bytes=10*(BYTES_PER_SLOT + 4*2*2), her_ratio=1.0, n_steps=1, goal_threshold=0.02,
+                                                   action_repeat=3)
+        episode = make_episode([-1.0, -1.0], terminals=[0.0, 1.0])
+        episode[0].append([[0.03, 0.0], [0.06, 0.0]])          # 0.0 -> 0.1 in three substeps
+        episode[1].append([[0.15, 0.0], [np.nan, np.nan]])     # 0.1 -> 0.2, stopped after two substeps
+        memory.add_episode(episode)
+
+        states, actions, rewards, next_states, terminals, horizons = memory.get_minibatch(NUM_OF_SAMPLES)
+        expected = {(0, 0.1): (-0.11, 1.0), (0, 0.2): (-0.41, 0.0), (1, 0.2): (-0.05, 1.0)}
+        for i in range(NUM_OF_SAMPLES):
+            reward, terminal = expected[(int(states[i, 2]), round(float(states[i, 4]), 5))]
+            np.testing.assert_allclose(rewards[i], reward, atol=1e-6)
+            self.assertEqual(terminals[i], terminal)
+
+    def test_substeps_required(self):
+        memory = replay_memory.EpisodeReplayMemory(max_bytes=10*(BYTES_PER_SLOT + 4*2*2), her_ratio=1.0, action_repeat=3)
+        self.assertRaises(ValueError, memory.add_episode, make_episode([-1.0]))
+
+
+class MappedReplayMemoryTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_ring(self):
+        # 5 samples into 3 slots: the last 3 are kept
+        memory = replay_memory.MappedReplayMemory(self.directory, max_size=3)
+        for sample in make_episode([-1.0, -2.0, -3.0, -4.0, -5.0]):
+            memory.add_sample(sample)
+        self.assertEqual((memory.size, memory.position), (3, 2))
+        self.assertEqual(sorted(memory.rewards.tolist()), [-5.0, -4.0, -3.0])
+        states, actions, rewards, next_states, terminals, horizons = memory.get_minibatch(NUM_OF_SAMPLES)
+        np.testing.assert_allclose(next_states[:, 2] - states[:, 2], 1.0)
+        np.testing.assert_allclose(rewards, -1.0 - states[:, 2])
+        self.assertTrue(np.all(horizons == 1))
+
+    def test_reattach_at_commit(self):
+        # a reattached memory continues from the last commit, later samples are not counted
+        memory = replay_memory.MappedReplayMemory(self.directory, max_size=10)
+        episode = make_episode([-1.0, -2.0, -3.0])
+        for sample in episode[:2]:
+            memory.add_sample(sample)
+        memory.commit(7)
+        memory.add_sample(episode[2])
+        del memory
+
+        memory = replay_memory.MappedReplayMemory(self.directory, max_size=99, read_only=True)
+        self.assertEqual((memory.MAX_SIZE, memory.size, memory.position, memory.checkpoint_step), (10, 2, 2, 7))
+        self.assertEqual(memory.rewards[:2].tolist(), [-1.0, -2.0])
+
+    def test_read_only_needs_memory(self):
+        self.assertRaises(IOError, replay_memory.MappedReplayMemory, self.directory, read_only=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
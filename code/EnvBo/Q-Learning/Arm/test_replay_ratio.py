@@ -0,0 +1,96 @@
+#!/usr/bin/python
+import threading
+import time
+import unittest
+
+# import own modules
+import replay_ratio
+
+
+WAIT = 0.2  # seconds a blocked call is given to (not) return
+
+
+def start(function, *args):
+    # runs function in a daemon thread; the result goes into the returned list
+    result = []
+    thread = threading.Thread(target=lambda: result.append(function(*args)))
+    thread.daemon = True
+    thread.start()
+    return thread, result
+
+
+class ReplayRatioSchedulerTest(unittest.TestCase):
+    def test_updates_follow_ratio(self):
+        # no update before MIN_SAMPLES, then one per 1/REPLAY_RATIO transitions beyond it
+        scheduler = replay_ratio.ReplayRatioScheduler(replay_ratio=0.25, min_samples=100, max_lag=1000)
+        scheduler.add_transitions(99)
+        self.assertFalse(scheduler.update_allowed())
+        scheduler.add_transitions(9)
+        for _ in range(2):
+            self.assertTrue(scheduler.update_allowed())
+            self.assertTrue(scheduler.wait_for_update())
+        self.assertFalse(scheduler.update_allowed())
+        self.assertEqual(scheduler.num_of_updates, 2)
+        self.assertEqual(scheduler.get_replay_ratio(), 0.25)
+
+    def test_actors_wait_for_learners(self):
+        # an actor more than MAX_LAG transitions ahead blocks until the learners catch up
+        scheduler = replay_ratio.ReplayRatioScheduler(replay_ratio=0.5, min_samples=0, max_lag=10)
+        scheduler.add_transitions(12)
+        thread, result = start(scheduler.add_transitions, 1)
+        thread.join(WAIT)
+        self.assertTrue(thread.is_alive())
+        self.assertEqual(scheduler.num_of_transitions, 12)
+
+        scheduler.wait_for_update()
+        thread.join(WAIT)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(scheduler.num_of_transitions, 13)
+
+    def test_stop_releases_learners(self):
+        # a learner waiting for transitions gets False and no phantom update is counted
+        scheduler = replay_ratio.ReplayRatioScheduler(replay_ratio=0.25, min_samples=0)
+        thread, result = start(scheduler.wait_for_update)
+        thread.join(WAIT)
+        self.assertTrue(thread.is_alive())
+
+        scheduler.stop()
+        thread.join(WAIT)
+        self.assertEqual(result, [False])
+        self.assertEqual(scheduler.num_of_updates, 0)
+        self.assertFalse(scheduler.wait_for_update())
+        self.assertEqual(scheduler.num_of_updates, 0)
+        self.assertFalse(scheduler.wait_for_samples())
+
+    def test_cancel_update(self):
+        scheduler = replay_ratio.ReplayRatioScheduler(replay_ratio=None, min_samples=0)
+        self.assertTrue(scheduler.wait_for_update())
+        self.assertTrue(scheduler.wait_for_update())
+        scheduler.cancel_update()
+        self.assertEqual(scheduler.num_of_updates, 1)
+
+    def test_resumed_transitions(self):
+        # enough restored transitions: learning starts at once and the ratio counts new transitions only
+        scheduler = replay_ratio.ReplayRatioScheduler(replay_ratio=0.5, min_samples=100, resumed_transitions=500)
+        self.assertEqual(scheduler.MIN_SAMPLES, 500)
+        self.assertTrue(scheduler.wait_for_samples())
+        self.assertFalse(scheduler.update_allowed())
+        scheduler.add_transitions(2)
+        self.assertTrue(scheduler.update_allowed())
+
+        # too few: they count towards MIN_SAMPLES
+        scheduler = replay_ratio.ReplayRatioScheduler(replay_ratio=0.5, min_samples=100, resumed_transitions=50)
+        self.assertEqual(scheduler.MIN_SAMPLES, 100)
+        self.assertEqual(scheduler.num_of_transitions, 50)
+
+    def test_training_state(self):
+        scheduler = replay_ratio.ReplayRatioScheduler(replay_ratio=0.5, min_samples=10)
+        scheduler.add_transitions(30)
+        scheduler.wait_for_update()
+        resumed = replay_ratio.ReplayRatioScheduler(replay_ratio=0.5, min_samples=1000)
+        resumed.set_training_state(scheduler.get_training_state())
+        self.assertEqual((resumed.num_of_transitions, resumed.num_of_updates, resumed.MIN_SAMPLES), (30, 1, 10))
+
+
+if __name__ == "__main__":
+    unittest.main()
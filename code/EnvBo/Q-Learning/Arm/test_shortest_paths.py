@@ -0,0 +1,63 @@
+#!/usr/bin/python
+import numpy as np
+import unittest
+
+# import own modules
+import agents
+import goals
+import shortest_paths
+
+
+UNREACHABLE = shortest_paths.UNREACHABLE
+
+
+def make_ring(size, goal=0):
+    # lattice of size x 1 cells with one goal cell; moves along joint 1 only
+    goal_cells = np.zeros((size, 1), dtype=bool)
+    goal_cells[goal] = True
+    return goal_cells
+
+
+class DistanceMapTest(unittest.TestCase):
+    def test_ring(self):
+        # +-1 steps on a ring of 8 cells: distance around the shorter way
+        distances = shortest_paths.compute_distance_map(make_ring(8), [(-1, 0), (1, 0)])
+        self.assertEqual(distances[:, 0].tolist(), [0, 1, 2, 3, 4, 3, 2, 1])
+
+    def test_torus(self):
+        # four single-joint moves: Manhattan distance on the torus, both joints wrap around
+        goal_cells = np.zeros((6, 6), dtype=bool)
+        goal_cells[1, 4] = True
+        distances = shortest_paths.compute_distance_map(goal_cells, agents.make_actions([1], False))
+        for i in range(6):
+            for j in range(6):
+                di, dj = abs(i - 1), abs(j - 4)
+                self.assertEqual(distances[i, j], min(di, 6 - di) + min(dj, 6 - dj))
+
+    def test_action_repeat(self):
+        # a move held for 2 substeps stops at the first goal cell on the way, so cells 1 and 2 away are one decision
+        distances = shortest_paths.compute_distance_map(make_ring(8), [(-1, 0), (1, 0)], action_repeat=2)
+        self.assertEqual(distances[:, 0].tolist(), [0, 1, 1, 2, 2, 2, 1, 1])
+
+    def test_unreachable(self):
+        # steps of 2 in one direction never reach the goal from odd cells
+        distances = shortest_paths.compute_distance_map(make_ring(8), [(2, 0)])
+        self.assertEqual(distances[:, 0].tolist(), [0, UNREACHABLE, 3, UNREACHABLE, 2, UNREACHABLE, 1, UNREACHABLE])
+
+    def test_scenarios(self):
+        # the goal cells of each scenario are at distance 0, every other cell (e.g. the start) is not
+        actions = agents.make_actions([1], False)
+        for scene_id in range(len(goals.SCENARIOS)):
+            goal = goals.Goal_Arm(scene_id, shortest_paths.ARM_LENGTH_1, shortest_paths.ARM_LENGTH_2)
+            distances = shortest_paths.get_distance_map(goal.pos, actions=actions)
+            self.assertIs(shortest_paths.get_distance_map(goal.pos, actions=actions), distances)  # cached
+            goal_cells = shortest_paths.get_goal_cells(goal.pos)
+            self.assertTrue(goal_cells.any())
+            self.assertTrue(np.all(distances[goal_cells] == 0))
+            self.assertTrue(np.all(distances[~goal_cells] != 0))
+            optimal = shortest_paths.get_optimal_decisions(scene_id, actions=actions)
+            self.assertGreater(optimal, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+#!/usr/bin/python
+import numpy as np
+import unittest
+
+# import own modules
+import state_coverage
+
+
+def make_states(theta, position):
+    # (N, 6) states with normalized joint angles theta and end-effector positions
+    states = np.zeros((len(theta), 6), dtype=np.float32)
+    states[:, 0:2] = position
+    states[:, 2:4] = theta
+    return states
+
+
+class CoverageIndexTest(unittest.TestCase):
+    def test_flush_size(self):
+        # states are binned once FLUSH_SIZE of them are pending, the rest on snapshot
+        index = state_coverage.CoverageIndex(flush_size=10)
+        for _ in range(3):
+            index.add(make_states(np.zeros((4, 2)), (0.5, 0.5)))
+        self.assertEqual((index.num_of_states, index.num_of_pending), (12, 0))
+        index.add(make_states(np.zeros((1, 2)), (0.5, 0.5))[0])
+        self.assertEqual((index.num_of_states, index.num_of_pending), (12, 1))
+        self.assertEqual(index.snapshot()[1], 13)
+        self.assertEqual(index.num_of_pending, 0)
+        self.assertEqual(np.sum(index.joint_counts), 13)
+        self.assertEqual(np.sum(index.workspace_counts), 13)
+
+    def test_bins(self):
+        # theta -1 and just below 1 are the first and the last joint bin; positions at the edges are clipped
+        index = state_coverage.CoverageIndex(joint_bins=4, workspace_bins=4, flush_size=1)
+        index.add(make_states([[-1.0, 0.99]], [[-1.0, 1.0]]))
+        self.assertEqual(np.flatnonzero(index.joint_counts).tolist(), [0*4 + 3])
+        self.assertEqual(np.flatnonzero(index.workspace_counts).tolist(), [0*4 + 3])
+
+    def test_fraction_and_entropy(self):
+        self.assertEqual(state_coverage.get_fraction_and_entropy(np.zeros(4)), (0.0, 0.0))
+        fraction, entropy = state_coverage.get_fraction_and_entropy(np.array([5, 5, 5, 5]))
+        self.assertEqual(fraction, 1.0)
+        self.assertAlmostEqual(entropy, 1.0)
+        fraction, entropy = state_coverage.get_fraction_and_entropy(np.array([7, 0, 0, 0]))
+        self.assertEqual((fraction, entropy), (0.25, 0.0))
+        # unreachable cells are left out
+        fraction, entropy = state_coverage.get_fraction_and_entropy(np.array([1, 1, 0, 0]), np.array([True, True, False, False]))
+        self.assertEqual(fraction, 1.0)
+        self.assertAlmostEqual(entropy, 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+#!/usr/bin/python
+import json
+import numpy as np
+import os
+import random
+import time
+
+
+ARRAYS_NAME = 'arrays%d.npz'    # networks, optimizer state, numpy RNG keys; numbered, so the manifest switches to a complete new file
+FORMAT_VERSION = 1
+SNAPSHOT_DIR = 'training_state'
+STATE_NAME = 'state.json'       # manifest: version, action table, exploration schedules, counters, RNG states
+
+
+def read_manifest(directory):
+    filename = os.path.join(directory, STATE_NAME)
+    if not os.path.isfile(filename):
+        return None
+    with open(filename) as state_file:
+        state = json.load(state_file)
+    if state.get('version') != FORMAT_VERSION:
+        raise ValueError('%s has snapshot format version %s, expected %d' % (filename, state.get('version'), FORMAT_VERSION))
+    return state
+
+
+def save_snapshot(directory, networks, actors=(), scheduler=None, optimizer_state=None, optimizer=None, checkpoint_step=None):
+    # everything a resumed run needs to continue on the same learning curve: both networks, optimizer state
+    # (of the networks' backend, or optimizer_state of another optimizer, e.g. 'data_parallel'), exploration
+    # schedules of the actors, scheduler counters and both RNG streams. Caller holds the networks lock;
+    # checkpoint_step: that of the replay memory committed with this snapshot (see check_replay)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    old_state = read_manifest(directory)
+    serial = 0 if old_state is None else old_state['serial'] + 1
+
+    if optimizer_state is None:
+        optimizer_state, optimizer = networks.get_optimizer_state(), networks.BACKEND
+    arrays = {}
+    for prefix, weights in [('online', networks.online_net.get_weights()), ('target', networks.target_net.get_weights()), ('optimizer', optimizer_state)]:
+        for i in range(len(weights)):
+            arrays['%s%d' % (prefix, i)] = weights[i]
+    np_random = np.random.get_state()
+    arrays['np_random_keys'] = np_random[1]
+    python_random = random.getstate()
+
+    state = {'version': FORMAT_VERSION, 'serial': serial, 'time': time.time(), 'arrays': ARRAYS_NAME % serial, 'checkpoint_step': checkpoint_step,
+             'actions': networks.ACTIONS, 'num_of_weights': len(networks.online_net.get_weights()),
+             'optimizer': optimizer, 'num_of_optimizer_weights': len(optimizer_state),
+             'np_random': [np_random[0], np_random[2], np_random[3], np_random[4]],
+             'random': [python_random[0], list(python_random[1]), python_random[2]],
+             'actors': [actor.get_training_state() for actor in actors],
+             'scheduler': None if scheduler is None else scheduler.get_training_state()}
+
+    # arrays first, then the manifest; both renamed into place, so a crash leaves the previous snapshot intact
+    filename = os.path.join(directory, state['arrays'])
+    with open(filename + '.tmp', 'wb') as arrays_file:
+        np.savez(arrays_file, **arrays)
+    os.rename(filename + '.tmp', filename)
+    filename = os.path.join(directory, STATE_NAME)
+    with open(filename + '.tmp', 'w') as state_file:
+        json.dump(state, state_file)
+    os.rename(filename + '.tmp', filename)
+
+    if old_state is not None and os.path.isfile(os.path.join(directory, old_state['arrays'])):
+        os.remove(os.path.join(directory, old_state['arrays']))
+
+
+def load_snapshot(directory=SNAPSHOT_DIR):
+    # (state, arrays), or None if directory holds no snapshot
+    state = read_manifest(directory)
+    if state is None:
+        return None
+    with np.load(os.path.join(directory, state['arrays'])) as arrays_file:
+        arrays = dict((name, arrays_file[name]) for name in arrays_file.files)
+    return state, arrays
+
+
+def check_replay(snapshot, replay):
+    # a replay memory resumed from disk (replay_memory.MappedReplayMemory) must have been committed with the snapshot
+    checkpoint_step = snapshot[0].get('checkpoint_step')
+    replay_step = getattr(replay, 'checkpoint_step', None)
+    if replay.get_buffer_size() > 0 and None not in (checkpoint_step, replay_step) and replay_step != checkpoint_step:
+        raise ValueError('replay memory was committed at checkpoint step %d, the training state snapshot at %d; '
+                         'resume both from the same run or remove one of them' % (replay_step, checkpoint_step))
+
+
+def get_optimizer_state(snapshot):
+    state, arrays = snapshot
+    return [arrays['optimizer%d' % i] for i in range(state['num_of_optimizer_weights'])]
+
+
+def restore_snapshot(snapshot, networks, actors=(), scheduler=None):
+    # counterpart of save_snapshot; actors beyond the saved ones keep their fresh state, the optimizer
+    # state of another optimizer (see save_snapshot) is left to its owner (get_optimizer_state)
+    state, arrays = snapshot
+    if state['actions'] is not None and networks.ACTIONS is not None and [tuple(action) for action in state['actions']] != networks.ACTIONS:
+        raise ValueError('snapshot was saved with %d actions %s, networks have %s' % (len(state['actions']), state['actions'], networks.ACTIONS))
+
+    networks.online_net.set_weights([arrays['online%d' % i] for i in range(state['num_of_weights'])])
+    networks.target_net.set_weights([arrays['target%d' % i] for i in range(state['num_of_weights'])])
+    if state['optimizer'] == networks.BACKEND:
+        networks.set_optimizer_state(get_optimizer_state(snapshot))
+
+    np.random.set_state((str(state['np_random'][0]), arrays['np_random_keys'], state['np_random'][1], state['np_random'][2], state['np_random'][3]))
+    random.setstate((state['random'][0], tuple(state['random'][1]), state['random'][2]))
+
+    for actor, actor_state in zip(actors, state['actors']):
+        actor.set_training_state(actor_state)
+    if scheduler is not None and state['scheduler'] is not None:
+        scheduler.set_training_state(state['scheduler'])
@@ -0,0 +1,66 @@
+#!/usr/bin/python
+import numpy as np
+
+
+LINEWIDTH = 5
+MARKERSIZE = 10
+GOAL_LINEWIDTH = 3
+GOAL_MARKERSIZE = 15
+VEL_FACTOR = 100
+
+
+class ArmRenderer:
+    # draws arm, goal and path into one axis; the artists are created once and only updated with set_data,
+    # the axis is redrawn by blitting onto a cached background (same look as Arm.plot and Goal_Arm.plot)
+    def __init__(self, ax, width, height):
+        self.ax = ax
+        self.canvas = ax.figure.canvas
+        self.ax.set_xlim([-width/2, width/2])
+        self.ax.set_ylim([-height/2, height/2])
+
+        self.path, = ax.plot([], [], 'c-', animated=True)
+        self.goal, = ax.plot([], [], 'bo', markersize=GOAL_MARKERSIZE, markeredgewidth=GOAL_LINEWIDTH, animated=True)
+        self.links, = ax.plot([], [], 'k', linewidth=LINEWIDTH, animated=True)
+        self.joints, = ax.plot([], [], 'ro', markersize=MARKERSIZE, markeredgewidth=LINEWIDTH, linestyle='None', animated=True)
+        self.velocities = [ax.plot([], [], 'b', linewidth=LINEWIDTH/2.0, animated=True)[0] for _ in range(2)]
+        self.artists = [self.path, self.goal, self.links, self.joints] + self.velocities
+
+        # background without the (animated) artists; refreshed whenever the figure is fully redrawn
+        self.background = None
+        self.canvas.mpl_connect('draw_event', self.on_draw)
+
+    def on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+
+    def set_arm(self, arm):
+        base = arm.base_pos
+        middle = [base[0] + arm.ARM_LENGTH_1*np.cos(arm.theta[0]),
+                  base[1] + arm.ARM_LENGTH_1*np.sin(arm.theta[0])]
+        xs = [base[0], middle[0], arm.pos[0]]
+        ys = [base[1], middle[1], arm.pos[1]]
+        self.links.set_data(xs, ys)
+        self.joints.set_data(xs, ys)
+
+        # velocity indicators
+        for velocity, origin, vel in zip(self.velocities, [base, middle], arm.vel):
+            velocity.set_data([origin[0], origin[0] - VEL_FACTOR*vel*np.sin(vel)],
+                              [origin[1], origin[1] + VEL_FACTOR*vel*np.cos(vel)])
+
+    def update(self, arm, goal, path=None):
+        # only sets the artists' data, e.g. for offline rendering with savefig
+        self.set_arm(arm)
+        self.goal.set_data([goal.pos[0]], [goal.pos[1]])
+        if path is not None and len(path) > 0:
+            points = np.asarray(path)
+            self.path.set_data(points[:,0], points[:,1])
+        else:
+            self.path.set_data([], [])
+
+    def draw(self, arm, goal, path=None):
+        self.update(arm, goal, path)
+        if self.background is None:
+            self.canvas.draw() # first frame: full draw, fires on_draw
+        self.canvas.restore_region(self.background)
+        for artist in self.artists:
+            self.ax.draw_artist(artist)
+        self.canvas.blit(self.ax.bbox)
@@ -12,14 +12,19 @@ from collections import deque
 
 # import own modules
 import agents
+import control_loop
 import goals
 import q_networks
+import rendering
+import trajectories
 
 
 ARM_LENGTH_1 = 3.0
 ARM_LENGTH_2 = 5.0
 ANGULAR_ARM_VELOCITY = 1.0*np.pi/180.0
 
+CONTROL_RATE = 100.0    # Hz; None: as fast as possible
+
 GOAL_THRESHOLD = 0.05
 HEIGHT = 20
 MAX_STEPS = 500
@@ -28,6 +33,8 @@ NUM_OF_ACTORS = 4
 NUM_OF_PLOTS_X = 2
 NUM_OF_PLOTS_Y = 2
 NUM_OF_STATES = 6
+RECORD_TRAJECTORIES = True    # per-step episode logs, see trajectories.py
+TRAJECTORY_DIR = 'trajectories'
 WIDTH = 20
 
 
@@ -40,6 +47,10 @@ class Actor(threading.Thread):
         self.MAX_STEPS = max_steps 				# maximal steps per episode
         self.THREAD_ID = threadID 				# thread id (integer)
         self.path = deque([], maxlen=500)
+        self.q = None
+        self.recorder = None
+        if RECORD_TRAJECTORIES:
+            self.recorder = trajectories.TrajectoryRecorder(os.path.join(TRAJECTORY_DIR, 'actor%d.bin' % threadID), NUM_OF_ACTIONS, ARM_LENGTH_1, ARM_LENGTH_2)
 
     def get_state(self):
     	# state is composed by agent + goal states
@@ -55,17 +66,33 @@ class Actor(threading.Thread):
             return False
 
     def plot(self):
-        # stepwise refreshing of plot
-        ax[0,self.THREAD_ID].clear()
-        
-        # plotting of AGENT, GOAL and set AXIS LIMITS
-        self.goal.plot(ax[0,self.THREAD_ID])
-        self.agent.plot(ax[0,self.THREAD_ID])
-        ax[0,self.THREAD_ID].set_xlim([-WIDTH/2, WIDTH/2])#[0,WIDTH])
-        ax[0,self.THREAD_ID].set_ylim([-HEIGHT/2, HEIGHT/2])#[0,HEIGHT])
-
-        for point in self.path:
-            ax[0,self.THREAD_ID].plot(point[0],point[1],'co')
+        # stepwise refreshing of plot; AGENT, GOAL and the path (one polyline) are updated in place and blitted
+        renderers[self.THREAD_ID].draw(self.agent, self.goal, self.path)
+
+    def observe(self):
+        self.path.append(self.agent.get_end_effector_position())
+        return self.get_state()
+
+    def infer(self, state):
+        # get lock to synchronize threads
+        networks_lock.acquire()
+        self.q = networks.online_net.predict(state.reshape(1,NUM_OF_STATES), batch_size=1)
+        networks_lock.release()
+        return np.argmax(self.q) # choose best action from Q(s,a)
+
+    def act(self, action):
+        # take action; True if agent at goal
+        if self.recorder is not None:
+            self.recorder.record(self.agent, self.goal, action, self.q)
+        self.agent.set_action(action)
+        self.agent.update()
+        return self.episode_finished()
+
+    def monitor(self):
+        # plot the scene
+        plotting_lock.acquire()
+        self.plot()
+        plotting_lock.release()
 
     def run(self):
         while True: 
@@ -75,32 +102,16 @@ class Actor(threading.Thread):
             self.goal = goals.Goal_Arm(ARM_LENGTH_1, ARM_LENGTH_2)
             plotting_lock.release()
 
-            for step in range(self.MAX_STEPS):
-                # produce experience
-                state = self.get_state()
-                self.path.append(self.agent.get_end_effector_position())
-
-                # get lock to synchronize threads
-                networks_lock.acquire()
-                q = networks.online_net.predict(state.reshape(1,NUM_OF_STATES), batch_size=1)
-                networks_lock.release()
-                action = np.argmax(q) # choose best action from Q(s,a)
-
-                # take action, observe next state s'
-                self.agent.set_action(action)
-                self.agent.update()
-                next_state = self.get_state()
-
-                # check if agent at goal
-                terminal = self.episode_finished()
-                    
-                # plot the scene
-                plotting_lock.acquire()
-                self.plot()
-                plotting_lock.release()
-
-                if terminal:
-                    break # start new episode
+            # observe -> infer -> act at CONTROL_RATE, plotting only in spare time
+            executor = control_loop.FixedRateExecutor(self.observe, self.infer, self.act, rate=CONTROL_RATE, monitor=self.monitor)
+            executor.run(self.MAX_STEPS)
+            if self.recorder is not None:
+                self.recorder.end_episode()
+
+            console_lock.acquire()
+            print 'Actor %d, episode finished:' % self.THREAD_ID
+            print executor.get_report()
+            console_lock.release()
 
             # episodic refreshing of plot
             #plotting_lock.acquire()
@@ -114,6 +125,9 @@ if __name__ == "__main__":
     networks_lock = threading.Lock()
     plotting_lock = threading.Lock()
 
+    if RECORD_TRAJECTORIES and not os.path.isdir(TRAJECTORY_DIR):
+        os.makedirs(TRAJECTORY_DIR)
+
     # create GLOBAL Q-NETWORKS
     networks = q_networks.QNetworks(NUM_OF_ACTIONS, NUM_OF_STATES)
 
@@ -121,6 +135,7 @@ if __name__ == "__main__":
     fig, ax = plt.subplots(NUM_OF_PLOTS_Y,NUM_OF_PLOTS_X)
     ax = ax.reshape(1, ax.shape[0]*ax.shape[1])
     plt.ion()
+    renderers = [rendering.ArmRenderer(ax[0,i], WIDTH, HEIGHT) for i in range(NUM_OF_ACTORS)]
 
     # create threads
     threads = []
@@ -0,0 +1,157 @@
+#!/usr/bin/python
+import argparse
+import json
+import numpy as np
+import os
+
+# import own modules
+import rendering
+
+
+BUFFER_SIZE = 4096              # records buffered in RAM before they are appended to the log
+FORMAT_VERSION = 1
+FRAME_DPI = 80
+
+
+def make_record_dtype(num_of_actions):
+    # one fixed-size record per step, so logs can be memory-mapped and sliced without parsing
+    return np.dtype([('episode', '<u4'), ('step', '<u4'),
+                     ('theta', '<f4', (2,)), ('pos', '<f4', (2,)), ('goal', '<f4', (2,)),
+                     ('action', '<u1'), ('q', '<f4', (num_of_actions,))])
+
+
+class TrajectoryRecorder:
+    # appends per-step joint angles, end-effector position, goal, action and Q-values to a binary episode log;
+    # metadata (record layout, arm geometry) lives in <path>.json
+    def __init__(self, path, num_of_actions, arm_length_1, arm_length_2, buffer_size=BUFFER_SIZE):
+        self.PATH = path
+        self.dtype = make_record_dtype(num_of_actions)
+        self.buffer = np.zeros(buffer_size, dtype=self.dtype)
+        self.num_of_buffered = 0
+        self.step = 0
+
+        # continue the episode numbering of an existing log
+        self.episode = 0
+        if os.path.isfile(path) and os.path.getsize(path) >= self.dtype.itemsize:
+            records = np.memmap(path, dtype=self.dtype, mode='r')
+            self.episode = int(records[-1]['episode']) + 1
+            del records
+
+        with open(path + '.json', 'w') as meta_file:
+            json.dump({'version': FORMAT_VERSION, 'num_of_actions': num_of_actions,
+                       'arm_length_1': arm_length_1, 'arm_length_2': arm_length_2}, meta_file, indent=2)
+
+    def record(self, arm, goal, action, q):
+        # state before the action is applied
+        record = self.buffer[self.num_of_buffered]
+        record['episode'] = self.episode
+        record['step'] = self.step
+        record['theta'] = arm.theta
+        record['pos'] = arm.pos
+        record['goal'] = goal.pos
+        record['action'] = action
+        record['q'] = np.ravel(q)
+        self.num_of_buffered += 1
+        self.step += 1
+        if self.num_of_buffered == len(self.buffer):
+            self.flush()
+
+    def end_episode(self):
+        self.flush()
+        self.episode += 1
+        self.step = 0
+
+    def flush(self):
+        if self.num_of_buffered > 0:
+            with open(self.PATH, 'ab') as log_file:
+                self.buffer[:self.num_of_buffered].tofile(log_file)
+            self.num_of_buffered = 0
+
+
+def load_trajectories(path):
+    # (records, metadata); records are memory-mapped
+    with open(path + '.json') as meta_file:
+        meta = json.load(meta_file)
+    return np.memmap(path, dtype=make_record_dtype(meta['num_of_actions']), mode='r'), meta
+
+
+def split_episodes(records):
+    # episode id -> slice of records
+    starts = np.flatnonzero(np.diff(records['episode'].astype(np.int64)) != 0) + 1
+    bounds = np.concatenate(([0], starts, [len(records)]))
+    return dict((int(records['episode'][bounds[i]]), slice(bounds[i], bounds[i + 1])) for i in range(len(bounds) - 1))
+
+
+class RecordedArm:
+    # what ArmRenderer needs of agents.Arm
+    def __init__(self, arm_length_1):
+        self.ARM_LENGTH_1 = arm_length_1
+        self.base_pos = np.zeros(2)
+        self.theta = np.zeros(2)
+        self.pos = np.zeros(2)
+        self.vel = np.zeros(2)
+
+
+class RecordedGoal:
+    def __init__(self, pos):
+        self.pos = pos
+
+
+def export_episode(records, meta, output, stride=1, video=False, fps=25):
+    # renders one episode headless to <output>_NNNNN.png or <output>.mp4
+    import matplotlib.pyplot as plt
+    from matplotlib import animation
+
+    extent = 2.2*(meta['arm_length_1'] + meta['arm_length_2'])
+    fig, ax = plt.subplots(1, 1, figsize=(6, 6))
+    renderer = rendering.ArmRenderer(ax, extent, extent)
+    for artist in renderer.artists:
+        artist.set_animated(False)  # drawn by savefig, no blitting needed
+
+    writer = None
+    if video:
+        writer = animation.FFMpegWriter(fps=fps)
+        writer.setup(fig, output + '.mp4', dpi=FRAME_DPI)
+
+    arm = RecordedArm(meta['arm_length_1'])
+    for i in range(0, len(records), stride):
+        record = records[i]
+        arm.vel = (record['theta'] - records[max(i - 1, 0)]['theta'] + np.pi) % (2*np.pi) - np.pi
+        arm.theta = record['theta']
+        arm.pos = record['pos']
+        renderer.update(arm, RecordedGoal(record['goal']), records['pos'][:i + 1])
+        ax.set_title('episode %d | step %d | action %d | max Q %.3f' % (record['episode'], record['step'], record['action'], np.max(record['q'])))
+        if writer is None:
+            fig.savefig('%s_%05d.png' % (output, record['step']), dpi=FRAME_DPI)
+        else:
+            writer.grab_frame()
+
+    if writer is not None:
+        writer.finish()
+    plt.close(fig)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='List recorded episodes or render them headless to images or video.')
+    parser.add_argument('log', help='binary episode log of TrajectoryRecorder')
+    parser.add_argument('--episodes', type=int, nargs='*', help='episodes to render (default: list episodes only)')
+    parser.add_argument('--output', default='export')
+    parser.add_argument('--stride', type=int, default=1, help='render every n-th step')
+    parser.add_argument('--video', action='store_true', help='one mp4 per episode (needs ffmpeg) instead of png frames')
+    args = parser.parse_args()
+
+    records, meta = load_trajectories(args.log)
+    episodes = split_episodes(records)
+    if not args.episodes:
+        for episode in sorted(episodes.keys()):
+            last = records[episodes[episode]][-1]
+            distance = np.linalg.norm(last['pos'] - last['goal'])
+            print('episode %5d: %4d steps | final distance to goal %.3f' % (episode, last['step'] + 1, distance))
+    else:
+        import matplotlib
+        matplotlib.use('Agg')
+        if not os.path.isdir(args.output):
+            os.makedirs(args.output)
+        for episode in args.episodes:
+            export_episode(records[episodes[episode]], meta, os.path.join(args.output, 'episode%05d' % episode), stride=args.stride, video=args.video)
+            print('Exported episode %d.' % episode)
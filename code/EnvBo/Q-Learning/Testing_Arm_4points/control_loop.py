@@ -0,0 +1,146 @@
+#!/usr/bin/python
+import ctypes
+import ctypes.util
+import numpy as np
+import os
+import sys
+import time
+import warnings
+
+
+CONTROL_RATE = 100.0            # Hz
+JITTER_BINS = 20                # histogram bins over one period
+OVERRUN_POLICY = 'skip'         # 'skip': drop missed cycles, 'reuse': catch up with the previous action
+SPIN_TIME = 0.0005              # last part of the wait is spent spinning, sleep() is too coarse
+
+CLOCK_MONOTONIC = 6 if sys.platform == 'darwin' else 1  # clock id of clock_gettime
+
+
+class timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+
+def get_monotonic_clock():
+    # time.monotonic (python 3), the monotonic backport, or clock_gettime(CLOCK_MONOTONIC) via ctypes;
+    # wall clock time only as a last resort, NTP adjustments and clock steps then shift the deadlines
+    if hasattr(time, 'monotonic'):
+        return time.monotonic
+    try:
+        import monotonic as backport
+        return backport.monotonic
+    except ImportError:
+        pass
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('rt') or ctypes.util.find_library('c'), use_errno=True)
+        clock_gettime = libc.clock_gettime
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+
+        def monotonic():
+            now = timespec()
+            if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(now)) != 0:
+                errno = ctypes.get_errno()
+                raise OSError(errno, os.strerror(errno))
+            return now.tv_sec + 1e-9*now.tv_nsec
+
+        monotonic()
+        return monotonic
+    except (AttributeError, OSError, TypeError):
+        warnings.warn('no monotonic clock available, control deadlines follow the wall clock')
+        return time.time
+
+
+monotonic = get_monotonic_clock()
+
+
+class FixedRateExecutor:
+    # runs observe -> infer -> act at a fixed rate and records per-stage latencies, deadline misses and jitter;
+    # act(action) returns True to stop (e.g. goal reached), monitor() (plotting, logging) runs after act if there is time
+    def __init__(self, observe, infer, act, rate=CONTROL_RATE, monitor=None, overrun_policy=OVERRUN_POLICY):
+        self.observe = observe
+        self.infer = infer
+        self.act = act
+        self.monitor = monitor
+        self.PERIOD = 0.0 if rate is None else 1.0/rate  # None: as fast as possible
+        self.OVERRUN_POLICY = overrun_policy
+
+        self.latencies = {'observe': [], 'infer': [], 'act': [], 'monitor': [], 'cycle': []}
+        self.lateness = []                               # start time - scheduled start time
+        self.num_of_misses = 0
+        self.num_of_reused = 0
+        self.num_of_skipped = 0
+
+    def wait_until(self, deadline):
+        remaining = deadline - monotonic()
+        if remaining > SPIN_TIME:
+            time.sleep(remaining - SPIN_TIME)
+        while monotonic() < deadline:
+            pass
+
+    def run(self, num_of_steps):
+        # returns the number of cycles run
+        action = None
+        reuse = False
+        release = monotonic()
+        num_of_cycles = 0
+        for step in range(num_of_steps):
+            self.wait_until(release)
+            start = monotonic()
+            self.lateness.append(start - release)
+
+            state = self.observe()
+            t_observed = monotonic()
+            if reuse and action is not None:
+                self.num_of_reused += 1  # behind schedule: no inference this cycle
+            else:
+                action = self.infer(state)
+            t_inferred = monotonic()
+            done = self.act(action)
+            t_acted = monotonic()
+            num_of_cycles = step + 1
+
+            self.latencies['observe'].append(t_observed - start)
+            self.latencies['infer'].append(t_inferred - t_observed)
+            self.latencies['act'].append(t_acted - t_inferred)
+
+            # after the final step always, there is no next deadline to keep
+            final = done or step == num_of_steps - 1
+            deadline = release + self.PERIOD
+            if self.monitor is not None and (final or self.PERIOD == 0 or monotonic() < deadline):
+                self.monitor()
+                self.latencies['monitor'].append(monotonic() - t_acted)
+            end = monotonic()
+            self.latencies['cycle'].append(end - start)
+            if done:
+                break
+
+            release = deadline
+            reuse = False
+            if self.PERIOD > 0 and end > deadline:
+                self.num_of_misses += 1
+                if self.OVERRUN_POLICY == 'skip':
+                    # resynchronize to the next period boundary instead of bursting
+                    missed = int((end - deadline) / self.PERIOD) + 1
+                    self.num_of_skipped += missed
+                    release = deadline + missed*self.PERIOD
+                else:
+                    reuse = True
+        return num_of_cycles
+
+    def get_jitter_histogram(self):
+        # counts of start lateness, bins over one period (last bin: later than one period)
+        period = self.PERIOD if self.PERIOD > 0 else max(max(self.lateness), 1e-6)
+        edges = np.append(np.linspace(0.0, period, JITTER_BINS), np.inf)
+        counts, _ = np.histogram(self.lateness, bins=edges)
+        return counts, edges
+
+    def get_report(self):
+        lines = ['%d cycles | deadline misses: %d | skipped: %d | reused actions: %d' % (
+            len(self.latencies['cycle']), self.num_of_misses, self.num_of_skipped, self.num_of_reused)]
+        for stage in ['observe', 'infer', 'act', 'monitor', 'cycle']:
+            if len(self.latencies[stage]) > 0:
+                values = 1e3*np.array(self.latencies[stage])
+                lines.append('%8s: mean %.3fms | p99 %.3fms | max %.3fms' % (stage, np.mean(values), np.percentile(values, 99), np.max(values)))
+        if len(self.lateness) > 0:
+            counts, edges = self.get_jitter_histogram()
+            lines.append('  jitter: ' + ' '.join('%d' % count for count in counts) + ' (bins of %.3fms)' % (1e3*edges[1]))
+        return '\n'.join(lines)
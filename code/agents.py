@@ -1,12 +1,27 @@
 __auther__ = "zhiwei"
+import collections
 import numpy as np
 import operator
 import matplotlib.pyplot as plt
+import socket
+import threading
+import time
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import arm_protocol
 
 ARM_LENGTH_1 = 3.0
 ARM_LENGTH_2 = 3.0
 ARM_LENGTH_3 = 3.0
 
+LATENCY_HISTORY = 10000
+ROBOT_HOST = 'localhost'
+ROBOT_PORT = 6000
+ROBOT_TIMEOUT = 0.5
+
 PI = np.pi
 
 
@@ -106,12 +121,127 @@ class VirtualArm(object):
         plt.pause(0.01)
 
 
+class RobotArmTimeout(IOError):
+    """Raised if the arm controller does not answer in time"""
+    pass
+
+
 class RobotArm(object):
-    """docstring for RobotArm"""
+    """Client of the real arm controller, speaking the arm_protocol byte protocol over a socket.
+
+        Commands are queued and written by a sender thread, so perform_action()
+        never blocks on I/O; replies are read back by a receiver thread, so
+        several commands can be in flight (pipelining). read() waits for the
+        reply to the latest command for at most `timeout` seconds and raises
+        RobotArmTimeout otherwise. Round trip times are kept for benchmarking.
+    """
 
-    def __init__(self, arg):
+    def __init__(self,
+                 dim=1,
+                 host=ROBOT_HOST,
+                 port=ROBOT_PORT,
+                 timeout=ROBOT_TIMEOUT,
+                 start_angular=np.zeros(1)
+                 ):
         super(RobotArm, self).__init__()
-        self.arg = arg
+
+        self._dim = dim
+        self._timeout = timeout
+
+        self._sock = socket.create_connection((host, port), timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sock.settimeout(None)
+
+        self._send_queue = queue.Queue()
+        self._state_changed = threading.Condition()
+        self._seq = 0
+        self._acked_seq = 0
+        self._arm_angulars_in_degree = tuple(np.zeros(self._dim))
+        self._send_times = {}
+        self.latencies = collections.deque(maxlen=LATENCY_HISTORY)
+        self._closed = False
+
+        for target in (self._send_loop, self._receive_loop):
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+
+        self.init(start_angular)
+
+    def _send(self, frame_type, values):
+        self._state_changed.acquire()
+        self._seq += 1
+        seq = self._seq
+        self._send_times[seq] = time.time()
+        self._state_changed.release()
+
+        self._send_queue.put(arm_protocol.pack_frame(frame_type, seq, values))
+        return seq
+
+    def _send_loop(self):
+        while not self._closed:
+            frame = self._send_queue.get()
+            if frame is None:
+                break
+            self._sock.sendall(frame)
+
+    def _receive_loop(self):
+        reader = arm_protocol.FrameReader()
+        while not self._closed:
+            try:
+                data = self._sock.recv(4096)
+            except socket.error:
+                break
+            if not data:
+                break
+
+            for frame_type, seq, values in reader.feed(data):
+                if frame_type != arm_protocol.STATE:
+                    continue
+                self._state_changed.acquire()
+                sent = self._send_times.pop(seq, None)
+                if sent is not None:
+                    self.latencies.append(time.time() - sent)
+                if seq > self._acked_seq:
+                    self._acked_seq = seq
+                    self._arm_angulars_in_degree = tuple(values)
+                self._state_changed.notify_all()
+                self._state_changed.release()
+
+    def _wait_for(self, seq):
+        deadline = time.time() + self._timeout
+        self._state_changed.acquire()
+        try:
+            while self._acked_seq < seq:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise RobotArmTimeout("No reply to command %d within %.3fs" % (seq, self._timeout))
+                self._state_changed.wait(remaining)
+            return self._arm_angulars_in_degree
+        finally:
+            self._state_changed.release()
+
+    def init(self, start_angular=None, ziel=None):
+        if start_angular is None:
+            start_angular = np.zeros(self._dim)
+        self._wait_for(self._send(arm_protocol.INIT, tuple(start_angular)))
+
+    def perform_action(self, arm_input):
+        """Send relative joint inputs without waiting; returns the command sequence number"""
+        return self._send(arm_protocol.MOVE, tuple(arm_input))
+
+    def read(self):
+        """Joint angles after the latest command"""
+        return self._wait_for(self._seq)
+
+    def request_read(self):
+        """Ask for a fresh readout without waiting, e.g. before an expensive computation"""
+        return self._send(arm_protocol.READ, tuple(np.zeros(self._dim)))
+
+    def close(self):
+        self._closed = True
+        self._send_queue.put(None)
+        self._sock.close()
 
 
 def main():
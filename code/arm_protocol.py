@@ -0,0 +1,52 @@
+""" Byte protocol between RobotArm and the arm controller (or arm_simulator).
+
+    Every frame is a header (type, sequence number, number of joints)
+    followed by one float32 per joint, all big endian:
+        INIT   absolute joint angles in degree
+        MOVE   relative joint inputs in degree (same meaning as VirtualArm.perform_action)
+        READ   no payload meaning, angles are ignored
+        STATE  reply to any of the above, joint angles in degree after the command
+    The controller replies to every command in order, echoing its sequence number.
+"""
+import struct
+
+INIT = 1
+MOVE = 2
+READ = 3
+STATE = 0x81
+
+HEADER = struct.Struct('!BIB')
+MAX_DIM = 8
+
+
+def pack_frame(frame_type, seq, values):
+    return HEADER.pack(frame_type, seq & 0xffffffff, len(values)) + \
+        struct.pack('!%df' % len(values), *values)
+
+
+def frame_size(dim):
+    return HEADER.size + 4 * dim
+
+
+class FrameReader(object):
+    """Incremental parser for a byte stream of frames"""
+
+    def __init__(self):
+        super(FrameReader, self).__init__()
+        self._buffer = b''
+
+    def feed(self, data):
+        """Add received bytes, return the list of complete (type, seq, values) frames"""
+        self._buffer += data
+        frames = []
+        while len(self._buffer) >= HEADER.size:
+            frame_type, seq, dim = HEADER.unpack(self._buffer[:HEADER.size])
+            if dim > MAX_DIM:
+                raise ValueError("Corrupted frame, dim %d" % dim)
+            size = frame_size(dim)
+            if len(self._buffer) < size:
+                break
+            values = struct.unpack('!%df' % dim, self._buffer[HEADER.size:size])
+            frames.append((frame_type, seq, values))
+            self._buffer = self._buffer[size:]
+        return frames
@@ -0,0 +1,154 @@
+import argparse
+import numpy as np
+import socket
+import threading
+import time
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import arm_protocol
+from agents import VirtualArm, RobotArm, ARM_LENGTH_1, ROBOT_HOST, ROBOT_PORT
+
+SIM_JITTER = 0.002          # standard deviation of the reply delay in s
+SIM_LATENCY = 0.005         # mean reply delay in s
+
+
+class HeadlessVirtualArm(VirtualArm):
+    """VirtualArm kinematics without the matplotlib window"""
+
+    def _visualize(self):
+        pass
+
+
+class ArmSimulatorServer(threading.Thread):
+    """Local stand-in for the arm controller, serving the arm_protocol on a socket.
+
+        Commands are applied to a HeadlessVirtualArm; every reply is delayed by
+        latency plus gaussian jitter, but replies keep their order like on a
+        serial line. One simulated arm per connection.
+    """
+
+    def __init__(self,
+                 dim=1,
+                 arm_lens=np.array([ARM_LENGTH_1]),
+                 host=ROBOT_HOST,
+                 port=ROBOT_PORT,
+                 latency=SIM_LATENCY,
+                 jitter=SIM_JITTER
+                 ):
+        super(ArmSimulatorServer, self).__init__()
+        self.daemon = True
+
+        self._dim = dim
+        self._arm_lens = arm_lens
+        self._latency = latency
+        self._jitter = jitter
+
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((host, port))
+        self._server.listen(1)
+        self.port = self._server.getsockname()[1]
+
+    def _delay(self):
+        return max(0.0, np.random.normal(self._latency, self._jitter)) if self._jitter > 0 else self._latency
+
+    def run(self):
+        while True:
+            conn, _ = self._server.accept()
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            thread = threading.Thread(target=self._serve, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def _serve(self, conn):
+        arm = HeadlessVirtualArm(dim=self._dim, arm_lens=self._arm_lens, start_angular=np.zeros(self._dim))
+        replies = queue.Queue()
+
+        def send_loop():
+            while True:
+                due, frame = replies.get()
+                if frame is None:
+                    break
+                wait = due - time.time()
+                if wait > 0:
+                    time.sleep(wait)
+                try:
+                    conn.sendall(frame)
+                except socket.error:
+                    break
+
+        sender = threading.Thread(target=send_loop)
+        sender.daemon = True
+        sender.start()
+
+        reader = arm_protocol.FrameReader()
+        last_due = 0.0
+        while True:
+            try:
+                data = conn.recv(4096)
+            except socket.error:
+                break
+            if not data:
+                break
+
+            for frame_type, seq, values in reader.feed(data):
+                if frame_type == arm_protocol.INIT:
+                    arm.init(values)
+                elif frame_type == arm_protocol.MOVE:
+                    arm.perform_action(values)
+
+                due = max(time.time() + self._delay(), last_due)
+                last_due = due
+                replies.put((due, arm_protocol.pack_frame(arm_protocol.STATE, seq, arm.read())))
+
+        replies.put((0.0, None))
+        conn.close()
+
+
+def percentile(values, q):
+    return 1e3 * np.percentile(values, q)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark RobotArm against the local arm simulator.')
+    parser.add_argument('--dim', type=int, default=1)
+    parser.add_argument('--steps', type=int, default=1000)
+    parser.add_argument('--latency', type=float, default=SIM_LATENCY)
+    parser.add_argument('--jitter', type=float, default=SIM_JITTER)
+    args = parser.parse_args()
+
+    server = ArmSimulatorServer(dim=args.dim,
+                                arm_lens=np.array([ARM_LENGTH_1] * args.dim),
+                                port=0,
+                                latency=args.latency,
+                                jitter=args.jitter)
+    server.start()
+    arm = RobotArm(dim=args.dim, port=server.port, timeout=1.0 + 10 * args.latency, start_angular=np.zeros(args.dim))
+    arm_input = (1.0,) * args.dim
+
+    # synchronous control loop: act, then wait for the new state
+    loop_times = []
+    for _ in xrange(args.steps):
+        start = time.time()
+        arm.perform_action(arm_input)
+        arm.read()
+        loop_times.append(time.time() - start)
+    print("act+read loop:  mean %.2fms | p50 %.2fms | p99 %.2fms | max %.2fms" % (
+        1e3 * np.mean(loop_times), percentile(loop_times, 50), percentile(loop_times, 99), percentile(loop_times, 100)))
+
+    # pipelined: all commands in flight, one read at the end
+    start = time.time()
+    for _ in xrange(args.steps):
+        arm.perform_action(arm_input)
+    final = arm.read()
+    elapsed = time.time() - start
+    print("pipelined:      %.0f commands/s, final angles %s" % (args.steps / elapsed, final))
+    print("round trip:     p50 %.2fms | p99 %.2fms" % (percentile(arm.latencies, 50), percentile(arm.latencies, 99)))
+    arm.close()
+
+
+if __name__ == '__main__':
+    main()
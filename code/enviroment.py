@@ -1,5 +1,5 @@
 __auther__ = "zhiwei"
-from agent import VirtualArm, RobotArm
+from agents import VirtualArm, RobotArm
 
 
 class RobotArmEnv(object):
@@ -43,7 +43,7 @@ class RobotArmEnv(object):
         if if_emulator:
             self._arm = VirtualArm(dim)
         else:
-            self._arm = RobotArm()
+            self._arm = RobotArm(dim)
 
     def init(self):
         # Init the local variables